@@ -0,0 +1,46 @@
+"""
+Microbenchmark of Genius title matching, the old per word implementation against TitleMatcher.
+
+Run from the repo root with `python -m benchmarks.bench_matching`.
+"""
+import json
+import os
+import re
+import timeit
+
+from swaglyrics_backend.matching import TitleMatcher
+
+alg = re.compile(r'[^\sa-zA-Z0-9]+')
+
+with open(os.path.join(os.path.dirname(__file__), '..', 'tests', 'sample_genius_data.json')) as f:
+    hits = json.load(f)['response']['hits'] * 5  # 50 hits
+full_titles = [hit['result']['full_title'] for hit in hits]
+title = 'Lore Of The Unicorn - Chapter 6 by Odell Shepard'
+
+
+def old_match():
+    # genius_stripper before TitleMatcher, minus logging
+    words = re.sub(alg, '', title).split()
+    max_err = len(words) // 2
+    matches = []
+    for full_title in full_titles:
+        full_title = re.sub(alg, '', full_title)
+        mismatch = [word for word in words if word.lower() not in full_title.lower().split()]
+        if len(mismatch) <= max_err:
+            matches.append(full_title)
+    return matches
+
+
+def new_match():
+    return TitleMatcher(title).rank(full_titles)
+
+
+def main():
+    number = 2000
+    for name, func in [('old', old_match), ('TitleMatcher', new_match)]:
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f'{name:>12}: {best / number * 1e6:8.1f} us per search of {len(full_titles)} hits')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Microbenchmarks of the hot spots of single requests: Genius title matching, del_line, rate limit
+checks and webhook signature checks.
+
+Run from the repo root with `python -m benchmarks.bench_micro`.
+"""
+import hashlib
+import hmac
+import os
+import timeit
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+
+from benchmarks.fakes import FakeUpstreams, load_app
+
+
+def bench(name, func, number):
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    print(f'{name:<40} {best / number * 1e6:10.1f} us')
+
+
+def main():
+    issue_maker = load_app(FakeUpstreams(latency=0, jitter=0), strippers=0)
+    from swaglyrics_backend.utils import is_valid_signature
+
+    # the fake search answers with the title itself on top of 10 sample hits
+    bench('genius_stripper, 11 hits', lambda: issue_maker.genius_stripper('Miracle', 'Caravan Palace'), 500)
+
+    for lines in [1000, 10000]:
+        for i in range(lines):
+            issue_maker.unsupported.add(f'song {i}', f'artist {i}')
+
+        def del_line():
+            # remove and put back a line from the middle
+            issue_maker.del_line(f'song {lines // 2}', f'artist {lines // 2}')
+            issue_maker.unsupported.add(f'song {lines // 2}', f'artist {lines // 2}')
+
+        bench(f'del_line, {lines} lines', del_line, 50)
+        issue_maker.unsupported.compact()
+        os.remove('unsupported.txt')
+
+    from swaglyrics_backend.limits_storage import SharedMemoryStorage  # noqa: F401 registers shm://
+    item = parse('1000/day')
+    for uri in ['memory://', 'shm://limits.shm']:
+        storage = storage_from_string(uri)
+        for strategy in ['fixed-window', 'moving-window']:
+            limiter = STRATEGIES[strategy](storage)
+            bench(f'{strategy} hit, {uri.split(":")[0]}', lambda: limiter.hit(item, 'stripper', '127.0.0.1'), 2000)
+
+    secret = os.environ['WEBHOOK_SECRET'].encode('latin-1')
+    for size in [1024, 64 * 1024]:
+        body = os.urandom(size)
+        signature = f'sha1={hmac.new(secret, body, hashlib.sha1).hexdigest()}'
+        bench(f'is_valid_signature, {size // 1024}KB body', lambda: is_valid_signature(signature, body), 2000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Load test of the main routes against fake upstreams and an SQLite database.
+
+Run from the repo root with `python -m benchmarks.bench_routes`, see --help for the knobs. Compare runs before and
+after a change with the same arguments, absolute numbers depend on the machine.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+
+from benchmarks.fakes import FakeUpstreams, HOOK_IP, load_app
+from benchmarks.load import drive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each upstream call takes')
+    parser.add_argument('--jitter', type=float, default=0.02, help='upstream latency varies by up to this much')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of upstream calls failing with a 500')
+    parser.add_argument('--strippers', type=int, default=10000, help='rows in the strippers table')
+    parser.add_argument('--unsupported', type=int, default=1000, help='lines in unsupported.txt')
+    parser.add_argument('--hit-ratio', type=float, default=0.8, help='share of /stripper requests in the database')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(args.latency, args.jitter, args.error_rate, args.seed)
+    issue_maker = load_app(upstreams, strippers=args.strippers)
+    app = issue_maker.app
+    for i in range(args.unsupported):
+        issue_maker.unsupported.add(f'song {i}', f'artist {i}')
+    secret = os.environ['WEBHOOK_SECRET'].encode('latin-1')
+
+    def stripper(client, i):
+        if (i % 100) < args.hit_ratio * 100:
+            song, artist = f'song {i % args.strippers}', f'artist {i % args.strippers}'
+        else:
+            song, artist = f'new song {i}', f'new artist {i}'
+        return client.post('/stripper', data={'song': song, 'artist': artist})
+
+    def unsupported(client, i):
+        return client.post('/unsupported', data={'song': f'unsupported song #{i}', 'artist': f'artist #{i}',
+                                                 'version': '1.2.0'})
+
+    def issue_closed(client, i):
+        body = json.dumps({
+            'action': 'closed',
+            'issue': {'title': f'song {i % args.unsupported} by artist {i % args.unsupported} unsupported.',
+                      'labels': [{'name': 'unsupported song'}]},
+            'repository': {'name': 'SwagLyrics-For-Spotify'},
+        }).encode()
+        signature = hmac.new(secret, body, hashlib.sha1).hexdigest()
+        return client.post('/issue_closed', data=body, content_type='application/json', headers={
+            'X-GitHub-Event': 'issues', 'X-GitHub-Delivery': str(i), 'X-Hub-Signature': f'sha1={signature}',
+            'User-Agent': 'GitHub-Hookshot/bench', 'X-Real-IP': HOOK_IP,
+        })
+
+    def home(client, i):
+        return client.get('/')
+
+    print(f'{args.requests} requests per route, {args.concurrency} clients, upstream latency {args.latency}s '
+          f'+/- {args.jitter}s, error rate {args.error_rate}')
+    for name, call in [('/stripper', stripper), ('/unsupported', unsupported), ('/', home),
+                       ('/issue_closed', issue_closed)]:
+        print(drive(app, name, call, args.requests, args.concurrency).report())
+    print(f'upstream calls: {upstreams.calls}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Times webhook verification and parsing on issue and push sized payloads, against the previous implementation that
+looked up the hash and keyed a new HMAC on every call and read the payload through `get_json`.
+
+Run from the repo root with `python -m benchmarks.bench_webhook`.
+"""
+import hashlib
+import hmac
+import io
+import json
+import os
+import timeit
+import tracemalloc
+
+from werkzeug.test import EnvironBuilder
+
+from benchmarks.fakes import load_app
+
+
+def legacy_validate(req, private_key):
+    x_hub_signature = req.headers.get('X-Hub-Signature')
+    hash_algorithm, github_signature = x_hub_signature.split('=', 1)
+    algorithm = hashlib.__dict__.get(hash_algorithm)
+    encoded_key = bytes(private_key, 'latin-1')
+    mac = hmac.new(encoded_key, msg=req.data, digestmod=algorithm)
+    assert hmac.compare_digest(mac.hexdigest(), github_signature)
+    return req.get_json()
+
+
+def issue_payload(comment_chars):
+    return {'action': 'closed',
+            'issue': {'title': 'Miracle by Caravan Palace unsupported.', 'body': 'x' * comment_chars,
+                      'labels': [{'name': 'unsupported song'}]},
+            'repository': {'name': 'SwagLyrics-For-Spotify'}}
+
+
+def push_payload(commits):
+    return {'ref': 'refs/heads/master', 'after': 'f' * 40, 'commits': [
+        {'id': f'{i:040x}', 'message': 'Fix things\n\n' + 'details ' * 50, 'added': [], 'removed': [],
+         'modified': [f'swaglyrics_backend/module_{j}.py' for j in range(10)]} for i in range(commits)
+    ]}
+
+
+def measure(func, number):
+    best = min(timeit.repeat(func, number=number, repeat=5)) / number
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    issue_maker = load_app(strippers=0)
+    from swaglyrics_backend.utils import validate_request
+    secret = os.environ['WEBHOOK_SECRET']
+    key = secret.encode('latin-1')
+
+    for name, payload, number in [('issue, 4KB comment', issue_payload(4 * 1024), 2000),
+                                  ('issue, 64KB comment', issue_payload(64 * 1024), 500),
+                                  ('push, 20 commits', push_payload(20), 500),
+                                  ('push, 500 commits', push_payload(500), 50)]:
+        body = json.dumps(payload).encode()
+        # only the SHA-1 signature so both sides hash the same way and the difference is the code
+        environ = EnvironBuilder(method='POST', data=body, content_type='application/json', headers={
+            'X-Hub-Signature': f'sha1={hmac.new(key, body, hashlib.sha1).hexdigest()}',
+        }).get_environ()
+
+        def request():
+            # a fresh request each time so the body is read from the stream like it would be
+            return issue_maker.app.request_class({**environ, 'wsgi.input': io.BytesIO(body)})
+
+        print(f'{name}, {len(body) // 1024}KB body')
+        for label, func in [('legacy sha1', lambda: legacy_validate(request(), secret)),
+                            ('validate_request sha1', lambda: validate_request(request()))]:
+            per_call, peak = measure(func, number)
+            print(f'    {label:<28} {per_call * 1e6:10.1f} us  peak {peak / 1024:8.1f} KB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Local stand-ins for Genius, Spotify, GitHub and Discord, and an app wired up to them and to an SQLite database.
+
+The fakes are a requests transport adapter mounted on the shared upstream session, so calls go through the same code
+paths as in production minus the network. Each call sleeps for `latency` seconds give or take `jitter`, and fails
+with a 500 with probability `error_rate`.
+
+`load_app()` must be called before anything imports swaglyrics_backend.issue_maker since the module reads its
+configuration from env variables on import.
+"""
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from requests import PreparedRequest, Response
+from requests.adapters import BaseAdapter
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests')
+
+# a block of GitHub hook addresses, requests to the webhooks are sent from 192.30.252.1
+HOOKS = ['192.30.252.0/22']
+HOOK_IP = '192.30.252.1'
+
+
+def load_json(filename: str) -> Any:
+    with open(os.path.join(DATA, filename)) as f:
+        return json.load(f)
+
+
+class FakeUpstreams(BaseAdapter):
+    """
+    Answers upstream requests like the real APIs would, from the sample responses used by the tests.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0,
+                 seed: Optional[int] = None) -> None:
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+        self.genius_hits = load_json('sample_genius_data.json')['response']['hits']
+        self.spotify_search = load_json('correct_spotify_data.json')
+        self.audio_features = load_json('spotify_not_instrumental.json')
+
+    def send(self, request: PreparedRequest, **kwargs: Any) -> Response:  # type: ignore
+        parts = urlsplit(request.url)
+        self.calls[parts.hostname] = self.calls.get(parts.hostname, 0) + 1
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.random.random() < self.error_rate:
+            return self.respond(request, 500, {'error': 'fake upstream error'})
+        status, body = self.route(request.method, parts.hostname, parts.path, parse_qs(parts.query))
+        return self.respond(request, status, body)
+
+    def route(self, method: str, host: str, path: str, query: Dict[str, List[str]]) -> Tuple[int, Any]:
+        if host == 'api.genius.com' and path == '/search':
+            q = query['q'][0]
+            # the searched title as the top hit followed by the usual noise
+            hit = {'result': {'full_title': q, 'path': f"/{'-'.join(q.split())}-lyrics"}}
+            return 200, {'meta': {'status': 200}, 'response': {'hits': [hit, *self.genius_hits]}}
+        if host == 'genius.com':
+            # most songs reported unsupported do have a lyrics page
+            return (200 if self.random.random() < 0.8 else 404), ''
+        if host == 'api.spotify.com' and path == '/v1/search':
+            return 200, self.spotify_search
+        if host == 'api.spotify.com' and path.startswith('/v1/audio-features/'):
+            return 200, self.audio_features
+        if host == 'api.spotify.com' and path == '/v1/audio-features':
+            return 200, {'audio_features': [self.audio_features] * len(query['ids'][0].split(','))}
+        if host == 'accounts.spotify.com':
+            return 200, {'access_token': 'fake-spotify-token', 'expires_in': 3600}
+        if host == 'api.github.com' and path == '/meta':
+            return 200, {'hooks': HOOKS}
+        if host == 'api.github.com' and method == 'POST' and path.endswith('/issues'):
+            return 201, {'html_url': 'https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues/1'}
+        if host == 'discord.com':
+            return 200, {}
+        return 404, {'message': 'Not Found'}
+
+    @staticmethod
+    def respond(request: PreparedRequest, status: int, body: Any) -> Response:
+        r = Response()
+        r.status_code = status
+        r.url = request.url
+        r.request = request
+        r._content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        r.headers['Content-Type'] = 'application/json'
+        return r
+
+    def close(self) -> None:
+        pass
+
+
+def load_app(upstreams: Optional[FakeUpstreams] = None, db_path: Optional[str] = None, strippers: int = 1000,
+             workdir: Optional[str] = None) -> Any:
+    """
+    Import issue_maker with fake credentials, the upstreams faked and a fresh SQLite database holding `strippers`
+    generated songs, `song 0` by `artist 0` and so on. Files the app writes go to `workdir`.
+    :return: the issue_maker module
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='swaglyrics-bench-')
+    for name in ['WEBHOOK_SECRET', 'GH_TOKEN', 'PASSWD', 'DB_PWD', 'C_ID', 'SECRET', 'USERNAME', 'GENIUS',
+                 'DISCORD_URL', 'DISCORD_URL_GENIUS', 'DISCORD_URL_INSTRUMENTAL', 'PRIVATE_PEM', 'APP_ID', 'INST_ID',
+                 'SWAG']:
+        os.environ.setdefault(name, 'bench')
+    os.environ.setdefault('JOBS_DB', os.path.join(workdir, 'jobs.sqlite3'))
+    os.environ.setdefault('WEBHOOK_JOBS_DB', os.path.join(workdir, 'webhooks.sqlite3'))
+    # create_all below makes the norm_key column
+    os.environ.setdefault('NORM_KEY_COLUMN', '1')
+    os.chdir(workdir)
+
+    from swaglyrics_backend import http_client
+    upstreams = upstreams or FakeUpstreams()
+    for prefix in [*http_client.UPSTREAMS, 'https://']:
+        http_client.session.mount(prefix, upstreams)
+
+    from swaglyrics_backend import issue_maker
+    # logging every request would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    issue_maker.limiter.enabled = False
+    # a GitHub App token needs a real private key, skip straight to a token
+    issue_maker.github_tokens.provider = lambda: ('fake-github-token', time.time() + 3600)
+
+    db_path = db_path or os.path.join(workdir, 'strippers.sqlite3')
+    issue_maker.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    issue_maker.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    with issue_maker.app.app_context():
+        issue_maker.db.drop_all()
+        issue_maker.db.create_all()
+        issue_maker.db.session.bulk_insert_mappings(issue_maker.Lyrics, [
+            {'song': f'song {i}', 'artist': f'artist {i}', 'stripper': f'artist-{i}-song-{i}',
+             'norm_key': f'song {i}|artist {i}'} for i in range(strippers)
+        ])
+        issue_maker.db.session.commit()
+    return issue_maker
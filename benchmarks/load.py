@@ -0,0 +1,56 @@
+"""
+Drives requests at the app from concurrent clients and reports throughput and latency percentiles.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+# takes a flask test client and the index of the request, returns the response
+Call = Callable[[Any, int], Any]
+
+
+@dataclass
+class Result:
+    name: str
+    elapsed: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] if ordered else 0.0
+
+    def report(self) -> str:
+        count = len(self.latencies)
+        statuses = ' '.join(f'{status}:{n}' for status, n in sorted(self.statuses.items()))
+        return (f'{self.name:<24} {count:>6} req {count / self.elapsed:>9.1f} req/s   '
+                f'p50 {self.percentile(50) * 1e3:>8.2f}ms  p90 {self.percentile(90) * 1e3:>8.2f}ms  '
+                f'p99 {self.percentile(99) * 1e3:>8.2f}ms  max {self.percentile(100) * 1e3:>8.2f}ms   {statuses}')
+
+
+def drive(app: Any, name: str, call: Call, requests: int, concurrency: int) -> Result:
+    """
+    Make `requests` calls from `concurrency` threads, each with its own test client.
+    """
+    result = Result(name)
+    local = threading.local()
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        resp = call(local.client, i)
+        latency = time.perf_counter() - start
+        with lock:
+            result.latencies.append(latency)
+            result.statuses[resp.status_code] = result.statuses.get(resp.status_code, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in pool.map(one, range(requests)):
+            pass
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,113 @@
+"""
+Replays traffic recorded with CAPTURE_FILE against the app, with fake upstreams and an SQLite database.
+
+Run from the repo root with `python -m benchmarks.replay capture.jsonl --speedup 10`, see --help for the options.
+Requests are sent at their recorded offsets divided by the speed-up, each captured client from its own address, so
+hot songs and heavy clients stay as skewed as they were. Pass --limits to keep the rate limiter on. Limits are
+enforced in real time, so check them with --speedup 1 or expect proportionally more 429s.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from benchmarks.fakes import FakeUpstreams, HOOK_IP, load_app
+from benchmarks.load import Result
+from swaglyrics_backend.capture import REDACTED, read_capture
+
+
+def address(client: str) -> str:
+    # a stable fake address per captured client
+    n = int(client[:6], 16)
+    return f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('capture', help='JSON lines file written by the app with CAPTURE_FILE set')
+    parser.add_argument('--speedup', type=float, default=1.0, help='replay this many times faster than recorded')
+    parser.add_argument('--concurrency', type=int, default=32, help='most requests in flight at once')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each upstream call takes')
+    parser.add_argument('--jitter', type=float, default=0.02, help='upstream latency varies by up to this much')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of upstream calls failing with a 500')
+    parser.add_argument('--limits', action='store_true', help='enforce the rate limits')
+    args = parser.parse_args()
+
+    entries = read_capture(args.capture)
+    if not entries:
+        parser.error('nothing captured')
+    issue_maker = load_app(FakeUpstreams(args.latency, args.jitter, args.error_rate), strippers=0)
+    issue_maker.limiter.enabled = args.limits
+
+    # songs that were found when recorded are in the database for the replay
+    found = {(entry['form']['song'], entry['form']['artist']) for entry in entries
+             if entry['path'] == '/stripper' and entry['status'] == 200 and 'song' in entry.get('form', {})}
+    with issue_maker.app.app_context():
+        for song, artist in found:
+            issue_maker.db.session.add(issue_maker.Lyrics(song, artist, f'{artist}-{song}'.replace(' ', '-')))
+        issue_maker.db.session.commit()
+
+    passwd = os.environ['PASSWD']
+    secret = os.environ['WEBHOOK_SECRET'].encode('latin-1')
+    results: Dict[str, Result] = {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def unredact(fields):
+        return {name: passwd if value == REDACTED else value for name, value in fields.items()}
+
+    def send(entry, due):
+        nonlocal lag
+        if not hasattr(local, 'client'):
+            local.client = issue_maker.app.test_client()
+        kwargs = {'query_string': unredact(entry.get('args', {})),
+                  'environ_base': {'REMOTE_ADDR': address(entry['client'])}}
+        if 'form' in entry:
+            kwargs['data'] = unredact(entry['form'])
+        if 'json' in entry:
+            body = json.dumps(entry['json']).encode()
+            kwargs.update(data=body, content_type='application/json')
+            if event := entry.get('github_event'):
+                kwargs['headers'] = {
+                    'X-GitHub-Event': event, 'User-Agent': 'GitHub-Hookshot/replay',
+                    # redeliveries in the capture are replayed as such
+                    'X-GitHub-Delivery': entry.get('github_delivery') or str(uuid.uuid4()),
+                    'X-Hub-Signature': f'sha1={hmac.new(secret, body, hashlib.sha1).hexdigest()}',
+                    'X-Real-IP': HOOK_IP,
+                }
+        start = time.perf_counter()
+        lag = max(lag, start - begin - due)
+        resp = local.client.open(entry['path'], method=entry['method'], **kwargs)
+        latency = time.perf_counter() - start
+        with lock:
+            result = results.setdefault(entry['path'], Result(entry['path']))
+            result.latencies.append(latency)
+            result.statuses[resp.status_code] = result.statuses.get(resp.status_code, 0) + 1
+
+    lag = 0.0
+    first = entries[0]['time']
+    print(f'replaying {len(entries)} requests spanning {entries[-1]["time"] - first:.0f}s at {args.speedup}x, '
+          f'{len({entry["client"] for entry in entries})} clients')
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for entry in entries:
+            due = (entry['time'] - first) / args.speedup
+            if (wait := due - (time.perf_counter() - begin)) > 0:
+                time.sleep(wait)
+            pool.submit(send, entry, due)
+    elapsed = time.perf_counter() - begin
+
+    for result in sorted(results.values(), key=lambda result: -len(result.latencies)):
+        result.elapsed = elapsed
+        print(result.report())
+    print(f'took {elapsed:.1f}s, at most {lag * 1e3:.0f}ms behind schedule')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+-- Composite index for the (song, artist) lookups done by /stripper.
+-- song and artist are VARCHAR(4096) which is too long for an InnoDB key, so only a prefix of each is indexed.
+-- The query still compares the full values, the index just narrows it down to a handful of rows.
+--
+-- run with: mysql -h <username>.mysql.pythonanywhere-services.com -u <username> -p '<username>$strippers' < 0001_song_artist_index.sql
+
+CREATE INDEX ix_all_strippers_song_artist ON all_strippers (song(255), artist(255));
@@ -0,0 +1,8 @@
+-- Normalized song|artist key used to serve strippers for near-matching spellings, see swaglyrics_backend/fuzzy.py.
+-- New rows get the key when they're added, fill it in for existing rows afterwards with:
+--   FLASK_APP=swaglyrics_backend/issue_maker.py flask backfill-norm-keys
+--
+-- run with: mysql -h <username>.mysql.pythonanywhere-services.com -u <username> -p '<username>$strippers' < 0002_norm_key.sql
+
+ALTER TABLE all_strippers ADD COLUMN norm_key VARCHAR(512);
+CREATE INDEX ix_all_strippers_norm_key ON all_strippers (norm_key);
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from swaglyrics_backend.metrics import metrics
+
+_missing = object()
+
+
+class LRUCache:
+    """
+    A bounded, thread safe least recently used cache. Lookups of named caches are counted in the metrics.
+    """
+
+    def __init__(self, maxsize: int = 1024, name: Optional[str] = None) -> None:
+        self.maxsize = maxsize
+        self.name = name
+        self._data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: Hashable) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return _missing
+            return self._data[key]
+
+    def _count(self, hit: bool) -> None:
+        if self.name:
+            metrics.inc('swaglyrics_cache_requests_total', cache=self.name, result='hit' if hit else 'miss')
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        value = self._lookup(key)
+        self._count(value is not _missing)
+        return default if value is _missing else value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    """
+    An LRU cache whose entries expire `ttl` seconds after they are set.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, name: Optional[str] = None) -> None:
+        super().__init__(maxsize, name)
+        self.ttl = ttl
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = super()._lookup(key)
+        if entry is _missing:
+            return _missing
+        expiry, value = entry
+        if expiry < time.monotonic():
+            self.pop(key)
+            return _missing
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        super().set(key, (time.monotonic() + self.ttl, value))
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _missing) is not _missing
+
+
+class BatchLoader:
+    """
+    Coalesces concurrent single key loads into one call of `load_many`.
+
+    The first caller waits `window` seconds for other keys to come in, then loads everything pending in chunks of
+    `max_batch` keys and hands each caller its value. Extra arguments of that first call are passed on to
+    `load_many` for the whole batch. `concurrency` is the most threads that can call at once, the wait ends early
+    once that many callers are waiting and is skipped altogether with a single thread.
+    """
+
+    def __init__(self, load_many: Callable[..., Dict[Hashable, Any]], window: float = 0.02,
+                 max_batch: int = 100, concurrency: Optional[int] = None) -> None:
+        self.load_many = load_many
+        self.window = window
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        self._pending: Dict[Hashable, Future] = {}
+        self._scheduled = False
+        # callers waiting on the pending batch, more than its keys if some asked for the same key
+        self._callers = 0
+        self._lock = threading.Lock()
+        self._joined = threading.Condition(self._lock)
+
+    def _full(self) -> bool:
+        return self.concurrency is not None and self._callers >= self.concurrency
+
+    def load(self, key: Hashable, *args: Any) -> Any:
+        with self._lock:
+            leader = not self._scheduled
+            self._scheduled = True
+            if (future := self._pending.get(key)) is None:
+                future = self._pending[key] = Future()
+            self._callers += 1
+            self._joined.notify()
+        if leader:
+            with self._lock:
+                self._joined.wait_for(self._full, self.window)
+                batch, self._pending, self._scheduled, self._callers = self._pending, {}, False, 0
+            keys = list(batch)
+            for i in range(0, len(keys), self.max_batch):
+                chunk = keys[i:i + self.max_batch]
+                try:
+                    values = self.load_many(chunk, *args)
+                except Exception as e:
+                    for k in chunk:
+                        batch[k].set_exception(e)
+                else:
+                    for k in chunk:
+                        batch[k].set_result(values.get(k))
+        return future.result()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the function and the others wait for it and
+    share its result, or its exception. Calls coming in once it's done run it again.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if (waiting := self._calls.get(key)) is None:
+                future = self._calls[key] = Future()
+        if waiting is not None:
+            metrics.inc('swaglyrics_coalesced_calls_total', call=self.name)
+            return waiting.result()
+        try:
+            result = func(*args)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
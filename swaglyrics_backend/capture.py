@@ -0,0 +1,115 @@
+# ------------------- traffic capture ------------------- #
+# records incoming requests as JSON lines so production traffic can be replayed against a local copy of the app,
+# see benchmarks/replay.py. Enabled by setting CAPTURE_FILE.
+
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from flask import Flask, Response, g, request
+from flask_limiter.util import get_ipaddr
+
+from swaglyrics_backend.loggers import JSONDict
+
+# form fields and query args that are never written to the capture
+SECRET_FIELDS = frozenset({'auth', 'passwd', 'password', 'token', 'secret'})
+REDACTED = '[redacted]'
+
+
+def redact(fields: Dict[str, str]) -> Dict[str, str]:
+    return {name: REDACTED if name.lower() in SECRET_FIELDS else value for name, value in fields.items()}
+
+
+class TrafficCapture:
+    """
+    Appends one JSON line per request to `path`: arrival time, method, path, form fields and query args with secrets
+    redacted, JSON bodies up to `max_body` bytes, the GitHub event and delivery headers, response status and duration.
+
+    Clients are recorded as a hash of their address salted with `salt`, so per client rate limits can be replayed
+    without storing addresses. Workers sharing a file need the same salt. Nothing is recorded without a salt, since
+    hashes of known addresses could then be matched. Only a `sample` share of requests is recorded.
+
+    Each line is written with a single append so several worker processes can share one file. Requests are served
+    as usual if the file can't be written to.
+    """
+
+    def __init__(self, path: Optional[str], salt: str, sample: float = 1.0, max_body: int = 64 * 1024) -> None:
+        self.path = path or ''
+        self.salt = salt.encode()
+        self.sample = sample
+        self.max_body = max_body
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path and self.salt)
+
+    def client_id(self, address: str) -> str:
+        return hashlib.sha256(self.salt + address.encode()).hexdigest()[:16]
+
+    def record(self, response: Response, duration: float) -> JSONDict:
+        entry: JSONDict = {
+            'time': g.capture_start_time,
+            'method': request.method,
+            'path': request.path,
+            'client': self.client_id(get_ipaddr()),
+            'status': response.status_code,
+            'duration': round(duration, 6),
+        }
+        if request.args:
+            entry['args'] = redact(request.args.to_dict())
+        if request.form:
+            entry['form'] = redact(request.form.to_dict())
+        if event := request.headers.get('X-GitHub-Event'):
+            entry['github_event'] = event
+            entry['github_delivery'] = request.headers.get('X-GitHub-Delivery')
+        if request.is_json:
+            if (request.content_length or 0) <= self.max_body:
+                entry['json'] = request.get_json(silent=True)
+            else:
+                entry['body_skipped'] = request.content_length
+        return entry
+
+    def write(self, entry: JSONDict) -> None:
+        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode()
+        # a single O_APPEND write doesn't interleave with other processes' lines
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def instrument(self, app: Flask) -> None:
+        if self.path and not self.salt:
+            logging.error('not capturing traffic, a capture file needs a salt to hash client addresses with')
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_capture() -> None:
+            if random.random() < self.sample:
+                g.capture_start_time = time.time()
+                g.capture_start = time.perf_counter()
+
+        @app.after_request
+        def finish_capture(response: Response) -> Response:
+            if (start := g.pop('capture_start', None)) is not None:
+                try:
+                    self.write(self.record(response, time.perf_counter() - start))
+                except OSError as e:
+                    logging.warning(f'could not capture request: {e}')
+            return response
+
+
+def read_capture(path: str) -> List[JSONDict]:
+    """
+    Returns the captured requests in `path` in the order they arrived.
+    """
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    # lines from several workers can be slightly out of order
+    entries.sort(key=lambda entry: entry['time'])
+    return entries
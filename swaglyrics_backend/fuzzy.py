@@ -0,0 +1,176 @@
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from swaglyrics.cli import spc
+from unidecode import unidecode
+
+from swaglyrics_backend.matching import alg
+
+aug = re.compile(r'(\([^)]*\)|- .*)')  # remove braces and included text and text after '- ' to search better on Genius
+ftr = re.compile(r'\s(feat|ft|featuring)\.?\s.*$', re.IGNORECASE)  # unbraced featured artists at the end
+
+# (id, song, artist, stripper) rows of all_strippers
+Row = Tuple[int, str, str, str]
+
+# number words and roman numerals to the number they stand for, single letter numerals are left out since "i" and "x"
+# are far more often words than numbers in titles
+NUMBERS = {word: str(n) for n, word in enumerate(
+    'zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen seventeen '
+    'eighteen nineteen twenty'.split())}
+NUMBERS.update({'ii': '2', 'iii': '3', 'iv': '4', 'vi': '6', 'vii': '7', 'viii': '8', 'ix': '9', 'xi': '11',
+                'xii': '12'})
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize a song or artist name so different spellings of the same title compare equal.
+
+    Drops text in braces, "feat." suffixes and text after '- ' (like "- Remastered 2011"), then diacritics,
+    punctuation, case and extra spaces.
+    """
+    text = ftr.sub('', aug.sub('', text))
+    text = alg.sub('', unidecode(text).lower())
+    return spc.sub(' ', text).strip()
+
+
+def normalize_pair(song: str, artist: str) -> str:
+    """
+    Returns the normalized key of a song, artist pair, as stored in the norm_key column of all_strippers.
+    """
+    return f'{normalize(song)}|{normalize(artist)}'
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    text = f'  {text} '
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def numbers(text: str) -> Tuple[str, ...]:
+    """
+    Returns the numbers in a normalized title, as digits and in order. Titles that differ in them, like
+    "Part 1" and "Part 2", are different songs however similar the rest is.
+    """
+    return tuple(token if token.isdigit() else NUMBERS[token] for token in text.split()
+                 if token.isdigit() or token in NUMBERS)
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """
+    Dice coefficient of two trigram sets.
+    """
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class StripperIndex:
+    """
+    In-memory index of all_strippers on normalized song and artist, to serve strippers stored under a slightly
+    different spelling without going to Genius.
+
+    Lookups first try the exact normalized pair. Otherwise the artist is resolved, exactly or via a trigram index of
+    artist names, and the songs of the matching artists are compared by trigram similarity. Both song and artist have
+    to be at least `threshold` similar, and the numbers in the songs have to be the same.
+
+    Rows are loaded with `load_rows(after_id)`, which returns the rows with an id above `after_id` in id order, so
+    refreshing only fetches new rows. Once the index is older than `max_age` seconds it's refreshed in the background.
+    """
+
+    def __init__(self, load_rows: Callable[[int], Iterable[Row]], threshold: float = 0.85,
+                 max_age: float = 300) -> None:
+        self.load_rows = load_rows
+        self.threshold = threshold
+        self.max_age = max_age
+        self.max_id = 0
+        self.loaded_at: Optional[float] = None
+        self.exact: Dict[str, str] = {}
+        # normalized artist -> [(song trigrams, song numbers, stripper)]
+        self.songs: Dict[str, List[Tuple[FrozenSet[str], Tuple[str, ...], str]]] = {}
+        self.artist_grams: Dict[str, FrozenSet[str]] = {}
+        # trigram -> artists containing it, lists so lookups can iterate them while rows are being added
+        self.artist_trigrams: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+        self._refreshing = False
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def add(self, song: str, artist: str, stripper: str) -> None:
+        n_song, n_artist = normalize(song), normalize(artist)
+        key = f'{n_song}|{n_artist}'
+        with self._lock:
+            if key in self.exact:
+                # first row wins, same as the exact database lookup
+                return
+            if n_artist not in self.songs:
+                self.songs[n_artist] = []
+                self.artist_grams[n_artist] = trigrams(n_artist)
+                for trigram in self.artist_grams[n_artist]:
+                    self.artist_trigrams.setdefault(trigram, []).append(n_artist)
+            self.songs[n_artist].append((trigrams(n_song), numbers(n_song), stripper))
+            self.exact[key] = stripper
+
+    def refresh(self) -> int:
+        """
+        Load rows added since the last refresh.
+        :return: number of rows loaded
+        """
+        with self._lock:
+            cnt = 0
+            for row_id, song, artist, stripper in self.load_rows(self.max_id):
+                self.add(song, artist, stripper)
+                self.max_id = max(self.max_id, row_id)
+                cnt += 1
+            self.loaded_at = time.monotonic()
+        logging.info(f'stripper index refreshed with {cnt} rows, {len(self)} total')
+        return cnt
+
+    def refresh_in_background(self) -> None:
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run() -> None:
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception('stripper index refresh failed')
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='stripper-index', daemon=True).start()
+
+    def _artists(self, n_artist: str) -> List[str]:
+        if n_artist in self.songs:
+            return [n_artist]
+        query = trigrams(n_artist)
+        candidates: Set[str] = set()
+        for trigram in query:
+            candidates.update(self.artist_trigrams.get(trigram, ()))
+        return [artist for artist in candidates if similarity(query, self.artist_grams[artist]) >= self.threshold]
+
+    def lookup(self, song: str, artist: str) -> Optional[str]:
+        """
+        Returns the stripper of the closest stored song, artist pair if it's similar enough.
+        """
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age:
+            self.refresh_in_background()
+        n_song, n_artist = normalize(song), normalize(artist)
+        if (stripper := self.exact.get(f'{n_song}|{n_artist}')) is not None:
+            return stripper
+        query, query_numbers = trigrams(n_song), numbers(n_song)
+        best, best_score = None, 0.0
+        for candidate in self._artists(n_artist):
+            for song_trigrams, song_numbers, stripper in self.songs[candidate]:
+                if song_numbers != query_numbers:
+                    continue
+                if (score := similarity(query, song_trigrams)) >= self.threshold and score > best_score:
+                    best, best_score = stripper, score
+        return best
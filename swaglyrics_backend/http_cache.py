@@ -0,0 +1,57 @@
+# ------------------- cached responses ------------------- #
+# responses that only change when some data changes are rendered and gzipped once per version of that data, and
+# served with validators so clients and Cloudflare can revalidate with a 304 instead of downloading them again.
+
+import gzip
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+
+from flask import Response, request
+
+from swaglyrics_backend.cache import LRUCache
+
+
+class Rendered(NamedTuple):
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+
+class RenderedCache:
+    """
+    Rendered bodies keyed by name and data version, along with their gzipped version.
+    """
+
+    def __init__(self, maxsize: int = 16, max_age: int = 60, stale_while_revalidate: int = 300) -> None:
+        self.cache = LRUCache(maxsize, 'rendered')
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+
+    def get(self, name: str, version: str, render: Callable[[], str]) -> Rendered:
+        if (rendered := self.cache.get((name, version))) is None:
+            body = render().encode('utf-8')
+            rendered = Rendered(body, gzip.compress(body, 6), f'{name}-{version}')
+            self.cache.set((name, version), rendered)
+        return rendered
+
+    def respond(self, name: str, version: str, modified: float, render: Callable[[], str],
+                mimetype: str = 'text/html') -> Response:
+        """
+        Serve the body `render` returns for `version`, gzipped if the client accepts it, answering conditional
+        requests with a 304.
+        :param modified: unix time the data last changed at
+        """
+        rendered = self.get(name, version, render)
+        if 'gzip' in request.accept_encodings:
+            response = Response(rendered.gzipped, mimetype=mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+            # the two encodings are different representations, so they need different tags
+            response.set_etag(f'{rendered.etag}-gz')
+        else:
+            response = Response(rendered.body, mimetype=mimetype)
+            response.set_etag(rendered.etag)
+        response.vary.add('Accept-Encoding')
+        response.last_modified = datetime.fromtimestamp(int(modified), timezone.utc)
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}, ' \
+                                            f'stale-while-revalidate={self.stale_while_revalidate}'
+        return response.make_conditional(request)
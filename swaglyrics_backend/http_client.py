@@ -0,0 +1,96 @@
+# ------------------- shared upstream http client ------------------- #
+# every call to Genius, Spotify, GitHub and Discord goes through `session` so connections are kept alive and reused
+# instead of paying for a new TCP + TLS handshake each time.
+
+import os
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from swaglyrics_backend.metrics import metrics
+
+# connections kept alive per upstream host, raise along with the number of threads making upstream calls
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+# seconds to wait for an upstream to connect and respond
+TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))
+RETRIES = int(os.environ.get('HTTP_RETRIES', 2))
+BACKOFF = float(os.environ.get('HTTP_BACKOFF', 0.3))
+
+
+def retry_policy(*statuses: int) -> Retry:
+    """
+    Retry failed connections, and responses with one of `statuses` for idempotent methods, with exponential backoff.
+    The last response is returned as is once retries run out.
+    """
+    return Retry(total=RETRIES, backoff_factor=BACKOFF, status_forcelist=set(statuses), raise_on_status=False)
+
+
+# per host retry policies
+UPSTREAMS: Dict[str, Retry] = {
+    'https://api.genius.com': retry_policy(500, 502, 503, 504),
+    'https://genius.com': retry_policy(500, 502, 503, 504),
+    'https://api.spotify.com': retry_policy(500, 502, 503, 504),
+    'https://accounts.spotify.com': retry_policy(500, 502, 503),
+    'https://api.github.com': retry_policy(502, 503, 504),
+    # discord rate limits are handled by the caller, only retry failed connections
+    'https://discord.com': retry_policy(),
+}
+
+
+# (host, path prefix, name) of the upstream calls timed separately, anything else is timed by host
+ENDPOINTS: List[Tuple[str, str, str]] = [
+    ('api.genius.com', '/search', 'genius_search'),
+    ('genius.com', '/', 'genius_page'),
+    ('api.spotify.com', '/v1/search', 'spotify_search'),
+    ('api.spotify.com', '/v1/audio-features', 'spotify_audio_features'),
+    ('accounts.spotify.com', '/api/token', 'spotify_token'),
+    ('api.github.com', '/repos/', 'github_issue'),
+    ('api.github.com', '/search/issues', 'github_issue_search'),
+    ('api.github.com', '/app/installations/', 'github_token'),
+    ('api.github.com', '/meta', 'github_meta'),
+    ('discord.com', '/api/webhooks/', 'discord_webhook'),
+]
+
+
+def endpoint_name(url: str) -> str:
+    # never label with the path itself, it can hold ids and webhook tokens
+    parts = urlsplit(url)
+    for host, prefix, name in ENDPOINTS:
+        if parts.hostname == host and parts.path.startswith(prefix):
+            return name
+    return parts.hostname or 'unknown'
+
+
+class UpstreamSession(requests.Session):
+    """
+    A requests session with a pooled adapter per upstream host and a default timeout.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, timeout: float = TIMEOUT) -> None:
+        super().__init__()
+        self.timeout = timeout
+        for prefix, retry in UPSTREAMS.items():
+            self.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+        self.mount('https://', HTTPAdapter(pool_maxsize=pool_size, max_retries=retry_policy()))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with metrics.timer('swaglyrics_upstream_request_duration_seconds', upstream=endpoint_name(url)) as labels:
+            labels['status'] = 'error'
+            r = super().request(method, url, **kwargs)
+            labels['status'] = str(r.status_code)
+        return r
+
+
+session = UpstreamSession()
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return session.get(url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    return session.post(url, **kwargs)
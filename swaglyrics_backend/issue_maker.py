@@ -2,59 +2,115 @@ import json
 import logging
 import os
 import re
-import time
-from datetime import datetime as dt
-from typing import Optional, List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple, Iterable, Iterator, Union, Hashable
 
+import click
 import git
 import requests
-from flask import Flask, request, abort, render_template
+from flask import Flask, Response, request, abort, render_template, jsonify, url_for, stream_with_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_ipaddr
 from flask_sqlalchemy import SQLAlchemy
-from requests.auth import HTTPBasicAuth
+from limits import parse_many, RateLimitItem
+from sqlalchemy import FetchedValue
+from sqlalchemy.orm import deferred
 from swaglyrics import __version__
 from swaglyrics.cli import stripper, spc
 from unidecode import unidecode
 
-from swaglyrics_backend.loggers import discord_deploy_logger, discord_instrumental_logger, discord_genius_logger, \
-    JSONDict
-from swaglyrics_backend.utils import request_from_github, validate_request, get_jwt, get_installation_access_token, \
-    log_args
+from swaglyrics_backend import http_client
+from swaglyrics_backend.cache import LRUCache, TTLCache, BatchLoader, SingleFlight
+from swaglyrics_backend.capture import TrafficCapture
+from swaglyrics_backend.fuzzy import aug, normalize_pair, StripperIndex, Row
+from swaglyrics_backend.http_cache import RenderedCache
+from swaglyrics_backend.jobs import JobQueue
+from swaglyrics_backend.limits_storage import SharedMemoryStorage  # noqa: F401 registers the shm:// storage scheme
+from swaglyrics_backend.loggers import discord_deploy_logger, queue_instrumental_log, queue_genius_log, JSONDict
+from swaglyrics_backend.matching import TitleMatcher, tokenize
+from swaglyrics_backend.metrics import metrics, instrument_flask, instrument_sqlalchemy
+from swaglyrics_backend.replica import StripperReplica
+from swaglyrics_backend.tokens import TokenManager, github_app_token, spotify_client_credentials_token
+from swaglyrics_backend.unsupported import UnsupportedStore
+from swaglyrics_backend.utils import request_from_github, validate_request, log_args
 
 # start flask app
 app = Flask(__name__)
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
-# request limiter base rules
+# request limiter base rules, counted per process unless RATELIMIT_STORAGE_URL points at shared storage like
+# shm:///path/to/file to share them between worker processes
 limiter = Limiter(
     app,
     key_func=get_ipaddr,
-    default_limits=["1000 per day"]
+    default_limits=["1000 per day"],
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URL'),
+    strategy=os.environ.get('RATELIMIT_STRATEGY'),
 )
 
+# request, upstream and database timings served at /metrics
+instrument_flask(app)
+instrument_sqlalchemy()
+
 # database env variables
 username = os.environ['USERNAME']
 passwd = os.environ['PASSWD']
 
-# github variables
-gh_token = ''
-gh_token_expiry = 0.0
-
-# declare the Spotify token and expiry time
-spotify_token = ''
-spotify_token_expiry = 0.0
-
+# requests recorded for replay when CAPTURE_FILE is set, client addresses are hashed with CAPTURE_SALT
+traffic_capture = TrafficCapture(os.environ.get('CAPTURE_FILE'), os.environ.get('CAPTURE_SALT', ''),
+                                 float(os.environ.get('CAPTURE_SAMPLE', 1)))
+traffic_capture.instrument(app)
+
+# github app installation token, renewed 3 minutes before it expires at the latest
+github_tokens = TokenManager('github', github_app_token, margin=180)
+
+# spotify search results keyed by (song, artist) and audio features keyed by track id
+spotify_searches = TTLCache(int(os.environ.get('SPOTIFY_CACHE_SIZE', 4096)),
+                            float(os.environ.get('SPOTIFY_SEARCH_TTL', 24 * 3600)), 'spotify_search')
+audio_features = TTLCache(int(os.environ.get('SPOTIFY_CACHE_SIZE', 4096)),
+                          float(os.environ.get('AUDIO_FEATURES_TTL', 7 * 24 * 3600)), 'audio_features')
+
+# how similar a word has to be to one in a Genius title to count as present, 1 only allows exact matches
+token_similarity = float(os.environ.get('GENIUS_TOKEN_SIMILARITY', 1.0))
+
+# hourly and daily stripper lookups per client, shared by /stripper and /stripper/batch where each track in a batch
+# counts as one lookup
+stripper_limits = "60/hour;200/day"
+stripper_scope = 'stripper_lookups'
+batch_max_tracks = int(os.environ.get('BATCH_MAX_TRACKS', 50))
+batch_limits = parse_many(stripper_limits)
+genius_pool = ThreadPoolExecutor(int(os.environ.get('GENIUS_WORKERS', 4)), thread_name_prefix='genius')
+
+# spotify client credentials token, renewed 5 minutes before it expires at the latest
+spotify_tokens = TokenManager('spotify', spotify_client_credentials_token, margin=300)
+
+# indexed view of unsupported.txt and its change log, compacted every UNSUPPORTED_COMPACT_AFTER changes
+unsupported = UnsupportedStore('unsupported.txt', int(os.environ.get('UNSUPPORTED_COMPACT_AFTER', 1000)))
+
+# / and /master_unsupported rendered once per version of unsupported.txt
+rendered = RenderedCache(max_age=int(os.environ.get('UNSUPPORTED_MAX_AGE', 60)))
+# unsupported songs per page of the home page, and at most per page of /unsupported/list
+home_page_size = int(os.environ.get('HOME_PAGE_SIZE', 100))
+list_max_limit = int(os.environ.get('LIST_MAX_LIMIT', 500))
+
+# (song, artist) -> stripper for strippers found in the database
+stripper_cache = LRUCache(int(os.environ.get('STRIPPER_CACHE_SIZE', 4096)), 'stripper')
+
+# normalized (song, artist) pairs Genius recently had no matching hit for
+genius_misses = TTLCache(int(os.environ.get('GENIUS_MISS_CACHE_SIZE', 2048)),
+                         float(os.environ.get('GENIUS_MISS_TTL', 6 * 3600)), 'genius_miss')
+# genius_stripper lookups in flight by normalized (song, artist)
+genius_lookups = SingleFlight('genius_stripper')
+
+not_relevant = "Event type not unsupported song issue closed."
 gh_issue_text = "If you feel there's an error, open a ticket at " \
                 "https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues"
 # update_text = 'Please update SwagLyrics to the latest version to get better support :)'
 update_text = 'Please update SwagLyrics to the latest version (v1.2.0), it contains a hotfix for Genius A/B testing :)'
 
 # genius stripper regex
-alg = re.compile(r'[^\sa-zA-Z0-9]+')
 gstr = re.compile(r'(?<=/)[-a-zA-Z0-9]+(?=-lyrics$)')
-aug = re.compile(r'(\([^)]*\)|- .*)')  # remove braces and included text and text after '- ' to search better on Genius
 
 # webhook regex
 wdt = re.compile(r'(.+) by (.+) unsupported.')
@@ -75,6 +131,10 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db = SQLAlchemy(app)
 
+# set NORM_KEY_COLUMN=1 once migrations/0002_norm_key.sql ran, until then norm_key is never read or written so the
+# app runs against a database that doesn't have the column yet
+norm_key_column = bool(int(os.environ.get('NORM_KEY_COLUMN', 0)))
+
 """
  you should manually initialize the db for first run
  >>> from issue_maker import db
@@ -84,38 +144,93 @@ db = SQLAlchemy(app)
 
 class Lyrics(db.Model):  # type: ignore # https://stackoverflow.com/q/56774322/9044659
     __tablename__ = "all_strippers"
+    # prefix index since the columns are too long to index whole, see migrations/0001_song_artist_index.sql
+    __table_args__ = (
+        db.Index('ix_all_strippers_song_artist', 'song', 'artist', mysql_length={'song': 255, 'artist': 255}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     song = db.Column(db.String(4096))
     artist = db.Column(db.String(4096))
     stripper = db.Column(db.String(4096))
+    # normalized song|artist for near-match lookups, see migrations/0002_norm_key.sql. Deferred so loading a row
+    # doesn't select it, and marked as filled in by the server so inserts leave it out unless it's set
+    norm_key = deferred(db.Column(db.String(512), index=True, server_default=FetchedValue()))
 
     def __init__(self, song, artist, stripper):
         self.song = song
         self.artist = artist
         self.stripper = stripper
+        if norm_key_column:
+            self.norm_key = normalize_pair(song, artist)[:512]
+
+
+@app.cli.command('backfill-norm-keys')
+def backfill_norm_keys():
+    """
+    Fill in norm_key for rows added before the column existed, or before NORM_KEY_COLUMN was set.
+    """
+    cnt = 0
+    while rows := Lyrics.query.filter(Lyrics.norm_key.is_(None)).limit(1000).all():
+        for lyrics in rows:
+            lyrics.norm_key = normalize_pair(lyrics.song, lyrics.artist)[:512]
+        db.session.commit()
+        cnt += len(rows)
+        logging.info(f'backfilled {cnt} norm keys')
+
+
+@app.cli.command('export-strippers')
+@click.argument('output', type=click.File('w', encoding='utf-8'))
+def export_strippers_command(output):
+    """
+    Export all_strippers to OUTPUT as NDJSON, - for stdout.
+    """
+    for line in export_strippers():
+        output.write(line)
+
+
+@app.cli.command('import-strippers')
+@click.argument('input_file', type=click.File('r', encoding='utf-8'))
+def import_strippers_command(input_file):
+    """
+    Import NDJSON strippers from INPUT_FILE, - for stdin. Songs already in the database are skipped.
+    """
+    click.echo(json.dumps(import_strippers(input_file)))
+
+
+def load_stripper_rows(after_id: int) -> List[Row]:
+    # rows added since after_id for the stripper index, which refreshes outside of any request
+    with app.app_context():
+        return Lyrics.query.with_entities(Lyrics.id, Lyrics.song, Lyrics.artist, Lyrics.stripper) \
+            .filter(Lyrics.id > after_id).order_by(Lyrics.id).all()
+
+
+# near-match lookups of strippers stored under a different spelling, FUZZY_STRIPPERS=0 turns them off
+fuzzy_strippers = bool(int(os.environ.get('FUZZY_STRIPPERS', 1)))
+stripper_index = StripperIndex(load_stripper_rows, float(os.environ.get('FUZZY_THRESHOLD', 0.85)),
+                               float(os.environ.get('STRIPPER_INDEX_MAX_AGE', 300)))
+
+# local SQLite copy of all_strippers to serve lookups from, set STRIPPER_REPLICA to its path to turn it on
+stripper_replica = StripperReplica(os.environ.get('STRIPPER_REPLICA'), load_stripper_rows,
+                                   float(os.environ.get('STRIPPER_REPLICA_MAX_AGE', 60)),
+                                   float(os.environ.get('STRIPPER_REPLICA_MAX_LAG', 600)))
 
 
 # ------------------- important functions begin here ------------------- #
 
+def normalize_key(song: str, artist: str) -> Tuple[str, str]:
+    """
+    Normalize a song, artist pair so trivially different spellings of the same song share cache entries.
+    """
+    return spc.sub(' ', unidecode(song)).strip().lower(), spc.sub(' ', unidecode(artist)).strip().lower()
+
+
 def get_github_token() -> str:
     """
     Returns the github auth token, update if expired.
     :return: github token
     """
-    global gh_token, gh_token_expiry
-    # 3 minutes buffer
-    if gh_token_expiry - 180 > time.time():
-        logging.info(f"using github token: {gh_token[:22]}")
-        return gh_token
-    logging.info("updating github token")
-    private_pem = os.environ['PRIVATE_PEM']
-    jwt = get_jwt(os.environ['APP_ID'], private_pem)
-    response = get_installation_access_token(jwt, os.environ['INST_ID']).json()
-    gh_token = response["token"]
-    gh_token_expiry = dt.strptime(response["expires_at"], "%Y-%m-%dT%H:%M:%S%z").timestamp()
-    logging.info(f"github token updated: {gh_token[:22]}")
-    return gh_token
+    return github_tokens.get()
 
 
 def get_spotify_token() -> str:
@@ -123,18 +238,13 @@ def get_spotify_token() -> str:
     Return the spotify auth token, update if expired.
     :return: spotify token
     """
-    global spotify_token, spotify_token_expiry
-    # check if token expired ( - 300 to add buffer of 5 minutes)
-    if spotify_token_expiry - 300 > time.time():
-        logging.info(f'using spotify token: {spotify_token[:41]}')
-        return spotify_token
-    r = requests.post('https://accounts.spotify.com/api/token', data={
-        'grant_type': 'client_credentials'}, auth=HTTPBasicAuth(os.environ['C_ID'], os.environ['SECRET']))
-    spotify_token = r.json()['access_token']
-    # token valid for an hour
-    spotify_token_expiry = time.time() + 3600
-    logging.info(f'updated spotify token: {spotify_token[:41]}')
-    return spotify_token
+    return spotify_tokens.get()
+
+
+class GeniusUnavailable(Exception):
+    """
+    Genius couldn't be searched, as opposed to a search without a matching hit.
+    """
 
 
 def genius_stripper(song: str, artist: str) -> Optional[str]:
@@ -147,6 +257,18 @@ def genius_stripper(song: str, artist: str) -> Optional[str]:
     :param artist: the artist
     :return: stripper
     """
+    try:
+        return search_genius_stripper(song, artist)
+    except GeniusUnavailable as e:
+        logging.warning(f'genius search failed: {e}')
+        return None
+
+
+def search_genius_stripper(song: str, artist: str) -> Optional[str]:
+    """
+    Same as `genius_stripper` but raises GeniusUnavailable if Genius returned an error or couldn't be reached, so
+    failures can be told apart from songs Genius doesn't have.
+    """
     title = f'{song} by {artist}'
     logging.info(f'getting stripper from Genius for {title}')
     url = 'https://api.genius.com/search'
@@ -154,43 +276,40 @@ def genius_stripper(song: str, artist: str) -> Optional[str]:
     song = spc.sub(' ', aug.sub('', song))  # strip extra info from song and combine spaces
     logging.info(f'stripped song: {song}')
     params = {'q': f'{song} {artist}'}
-    r = requests.get(url, params=params, headers=headers)
-    # remove punctuation before comparison
-    title = re.sub(alg, '', title)
-    logging.info(f'stripped title: {title}')
-
-    words = title.split()
-    max_err = len(words) // 2
-
-    # allow half length mismatch
-    logging.info(f'max_err is set to {max_err}')
-
-    if r.status_code == 200:
+    try:
+        r = http_client.get(url, params=params, headers=headers)
+    except requests.RequestException as e:
+        raise GeniusUnavailable(repr(e)) from e
+    matcher = TitleMatcher(title, token_similarity)
+    logging.info(f'stripped title: {matcher.title}')
+    logging.info(f'max_err is set to {matcher.max_err}')
+
+    if r.status_code != 200:
+        raise GeniusUnavailable(f'status {r.status_code}')
+    try:
         data = r.json()
-        if data['meta']['status'] == 200:
-            hits = data['response']['hits']
-            for hit in hits:
-                full_title = hit['result']['full_title']
-                logging.info(f'    full title: {full_title}')
-                # remove punctuation before comparison
-                full_title = re.sub(alg, '', full_title)
-                logging.info(f'    stripped full title: {full_title}')
-
-                if not is_title_mismatched(words, full_title, max_err):
-                    # return stripper as no mismatch
-                    if path := gstr.search(hit['result']['path']):
-                        stripper = path.group()
-                        logging.info(f'stripper found: {stripper}')
-                        return stripper
-                    else:
-                        logging.warning(f"Path did not end in lyrics: {hit['result']['path']}")
-            logging.info('stripper not found')
+        if (status := data['meta']['status']) != 200:
+            raise GeniusUnavailable(f'meta status {status}')
+        hits = data['response']['hits']
+    except (ValueError, TypeError, KeyError) as e:
+        raise GeniusUnavailable(f'bad response: {e!r}') from e
+    # best matching title first
+    for i, score in matcher.rank(hit['result']['full_title'] for hit in hits):
+        hit = hits[i]
+        logging.info(f"    full title: {hit['result']['full_title']}, score: {score:.2f}")
+        if path := gstr.search(hit['result']['path']):
+            stripper = path.group()
+            logging.info(f'stripper found: {stripper}')
+            return stripper
+        else:
+            logging.warning(f"Path did not end in lyrics: {hit['result']['path']}")
+    logging.info('stripper not found')
     return None
 
 
 @log_args(max_chars=-1)
 def is_title_mismatched(words: List[str], full_title: str, max_err: int) -> bool:
-    mismatch = [word for word in words if word.lower() not in full_title.lower().split()]
+    mismatch = TitleMatcher(' '.join(words)).mismatches(tokenize(full_title))
     logging.debug(f"broke on {mismatch}")
     return len(mismatch) > max_err
 
@@ -215,8 +334,8 @@ def create_issue(song: str, artist: str, version: str, stripper: str = 'not supp
                 "Accept": "application/vnd.github.machine-man-preview+json"
     }
 
-    r = requests.post('https://api.github.com/repos/SwagLyrics/Swaglyrics-For-Spotify/issues',
-                      headers=headers, json=json)
+    r = http_client.post('https://api.github.com/repos/SwagLyrics/Swaglyrics-For-Spotify/issues',
+                         headers=headers, json=json)
 
     return {
         'status_code': r.status_code,
@@ -224,6 +343,49 @@ def create_issue(song: str, artist: str, version: str, stripper: str = 'not supp
     }
 
 
+def find_issue(song: str, artist: str) -> Optional[str]:
+    """
+    Look for the issue create_issue makes for a song, artist pair on the SwagLyrics for Spotify repo.
+    :param song: the song name
+    :param artist: the artist
+    :return: link to the open issue, None if there's none or GitHub search failed
+    """
+    title = f"{song} by {artist} unsupported."
+    headers = {
+                "Authorization": f"token {get_github_token()}",
+                "Accept": "application/vnd.github.machine-man-preview+json"
+    }
+    r = http_client.get('https://api.github.com/search/issues', headers=headers, params={
+        'q': f'repo:SwagLyrics/SwagLyrics-For-Spotify is:issue is:open in:title "{title}"'})
+    if r.status_code != 200:
+        logging.warning(f'github issue search failed: {r.status_code}')
+        return None
+    for item in r.json()['items']:
+        if item['title'] == title:
+            return item['html_url']
+    return None
+
+
+searching = object()
+
+
+def search_spotify(song: str, artist: str, headers: Dict[str, str]) -> Optional[JSONDict]:
+    """
+    Returns the top Spotify search result for song, artist or None if there were no results, cached for a while.
+
+    Raises KeyError if Spotify returned an error.
+    """
+    # None is cached too, for searches without results
+    if (track := spotify_searches.get((song, artist), searching)) is not searching:
+        return track
+    r = http_client.get('https://api.spotify.com/v1/search', headers=headers, params={'q': f'{song} {artist}',
+                                                                                      'type': 'track'})
+    data = r.json()['tracks']['items']
+    track = data[0] if data else None
+    spotify_searches.set((song, artist), track)
+    return track
+
+
 def check_song(song: str, artist: str) -> bool:
     """
     Check if song, artist pair exist on Spotify or not using the Spotify API. Also checks if song is instrumental
@@ -236,14 +398,11 @@ def check_song(song: str, artist: str) -> bool:
     :return: Boolean depending if it was found on Spotify or not
     """
     headers = {"Authorization": f"Bearer {get_spotify_token()}"}
-    r = requests.get('https://api.spotify.com/v1/search', headers=headers, params={'q': f'{song} {artist}',
-                                                                                   'type': 'track'})
     try:
-        data = r.json()['tracks']['items']
+        track = search_spotify(song, artist, headers)
     except KeyError:
         return False
-    if data:
-        track = data[0]
+    if track:
         logging.info(f"song: {track['name']}, artist: {track['artists'][0]['name']}")
         if track['name'] == song and track['artists'][0]['name'] == artist:
             logging.info(f'{song} and {artist} legit on Spotify')
@@ -256,6 +415,45 @@ def check_song(song: str, artist: str) -> bool:
     return False
 
 
+def fetch_audio_features(track_ids: List[Hashable], headers: Dict[str, str]) -> Dict[Hashable, Optional[JSONDict]]:
+    """
+    Get audio features for tracks from Spotify, using the multi track endpoint when there's more than one.
+
+    Tracks Spotify has no features for map to None. Raises requests.HTTPError if Spotify returned an error.
+    """
+    if len(track_ids) == 1:
+        r = http_client.get(f'https://api.spotify.com/v1/audio-features/{track_ids[0]}', headers=headers)
+        if r.status_code == 404:
+            return {track_ids[0]: None}
+    else:
+        r = http_client.get('https://api.spotify.com/v1/audio-features', headers=headers,
+                            params={'ids': ','.join(map(str, track_ids))})
+    if r.status_code != 200:
+        raise requests.HTTPError(f'spotify audio features failed: {r.status_code}', response=r)
+    if len(track_ids) == 1:
+        return {track_ids[0]: r.json() or None}
+    # features come back in the order they were asked for
+    return dict(zip(track_ids, r.json()['audio_features']))
+
+
+# concurrent instrumental checks share a single audio features request. The checks run on the unsupported job
+# workers, one track each, so requests only get batched with UNSUPPORTED_WORKERS above 1. With a single worker there's
+# no waiting for others to join.
+unsupported_workers = int(os.environ.get('UNSUPPORTED_WORKERS', 1))
+audio_features_loader = BatchLoader(fetch_audio_features, float(os.environ.get('AUDIO_FEATURES_BATCH_WINDOW', 0.05)),
+                                    concurrency=unsupported_workers)
+
+
+def get_audio_features(track_id: str, headers: Dict[str, str]) -> Optional[JSONDict]:
+    """
+    Audio features of a track, cached for a while. Only features Spotify actually returned are cached.
+    """
+    if (features := audio_features.get(track_id)) is None:
+        if (features := audio_features_loader.load(track_id, headers)) is not None:
+            audio_features.set(track_id, features)
+    return features
+
+
 def check_song_instrumental(track: JSONDict, headers: Dict[str, str]) -> bool:
     """
     Helper function to determine if song is instrumental using spotify audio features API.
@@ -264,7 +462,9 @@ def check_song_instrumental(track: JSONDict, headers: Dict[str, str]) -> bool:
     """
     song = track['name']
     artist = track['artists'][0]['name']
-    metadata = requests.get(f'https://api.spotify.com/v1/audio-features/{track["id"]}', headers=headers).json()
+    if (metadata := get_audio_features(track['id'], headers)) is None:
+        logging.warning(f"no audio features for {song} by {artist}, assuming it isn't instrumental")
+        return False
 
     instrumental = False
     instr = metadata["instrumentalness"]
@@ -276,36 +476,292 @@ def check_song_instrumental(track: JSONDict, headers: Dict[str, str]) -> bool:
 
     logging.info(f"{song} by {artist} is{' NOT' if not instrumental else ''} instrumental. Instrumentalness: {instr}, "
                  f"Speechiness: {speechy}")
-    discord_instrumental_logger(song, artist, instrumental, instr, speechy)  # send to discord
+    queue_instrumental_log(song, artist, instrumental, instr, speechy)  # send to discord
 
     return instrumental
 
 
 def check_stripper(song: str, artist: str) -> bool:
     # check if song has a lyrics page on genius
-    r = requests.get(f'https://genius.com/{stripper(song, artist)}-lyrics')
-    return r.status_code == requests.codes.ok
+    r = http_client.get(f'https://genius.com/{stripper(song, artist)}-lyrics')
+    return r.status_code == 200
+
+
+def get_stripper_from_db(song: str, artist: str) -> Optional[str]:
+    """
+    Look up the stripper for a song, artist pair in the database, going through the in-process cache first and the
+    local replica if it's up to date.
+
+    Only hits are cached since strippers are never updated once added, so a cached hit can't go stale.
+    :param song: the song name
+    :param artist: the artist
+    :return: stripper if present in the database
+    """
+    if (cached := stripper_cache.get((song, artist))) is not None:
+        return cached
+    if stripper_replica.fresh:
+        found = stripper_replica.lookup([(song, artist)]).get((song, artist))
+    else:
+        lyrics = Lyrics.query.filter(Lyrics.song == song).filter(Lyrics.artist == artist).first()
+        found = lyrics.stripper if lyrics else None
+    if found:
+        stripper_cache.set((song, artist), found)
+    return found
+
+
+def get_strippers_from_db(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """
+    Look up the strippers for several song, artist pairs at once, with a single query for the ones not cached.
+    :param pairs: list of (song, artist) pairs
+    :return: dict mapping the pairs present in the database to their stripper
+    """
+    found = {}
+    for pair in pairs:
+        if (cached := stripper_cache.get(pair)) is not None:
+            found[pair] = cached
+    missing = [pair for pair in pairs if pair not in found]
+    if missing and stripper_replica.fresh:
+        for pair, replica_stripper in stripper_replica.lookup(missing).items():
+            found[pair] = replica_stripper
+            stripper_cache.set(pair, replica_stripper)
+    elif missing:
+        songs = {song for song, _ in missing}
+        artists = {artist for _, artist in missing}
+        for lyrics in Lyrics.query.filter(Lyrics.song.in_(songs)).filter(Lyrics.artist.in_(artists)):
+            pair = (lyrics.song, lyrics.artist)
+            # first row wins, same as get_stripper_from_db
+            if pair in missing and pair not in found:
+                found[pair] = lyrics.stripper
+                stripper_cache.set(pair, lyrics.stripper)
+    return found
+
+
+def get_fuzzy_stripper(song: str, artist: str) -> Optional[str]:
+    """
+    Look up the stripper of a stored song, artist pair that differs only in case, diacritics, featured artists or
+    extra info like "- Remastered", or is otherwise very close.
+
+    Until the in-memory index has loaded, only the exact normalized key is looked up in the database if it has the
+    norm_key column, and nothing is found otherwise. Near matches aren't cached, a better one may be added any time and
+    stripper_cache only holds real database hits.
+    :param song: the song name
+    :param artist: the artist
+    :return: stripper if a close enough pair is present in the database
+    """
+    if not fuzzy_strippers:
+        return None
+    fuzzy = None
+    if stripper_index.ready:
+        fuzzy = stripper_index.lookup(song, artist)
+    else:
+        stripper_index.refresh_in_background()
+        if norm_key_column:
+            lyrics = Lyrics.query.filter(Lyrics.norm_key == normalize_pair(song, artist)[:512]).first()
+            fuzzy = lyrics.stripper if lyrics else None
+    if fuzzy:
+        logging.info(f'near match stripper for {song} by {artist}: {fuzzy}')
+    return fuzzy
+
+
+def resolve_genius_stripper(song: str, artist: str) -> Optional[str]:
+    """
+    Get a stripper via genius_stripper for a song, artist pair that isn't in the database and log it to Discord.
+
+    Pairs Genius had no match for recently are skipped, and concurrent requests for the same pair share one lookup.
+    Failed searches aren't remembered, so the next request tries again.
+    :param song: the song name
+    :param artist: the artist
+    :return: stripper
+    """
+    key = normalize_key(song, artist)
+    if key in genius_misses:
+        logging.info(f'genius_stripper recently missed {song} by {artist}, skipping')
+        return None
+    return genius_lookups.do(key, _lookup_genius_stripper, song, artist, key)
+
+
+def _lookup_genius_stripper(song: str, artist: str, key: Tuple[str, str]) -> Optional[str]:
+    try:
+        g_stripper = search_genius_stripper(song, artist)
+    except GeniusUnavailable as e:
+        logging.warning(f'genius search for {song} by {artist} failed, not caching: {e}')
+        return None
+    queue_genius_log(song, artist, g_stripper)  # log to discord
+    if not g_stripper:
+        genius_misses.set(key, True)
+    return g_stripper
+
+
+def export_strippers(chunk_size: int = 1000) -> Iterator[str]:
+    """
+    Yields every row of all_strippers as a line of NDJSON, in id order.
+
+    Rows are fetched `chunk_size` at a time by id, so memory stays constant however big the table is and no
+    connection is held open between chunks.
+    """
+    last_id = 0
+    while rows := Lyrics.query.with_entities(Lyrics.id, Lyrics.song, Lyrics.artist, Lyrics.stripper) \
+            .filter(Lyrics.id > last_id).order_by(Lyrics.id).limit(chunk_size).all():
+        for row in rows:
+            yield json.dumps({'song': row.song, 'artist': row.artist, 'stripper': row.stripper}) + '\n'
+        last_id = rows[-1].id
+        db.session.remove()
+
+
+def _import_chunk(rows: List[Tuple[str, str, str]]) -> int:
+    # insert the rows not already in the database in one transaction, returns the number inserted
+    unique: Dict[Tuple[str, str], str] = {}
+    for song, artist, row_stripper in rows:
+        # first row wins, same as get_stripper_from_db
+        unique.setdefault((song, artist), row_stripper)
+    existing = get_strippers_from_db(list(unique))
+    new = [(song, artist, row_stripper) for (song, artist), row_stripper in unique.items()
+           if (song, artist) not in existing]
+    if not new:
+        return 0
+    try:
+        mappings = [{'song': song, 'artist': artist, 'stripper': row_stripper} for song, artist, row_stripper in new]
+        if norm_key_column:
+            for mapping in mappings:
+                mapping['norm_key'] = normalize_pair(mapping['song'], mapping['artist'])[:512]
+        db.session.bulk_insert_mappings(Lyrics, mappings)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for song, artist, row_stripper in new:
+        genius_misses.pop(normalize_key(song, artist))
+        if fuzzy_strippers:
+            stripper_index.add(song, artist, row_stripper)
+    return len(new)
+
+
+def import_strippers(lines: Iterable[Union[str, bytes]], chunk_size: int = 1000) -> Dict[str, int]:
+    """
+    Bulk insert strippers from NDJSON lines like {"song": ..., "artist": ..., "stripper": ...}.
+
+    Lines are inserted `chunk_size` at a time, each chunk in its own transaction. Like /add_stripper a song, artist
+    pair already in the database keeps its stripper, so an import can safely be run again.
+    :return: number of lines added, skipped since already present and invalid
+    """
+    counts = {'added': 0, 'skipped': 0, 'invalid': 0}
+    chunk: List[Tuple[str, str, str]] = []
+
+    def flush() -> None:
+        added = _import_chunk(chunk)
+        counts['added'] += added
+        counts['skipped'] += len(chunk) - added
+        chunk.clear()
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            chunk.append((str(row['song']), str(row['artist']), str(row['stripper'])))
+        except (ValueError, TypeError, KeyError):
+            counts['invalid'] += 1
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    logging.info(f"imported strippers: {counts}")
+    return counts
+
+
+def hit_weighted(limit_items: List[RateLimitItem], scope: str, weight: int) -> bool:
+    """
+    Count `weight` hits against each limit for the client, only if all of them have enough room left.
+
+    The counters are the ones a `limiter.shared_limit` with the same `scope` uses, so the hits count towards it.
+    :return: whether the hits were counted
+    """
+    if not limiter.enabled:
+        return True
+    # same identifiers as Flask-Limiter gives the limit's key
+    args = [get_ipaddr(), scope]
+    if limiter._key_prefix:
+        args.insert(0, limiter._key_prefix)
+    if any(limiter.limiter.get_window_stats(item, *args)[1] < weight for item in limit_items):
+        return False
+    for item in limit_items:
+        for _ in range(weight):
+            limiter.limiter.hit(item, *args)
+    return True
 
 
 def add_stripper_to_db(song: str, artist: str, stripper: str) -> None:
     lyrics = Lyrics(song=song, artist=artist, stripper=stripper)
     db.session.add(lyrics)
     db.session.commit()
+    if stripper_replica.enabled:
+        stripper_replica.add((lyrics.id, song, artist, stripper))
+    stripper_cache.pop((song, artist))
+    genius_misses.pop(normalize_key(song, artist))
+    if fuzzy_strippers:
+        stripper_index.add(song, artist, stripper)
 
 
 def del_line(song: str, artist: str) -> int:
-    # delete song and artist from unsupported.txt
-    with open('unsupported.txt', 'r') as f:
-        lines = f.readlines()
-    with open('unsupported.txt', 'w') as f:
-        cnt = 0
-        for line in lines:
-            if line == f"{song} by {artist}\n":
-                cnt += 1
-                continue
-            f.write(line)
-    # return number of lines deleted
-    return cnt
+    # delete song and artist from unsupported.txt, return number of lines deleted
+    return unsupported.remove(song, artist)
+
+
+def page_args(default_limit: int) -> Tuple[int, int, str]:
+    """
+    Parse the `after` cursor, `limit` and `q` search query args of a page of the unsupported list.
+    """
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', default_limit))
+    except ValueError:
+        abort(400)
+    if after < 0 or not 0 < limit <= list_max_limit:
+        abort(400)
+    return after, limit, request.args.get('q', '').strip()
+
+
+def render_home(after: int = 0, query: str = '') -> str:
+    entries, cursor = unsupported.page(after, home_page_size, query)
+    return render_template('hello.html', unsupported_songs=[line for _, line, _ in entries], next_cursor=cursor,
+                           query=query, total=len(unsupported))
+
+
+def process_unsupported(job: JSONDict) -> str:
+    """
+    Runs the checks for a song reported unsupported by a client in the background and makes an issue if needed.
+    :param job: dict with the song, artist, version and stripper sent by the client
+    :return: message for the client
+    """
+    song, artist, version, stripped = job['song'], job['artist'], job['version'], job['stripper']
+    # check if song exists on spotify and does not have lyrics on genius
+    if check_song(song, artist) and not check_stripper(song, artist):
+        if (song, artist) in unsupported:
+            # an earlier run of this job was cut off after logging the song, it may have made the issue already
+            if link := find_issue(song, artist):
+                logging.info(f'issue for {song} by {artist} already exists: {link}')
+                return f'Created issue on the GitHub repo for {song} by {artist} to investigate further. \n{link}'
+        else:
+            unsupported.add(song, artist)
+
+        issue = create_issue(song, artist, version, stripped)
+
+        if issue['status_code'] == 201:
+            logging.info(f'Created issue on the GitHub repo for {song} by {artist}.')
+            return 'Lyrics for that song may not exist on Genius. ' \
+                   f'Created issue on the GitHub repo for {song} by {artist} to investigate ' \
+                   f'further. \n{issue["link"]}'
+        else:
+            return f'Logged {song} by {artist} in the server.'
+
+    return "That song doesn't seem to exist on Spotify or is instrumental. \n" + gh_issue_text
+
+
+# /unsupported checks run in the background, UNSUPPORTED_WORKERS=0 leaves them to run_pending
+unsupported_jobs = JobQueue(os.environ.get('JOBS_DB', 'jobs.sqlite3'), process_unsupported,
+                            unsupported_workers,
+                            max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 3)))
 
 
 # ------------------- routes begin here ------------------- #
@@ -327,9 +783,7 @@ def update():
     if version < '1.2.0':
         return update_text
 
-    with open('unsupported.txt', 'r', encoding='utf-8') as f:
-        data = f.read()
-    if f'{song} by {artist}' in data:
+    if (song, artist) in unsupported:
         return 'Issue already exists on the GitHub repo. \n' \
                'https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues'
 
@@ -337,35 +791,48 @@ def update():
     if re.fullmatch(asrg, unidecode(f"{song} {artist}")):
         return f'Lyrics for {song} by {artist} may not exist on Genius.\n' + gh_issue_text
 
-    # check if song exists on spotify and does not have lyrics on genius
-    if check_song(song, artist) and not check_stripper(song, artist):
-        with open('unsupported.txt', 'a', encoding='utf-8') as f:
-            f.write(f'{song} by {artist}\n')
+    job_id, created = unsupported_jobs.submit(f'{song} by {artist}', {
+        'song': song, 'artist': artist, 'version': version, 'stripper': stripped
+    })
+    logging.info(f"{'queued' if created else 'already queued'} job {job_id} for {song} by {artist}")
+    return f'Checking {song} by {artist}, the result will be at ' \
+           f'{url_for("unsupported_status", job_id=job_id, _external=True)}'
 
-        issue = create_issue(song, artist, version, stripped)
 
-        if issue['status_code'] == 201:
-            logging.info(f'Created issue on the GitHub repo for {song} by {artist}.')
-            return 'Lyrics for that song may not exist on Genius. ' \
-                   f'Created issue on the GitHub repo for {song} by {artist} to investigate ' \
-                   f'further. \n{issue["link"]}'
-        else:
-            return f'Logged {song} by {artist} in the server.'
+@app.route('/unsupported/list')
+def unsupported_list():
+    """
+    A page of the unsupported list as JSON, oldest first. Pass the returned `next` as `after` to get the next page,
+    and `q` to only get songs containing it.
+    """
+    after, limit, query = page_args(50)
+    entries, cursor = unsupported.page(after, limit, query)
+    return jsonify(items=[{'id': entry_id, 'line': line, 'count': cnt} for entry_id, line, cnt in entries],
+                   next=cursor)
 
-    return "That song doesn't seem to exist on Spotify or is instrumental. \n" + gh_issue_text
+
+@app.route('/unsupported/dump')
+def unsupported_dump():
+    # streamed from the snapshot file a chunk at a time rather than built as one string
+    return Response(stream_with_context(unsupported.iter_text()), mimetype='text/plain')
+
+
+@app.route('/unsupported/<int:job_id>')
+def unsupported_status(job_id: int):
+    if (job := unsupported_jobs.status(job_id)) is None:
+        return jsonify(error=f'no job {job_id}'), 404
+    return jsonify(id=job['id'], status=job['status'], result=job['result'])
 
 
 @app.route("/stripper", methods=["GET", "POST"])
-@limiter.limit("1/5seconds;60/hour;200/day")
+@limiter.limit("1/5seconds")
+@limiter.shared_limit(stripper_limits, scope=stripper_scope)
 def get_stripper():
     song = request.form['song']
     artist = request.form['artist']
-    lyrics = Lyrics.query.filter(Lyrics.song == song).filter(Lyrics.artist == artist).first()
-    if lyrics:
-        return lyrics.stripper
-    g_stripper = genius_stripper(song, artist)
-    discord_genius_logger(song, artist, g_stripper)  # log to discord
-    if g_stripper:
+    if db_stripper := get_stripper_from_db(song, artist) or get_fuzzy_stripper(song, artist):
+        return db_stripper
+    if g_stripper := resolve_genius_stripper(song, artist):
         logging.info(f'using genius_stripper: {g_stripper}')
         return g_stripper
     else:
@@ -373,6 +840,40 @@ def get_stripper():
         return '', 404
 
 
+@app.route("/stripper/batch", methods=["POST"])
+@limiter.limit("1/5seconds")
+def get_stripper_batch():
+    """
+    Resolve strippers for a list of tracks in one request, eg. to prefetch a playlist.
+
+    Takes a JSON body like {"tracks": [{"song": "Miracle", "artist": "Caravan Palace"}, ...]} and returns the tracks
+    in the same order with a `stripper` key, null if not found. Tracks not in the database are looked up on Genius
+    concurrently.
+    """
+    tracks = (request.get_json(silent=True) or {}).get('tracks')
+    if not isinstance(tracks, list) or not 0 < len(tracks) <= batch_max_tracks:
+        abort(400)
+    try:
+        pairs = [(str(track['song']), str(track['artist'])) for track in tracks]
+    except (TypeError, KeyError):
+        abort(400)
+    unique = list(dict.fromkeys(pairs))
+    if not hit_weighted(batch_limits, stripper_scope, len(unique)):
+        return jsonify(error=f'rate limit exceeded for {len(unique)} tracks'), 429
+
+    strippers = get_strippers_from_db(unique)
+    for pair in unique:
+        if pair not in strippers and (fuzzy := get_fuzzy_stripper(*pair)):
+            strippers[pair] = fuzzy
+    misses = [pair for pair in unique if pair not in strippers]
+    for pair, g_stripper in zip(misses, genius_pool.map(lambda pair: resolve_genius_stripper(*pair), misses)):
+        if g_stripper:
+            strippers[pair] = g_stripper
+    logging.info(f'batch resolved {len(strippers)} of {len(unique)} tracks, {len(misses)} via genius')
+    return jsonify(results=[{'song': song, 'artist': artist, 'stripper': strippers.get((song, artist))}
+                            for song, artist in pairs])
+
+
 @app.route("/add_stripper", methods=["GET", "POST"])
 def add_stripper():
     auth = request.form['auth']
@@ -387,11 +888,25 @@ def add_stripper():
            "unsupported.txt"
 
 
+@app.route("/strippers/export")
+def strippers_export():
+    if request.headers.get('Authorization') != passwd:
+        abort(403)
+    return Response(stream_with_context(export_strippers()), mimetype='application/x-ndjson')
+
+
+@app.route("/strippers/import", methods=["POST"])
+def strippers_import():
+    if request.headers.get('Authorization') != passwd:
+        abort(403)
+    # read the body line by line instead of loading it whole
+    return jsonify(import_strippers(request.stream))
+
+
 @app.route("/master_unsupported", methods=["GET", "POST"])
 def master_unsupported():
-    with open('unsupported.txt', 'r') as f:
-        data = f.read()
-    return data
+    version, modified = unsupported.version()
+    return rendered.respond('master_unsupported', version, modified, unsupported.text, 'text/html')
 
 
 # delete song from unsupported.txt when it becomes available
@@ -413,60 +928,62 @@ def github_webhook():
     """
     `github_webhook` function handles all notification from GitHub relating to the org. Documentation for the webhooks
     can be found at https://developer.github.com/webhooks/
+
+    Events are queued to be handled in the background by `handle_issues` and `handle_issue_comment`.
     """
     if request.method != 'POST':
         return 'OK'
     else:
-        not_relevant = "Event type not unsupported song issue closed."
-
         event = request.headers.get('X-GitHub-Event')  # type of event
         payload = validate_request(request)
 
         # Respond to ping as 200 OK
         if event == "ping":
             return json.dumps({'msg': 'pong'})
-
-        elif event == "issues":
-            try:
-                label = payload['issue']['labels'][0]['name']
-                # should be unsupported song for our purposes
-                repo = payload['repository']['name']
-                # should be from the SwagLyrics for Spotify repo
-            except IndexError:
-                return not_relevant
-
-            """
-            If the issue is concerning the `SwagLyrics-For-Spotify repo, the issue is being closed and the issue had
-            the tag `unsupported song` then remove line from unsupported.txt
-            """
-            if payload['action'] == 'closed' and label == 'unsupported song' and repo == 'SwagLyrics-For-Spotify':
-                title = payload['issue']['title']
-                title = wdt.match(title)
-                song, artist = title.groups()
-                logging.info(f'{song} by {artist} is to be deleted.')
-                cnt = del_line(song, artist)
-                return f'Deleted {cnt} instances from unsupported.txt'
-
-        elif event == "issue_comment":
-            # process comment commands
-            if payload['action'] != "created" and payload['repository']['name'] != 'SwagLyrics-For-Spotify':
-                return json.dumps({'msg': 'Not relevant issue comment create; ignoring'})
-
-            comment = payload['comment']
-            if comment['user']['id'] == 27063113 and comment['author_association'] == 'MEMBER':  # id of @aadibajpai
-                if body := stp.match(comment['body']):
-                    cmd, stripper = body.groups()
-                    if cmd == "add":
-                        title = wdt.match(payload['issue']['title'])
-                        song, artist = title.groups()
-                        add_stripper_to_db(song, artist, stripper)
-                        return f"Added {stripper=} for {song} by {artist} to db successfully"
-
+        elif event in ("issues", "issue_comment"):
+            return queue_webhook('issue_closed', event, payload)
         else:
             return json.dumps({'msg': 'Wrong event type'})
 
+
+def handle_issues(payload: JSONDict) -> str:
+    try:
+        label = payload['issue']['labels'][0]['name']
+        # should be unsupported song for our purposes
+        repo = payload['repository']['name']
+        # should be from the SwagLyrics for Spotify repo
+    except IndexError:
         return not_relevant
 
+    """
+    If the issue is concerning the `SwagLyrics-For-Spotify repo, the issue is being closed and the issue had
+    the tag `unsupported song` then remove line from unsupported.txt
+    """
+    if payload['action'] == 'closed' and label == 'unsupported song' and repo == 'SwagLyrics-For-Spotify':
+        if (title := wdt.match(payload['issue']['title'])) is None:
+            return not_relevant
+        song, artist = title.groups()
+        logging.info(f'{song} by {artist} is to be deleted.')
+        cnt = del_line(song, artist)
+        return f'Deleted {cnt} instances from unsupported.txt'
+    return not_relevant
+
+
+def handle_issue_comment(payload: JSONDict) -> str:
+    # process comment commands
+    if payload['action'] != "created" and payload['repository']['name'] != 'SwagLyrics-For-Spotify':
+        return json.dumps({'msg': 'Not relevant issue comment create; ignoring'})
+
+    comment = payload['comment']
+    if comment['user']['id'] == 27063113 and comment['author_association'] == 'MEMBER':  # id of @aadibajpai
+        if body := stp.match(comment['body']):
+            cmd, stripper = body.groups()
+            if cmd == "add" and (title := wdt.match(payload['issue']['title'])):
+                song, artist = title.groups()
+                add_stripper_to_db(song, artist, stripper)
+                return f"Added {stripper=} for {song} by {artist} to db successfully"
+    return not_relevant
+
 
 @app.route('/update_server', methods=['POST'])
 @request_from_github()
@@ -486,27 +1003,74 @@ def update_webhook():
         if payload['ref'] != 'refs/heads/master':
             return json.dumps({'msg': 'Not master; ignoring'})
 
-        repo = git.Repo('/var/www/sites/mysite')
-        origin = repo.remotes.origin
+        return queue_webhook('update_server', event, payload)
+    else:
+        return json.dumps({'msg': "Wrong event type"})
 
-        pull_info = origin.pull()
 
-        if len(pull_info) == 0:
-            return json.dumps({'msg': "Didn't pull any information from remote!"})
-        if pull_info[0].flags > 128:
-            return json.dumps({'msg': "Didn't pull any information from remote!"})
+def handle_push(payload: JSONDict) -> str:
+    repo = git.Repo('/var/www/sites/mysite')
+    origin = repo.remotes.origin
 
-        commit_hash = pull_info[0].commit.hexsha
-        build_commit = f'build_commit = "{commit_hash}"'
-        logging.info(f'{build_commit}')
-        if commit_hash == payload["after"]:
-            # since payload is from github and pull info is what we pulled from git
-            discord_deploy_logger(payload)
-        else:
-            logging.error(f'weird mismatch: {commit_hash=} {payload["after"]=}')
-        return f'Updated PythonAnywhere server to commit {commit_hash}'
+    pull_info = origin.pull()
+
+    if len(pull_info) == 0:
+        return json.dumps({'msg': "Didn't pull any information from remote!"})
+    if pull_info[0].flags > 128:
+        return json.dumps({'msg': "Didn't pull any information from remote!"})
+
+    commit_hash = pull_info[0].commit.hexsha
+    build_commit = f'build_commit = "{commit_hash}"'
+    logging.info(f'{build_commit}')
+    if commit_hash == payload["after"]:
+        # since payload is from github and pull info is what we pulled from git
+        discord_deploy_logger(payload)
     else:
-        return json.dumps({'msg': "Wrong event type"})
+        logging.error(f'weird mismatch: {commit_hash=} {payload["after"]=}')
+    return f'Updated PythonAnywhere server to commit {commit_hash}'
+
+
+webhook_handlers = {
+    ('issue_closed', 'issues'): handle_issues,
+    ('issue_closed', 'issue_comment'): handle_issue_comment,
+    ('update_server', 'push'): handle_push,
+}
+
+
+def process_webhook(job: JSONDict) -> str:
+    """
+    Handles a queued webhook delivery in the background.
+    :param job: dict with the hook it was sent to, the event type and the payload
+    :return: result of the handler
+    """
+    with app.app_context():
+        return webhook_handlers[job['hook'], job['event']](job['payload'])
+
+
+# verified webhook deliveries keyed by X-GitHub-Delivery, so redeliveries of one that was handled are skipped
+webhook_jobs = JobQueue(os.environ.get('WEBHOOK_JOBS_DB', 'webhooks.sqlite3'), process_webhook,
+                        int(os.environ.get('WEBHOOK_WORKERS', 1)),
+                        max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 3)))
+
+
+@app.before_request
+def start_job_workers() -> None:
+    # worker threads start with the first request of each process, so jobs queued before a restart don't wait for a
+    # new one to be submitted
+    unsupported_jobs.start()
+    webhook_jobs.start()
+
+
+def queue_webhook(hook: str, event: str, payload: JSONDict) -> Tuple[Response, int]:
+    """
+    Queue a verified delivery to be handled in the background and acknowledge it straight away, so GitHub doesn't
+    time out and redeliver it.
+    """
+    delivery = request.headers['X-GitHub-Delivery']
+    job_id, created = webhook_jobs.submit(delivery, {'hook': hook, 'event': event, 'payload': payload}, once=True)
+    if not created:
+        logging.info(f'webhook delivery {delivery} was already queued as job {job_id}, skipping')
+    return jsonify(msg='Queued' if created else 'Already queued', job=job_id), 202
 
 
 # returns the latest version of swaglyrics as a string
@@ -534,13 +1098,26 @@ def slow():
     return "24"
 
 
+# Prometheus metrics of every worker process
+@app.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    # Prometheus sends the password as a bearer token
+    if request.headers.get('Authorization') not in (passwd, f'Bearer {passwd}'):
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # Dispatch webpage for website home
 @app.route('/')
 @limiter.exempt
 def hello():
-    with open('unsupported.txt', 'r', encoding="utf-8") as f:
-        data = f.readlines()
-    return render_template('hello.html', unsupported_songs=data)
+    if request.args:
+        # later pages and searches aren't worth caching
+        after, _, query = page_args(home_page_size)
+        return render_home(after, query)
+    version, modified = unsupported.version()
+    return rendered.respond('hello', version, modified, render_home)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from swaglyrics_backend.loggers import JSONDict
+
+
+class JobQueue:
+    """
+    A small job queue persisted in SQLite so jobs survive restarts and can be shared by every worker process.
+
+    Jobs have a `key` and only one queued or running job may exist per key, submitting a duplicate returns the
+    existing job instead. Jobs are run by `handler` in background threads, the string it returns is stored as the
+    job result.
+
+    The worker running a job renews its lease every `lease / 3` seconds. A job whose lease runs out is assumed to
+    belong to a dead worker and is picked up again, up to `max_attempts` runs in all after which it's marked failed,
+    so handlers should be safe to run again after being cut off part way.
+
+    Worker threads are started by `start`, once per process. Call it when the process starts serving, not only on
+    submit, so jobs left queued by a restart get run.
+    """
+
+    def __init__(self, path: str, handler: Callable[[JSONDict], str], workers: int = 1,
+                 lease: float = 300, retention: float = 7 * 24 * 3600, max_attempts: int = 3) -> None:
+        self.path = path
+        self.handler = handler
+        self.workers = workers
+        self.lease = lease
+        self.retention = retention
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self.create_schema()
+
+    def create_schema(self) -> None:
+        """
+        Create the jobs table if the file is new.
+        """
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, '
+                         'payload TEXT NOT NULL, status TEXT NOT NULL, result TEXT, created REAL, updated REAL, '
+                         'attempts INTEGER NOT NULL DEFAULT 0)')
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_jobs_active_key ON jobs (key) "
+                         "WHERE status IN ('queued', 'running')")
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_key ON jobs (key)')
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # autocommit connection, the schema is made by create_schema
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, key: str, payload: JSONDict, once: bool = False) -> Tuple[int, bool]:
+        """
+        Queue a job unless one with the same key is already queued or running.
+        :param once: also skip keys whose job is done, until it's purged
+        :return: the job id and whether a new job was created
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # so a job can't finish between looking for a done one and queueing another
+            conn.execute('BEGIN IMMEDIATE')
+            done = once and conn.execute("SELECT id FROM jobs WHERE key = ? AND status = 'done' LIMIT 1",
+                                         (key,)).fetchone()
+            if done:
+                job_id, created = done['id'], False
+            else:
+                try:
+                    cur = conn.execute('INSERT INTO jobs (key, payload, status, created, updated) '
+                                       "VALUES (?, ?, 'queued', ?, ?)", (key, json.dumps(payload), now, now))
+                    job_id, created = cur.lastrowid, True
+                except sqlite3.IntegrityError:
+                    row = conn.execute("SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running')",
+                                       (key,)).fetchone()
+                    job_id, created = row['id'], False
+            conn.execute('COMMIT')
+        # a duplicate may be a job left queued by a restart that this process hasn't started working on yet
+        self.start()
+        if created:
+            self._wakeup.set()
+        return job_id, created
+
+    def status(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute('SELECT id, key, status, result, created, updated, attempts FROM jobs WHERE id = ?',
+                               (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        with self._connect() as conn:
+            # take the write lock up front so two workers can't claim the same job
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # abandoned jobs that used up their attempts, probably because they take their worker down with them
+                given_up = conn.execute("UPDATE jobs SET status = 'failed', result = ?, updated = ? "
+                                        "WHERE status = 'running' AND updated < ? AND attempts >= ?",
+                                        (f'gave up after {self.max_attempts} attempts', now, now - self.lease,
+                                         self.max_attempts)).rowcount
+                row = conn.execute("SELECT id, payload FROM jobs WHERE status = 'queued' "
+                                   "OR (status = 'running' AND updated < ?) ORDER BY id LIMIT 1",
+                                   (now - self.lease,)).fetchone()
+                if row:
+                    conn.execute("UPDATE jobs SET status = 'running', updated = ?, attempts = attempts + 1 "
+                                 "WHERE id = ?", (now, row['id']))
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        if given_up:
+            logging.error(f'gave up on {given_up} jobs after {self.max_attempts} attempts')
+        return row
+
+    def _renew(self, job_id: int, finished: threading.Event) -> None:
+        # keep the lease of a running job until it finishes, so slow jobs aren't picked up by another worker
+        while not finished.wait(self.lease / 3):
+            try:
+                with self._connect() as conn:
+                    conn.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'",
+                                 (time.time(), job_id))
+            except sqlite3.Error:
+                logging.exception(f'renewing the lease of job {job_id} failed')
+
+    def _finish(self, job_id: int, status: str, result: str) -> None:
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, result = ?, updated = ? WHERE id = ?',
+                         (status, result, time.time(), job_id))
+
+    def run_pending(self, limit: Optional[int] = None) -> int:
+        """
+        Run queued jobs in the calling thread until none are left or `limit` jobs ran.
+        :return: number of jobs run
+        """
+        ran = 0
+        while limit is None or ran < limit:
+            if (row := self._claim()) is None:
+                break
+            finished = threading.Event()
+            threading.Thread(target=self._renew, args=(row['id'], finished), name=f'jobs-lease-{row["id"]}',
+                             daemon=True).start()
+            try:
+                result = self.handler(json.loads(row['payload']))
+            except Exception as e:
+                logging.exception(f'job {row["id"]} failed')
+                self._finish(row['id'], 'failed', repr(e))
+            else:
+                self._finish(row['id'], 'done', result)
+            finally:
+                finished.set()
+            ran += 1
+        return ran
+
+    def purge(self) -> int:
+        """
+        Delete finished jobs older than the retention period.
+        :return: number of jobs deleted
+        """
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                               (time.time() - self.retention,))
+        return cur.rowcount
+
+    def start(self) -> None:
+        """
+        Start the worker threads in this process if they aren't running yet. Cheap enough to call on every request.
+        """
+        # threads don't survive a fork so track the pid the workers were started in
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self.workers <= 0 or self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f'jobs-{i}', daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if not self.run_pending():
+                    # poll every now and then for jobs queued by other processes
+                    self._wakeup.wait(5)
+                    self._wakeup.clear()
+                    self.purge()
+            except sqlite3.Error:
+                logging.exception('job queue error')
+                time.sleep(5)
@@ -0,0 +1,201 @@
+# ------------------- shared rate limit storage ------------------- #
+# rate limit counters in a memory-mapped file shared by every worker process on a host, so limits hold across workers
+# and reloads without a round trip to Redis. Registered with `limits` as the shm:// scheme, see SharedMemoryStorage.
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from limits.errors import ConfigurationError
+from limits.storage import Storage
+
+MAGIC = b'SWLIMIT1'
+# magic, counter slots, window slots, entries per window
+HEADER = struct.Struct('<8sIII')
+# key digest, count, expiry
+COUNTER = struct.Struct('<16sqd')
+# key digest, expiry, index of the newest entry, number of entries, followed by the entry timestamps
+WINDOW = struct.Struct('<16sdII')
+ENTRY = struct.Struct('<d')
+EMPTY = bytes(16)
+# slots looked at before giving up on finding a free one and evicting
+MAX_PROBE = 32
+
+
+def key_digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+class SharedMemoryStorage(Storage):
+    """
+    Rate limit storage in a memory-mapped file, for the fixed window, elastic window and moving window strategies.
+
+    The file holds two open addressing hash tables keyed by a digest of the rate limit key: `slots` counters for the
+    fixed windows and `windows` ring buffers of up to `capacity` hit timestamps for moving windows, so moving window
+    limits can be at most `capacity` per window. Expired slots are reused, and if the probed slots are all live the
+    one expiring soonest is evicted.
+
+    Every operation holds an fcntl lock on the file, which excludes other processes, along with a thread lock. The
+    sizes are fixed when the file is created, an existing file keeps its own.
+
+    Configured with a URI like `shm:///run/swaglyrics/limits?slots=65536&windows=1024&capacity=1024`.
+    """
+
+    STORAGE_SCHEME = ['shm']
+
+    def __init__(self, uri: Optional[str] = None, slots: int = 65536, windows: int = 1024, capacity: int = 1024,
+                 **options: Any) -> None:
+        super().__init__(uri)
+        parts = urlsplit(uri or '')
+        # shm:///abs/path or shm://relative/path
+        self.path = parts.netloc + parts.path
+        if not self.path:
+            raise ConfigurationError(f'shm:// storage needs a file path, got {uri}')
+        query = {name: int(values[0]) for name, values in parse_qs(parts.query).items()}
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._file_lock():
+            if os.fstat(self.fd).st_size == 0:
+                slots, windows, capacity = query.get('slots', slots), query.get('windows', windows), \
+                    query.get('capacity', capacity)
+                os.ftruncate(self.fd, HEADER.size + slots * COUNTER.size
+                             + windows * (WINDOW.size + capacity * ENTRY.size))
+                os.pwrite(self.fd, HEADER.pack(MAGIC, slots, windows, capacity), 0)
+            magic, self.slots, self.windows, self.capacity = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+        if magic != MAGIC:
+            raise ConfigurationError(f'{self.path} is not a rate limit storage file')
+        self.mm = mmap.mmap(self.fd, 0)
+        self.window_size = WINDOW.size + self.capacity * ENTRY.size
+        self.windows_start = HEADER.size + self.slots * COUNTER.size
+        # the thread lock could be held by a thread that doesn't exist in the child, fcntl locks aren't inherited
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self.lock = threading.RLock()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _locked(self) -> Iterator[float]:
+        with self.lock, self._file_lock():
+            yield time.time()
+
+    def _find(self, start: int, count: int, size: int, expiry_at: int, digest: bytes, now: float) -> Tuple[int, bool]:
+        """
+        Look for `digest` in a table of `count` slots of `size` bytes at `start`.
+        :return: the offset of its slot, or of the slot to claim for it if it has none, and whether it was found
+        """
+        first = int.from_bytes(digest[:8], 'little') % count
+        free = None
+        evict, evict_expiry = start + first * size, float('inf')
+        for i in range(min(count, MAX_PROBE)):
+            offset = start + (first + i) % count * size
+            slot_digest = self.mm[offset:offset + 16]
+            if slot_digest == digest:
+                return offset, True
+            if slot_digest == EMPTY:
+                # the end of the probe sequence, the key can't be further along
+                return (offset if free is None else free), False
+            expiry = ENTRY.unpack_from(self.mm, offset + expiry_at)[0]
+            if expiry <= now and free is None:
+                free = offset
+            if expiry < evict_expiry:
+                evict, evict_expiry = offset, expiry
+        return (evict if free is None else free), False
+
+    def _counter(self, key: str, now: float) -> Tuple[int, int, float]:
+        """
+        Returns the offset of the counter for `key`, its count and expiry, zero if it's missing or expired.
+        """
+        offset, found = self._find(HEADER.size, self.slots, COUNTER.size, 24, key_digest(key), now)
+        if not found:
+            return offset, 0, 0.0
+        _, count, expiry = COUNTER.unpack_from(self.mm, offset)
+        return (offset, count, expiry) if expiry > now else (offset, 0, 0.0)
+
+    def _window(self, key: str, now: float, cutoff: float) -> Tuple[int, int, int]:
+        """
+        Returns the offset of the window for `key` with the index of its newest entry and the number of entries
+        after `cutoff`, zero if it's missing.
+        """
+        offset, found = self._find(self.windows_start, self.windows, self.window_size, 16, key_digest(key), now)
+        if not found:
+            return offset, 0, 0
+        _, _, head, count = WINDOW.unpack_from(self.mm, offset)
+        # entries are in time order, drop the expired ones from the oldest end
+        while count and self._entry(offset, head - count + 1) < cutoff:
+            count -= 1
+        return offset, head, count
+
+    def _entry(self, offset: int, index: int) -> float:
+        return ENTRY.unpack_from(self.mm, offset + WINDOW.size + index % self.capacity * ENTRY.size)[0]
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False) -> int:
+        with self._locked() as now:
+            offset, count, expires = self._counter(key, now)
+            count += 1
+            if elastic_expiry or count == 1:
+                expires = now + expiry
+            COUNTER.pack_into(self.mm, offset, key_digest(key), count, expires)
+            return count
+
+    def get(self, key: str) -> int:
+        with self._locked() as now:
+            return self._counter(key, now)[1]
+
+    def get_expiry(self, key: str) -> int:
+        with self._locked() as now:
+            expires = self._counter(key, now)[2]
+            return int(expires) if expires else -1
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, no_add: bool = False) -> bool:
+        if limit > self.capacity:
+            raise ConfigurationError(f'moving window limit of {limit} is over the storage capacity {self.capacity}')
+        with self._locked() as now:
+            offset, head, count = self._window(key, now, now - expiry)
+            acquired = count < limit
+            if acquired and not no_add:
+                head, count = (head + 1) % self.capacity, count + 1
+                ENTRY.pack_into(self.mm, offset + WINDOW.size + head * ENTRY.size, now)
+            WINDOW.pack_into(self.mm, offset, key_digest(key), now + expiry if count else 0.0, head, count)
+            return acquired
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> Tuple[int, int]:
+        """
+        :return: time of the oldest entry in the window, or now if it's empty, and the number of entries
+        """
+        with self._locked() as now:
+            offset, head, count = self._window(key, now, now - expiry)
+            if not count:
+                return int(now), 0
+            return int(self._entry(offset, head - count + 1)), count
+
+    def clear(self, key: str) -> None:
+        # slots keep their digest so probe sequences running through them aren't cut short
+        digest = key_digest(key)
+        with self._locked() as now:
+            offset, found = self._find(HEADER.size, self.slots, COUNTER.size, 24, digest, now)
+            if found:
+                COUNTER.pack_into(self.mm, offset, digest, 0, 0.0)
+            offset, found = self._find(self.windows_start, self.windows, self.window_size, 16, digest, now)
+            if found:
+                WINDOW.pack_into(self.mm, offset, digest, 0.0, 0, 0)
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> None:
+        with self._locked():
+            self.mm[HEADER.size:] = bytes(len(self.mm) - HEADER.size)
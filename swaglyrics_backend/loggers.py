@@ -1,13 +1,19 @@
 # ------------------- discord logging functions ------------------- #
 # https://discordapp.com/developers/docs/resources/webhook#execute-webhook
 
+import json as json_lib
 import logging
 import os
+import queue
+import threading
+import time
 from datetime import datetime as dt
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 
 import requests
 
+from swaglyrics_backend import http_client
+
 # define a JSON-like Dict type hint
 JSONDict = Dict[str, Any]
 
@@ -38,18 +44,17 @@ def discord_deploy_logger(payload: JSONDict) -> None:
         }]
     }
 
-    r = requests.post(url, json=json)
+    r = http_client.post(url, json=json)
     if r.status_code == requests.codes.ok:
         logging.info("sent discord message")
     else:
         logging.error(f"discord message send failed: {r.status_code}")
 
 
-def discord_genius_logger(song: str, artist: str, g_stripper: Optional[str]) -> None:
+def genius_embed(song: str, artist: str, g_stripper: Optional[str]) -> JSONDict:
     """
-    sends message to Discord server when stripper resolved using the backend.
+    builds the embed sent to Discord when stripper resolved using the backend.
     """
-    url = f"https://discord.com/api/webhooks/{os.environ['DISCORD_URL_GENIUS']}?wait=true"
     title = f"Genius Stripper for {song} by {artist}."
     if g_stripper:
         desc = f"Found! {g_stripper}"
@@ -60,53 +65,184 @@ def discord_genius_logger(song: str, artist: str, g_stripper: Optional[str]) ->
         color = 15158332  # red
         lyrics_url = ""
 
-    json = {
-        "embeds": [{
-            "title": title,
-            "description": desc,
-            "url": lyrics_url,
-            "timestamp": str(dt.now()),
-            "color": color
-        }]
+    return {
+        "title": title,
+        "description": desc,
+        "url": lyrics_url,
+        "timestamp": str(dt.now()),
+        "color": color
+    }
+
+
+def instrumental_embed(song: str, artist: str,
+                       instrumental: bool, instrumentalness: float, speechiness: float) -> JSONDict:
+    """
+    builds the embed sent to Discord when instrumentalness checked using the backend.
+    """
+    return {
+        "title": f"{song} by {artist}.",
+        "description": f"{'Not ' if not instrumental else ''}Instrumental.",
+        "timestamp": str(dt.now()),
+        "color": 1501879,
+        "fields": [
+            {
+                "name": "`Instrumentalness`",
+                "value": str(instrumentalness)
+            },
+            {
+                "name": "`Speechiness`",
+                "value": str(speechiness)
+            }
+        ]
     }
 
-    r = requests.post(url, json=json)
-    if r.status_code == requests.codes.ok:
-        logging.info("sent discord genius message")
-    else:
-        logging.error(f"discord genius message send failed: {r.status_code}")
 
+# ------------------- background delivery ------------------- #
 
-def discord_instrumental_logger(song: str, artist: str,
-                                instrumental: bool, instrumentalness: float, speechiness: float) -> None:
+class DiscordQueue:
     """
-    sends message to Discord server when instrumentalness checked using the backend.
+    Delivers embeds to Discord from a background thread so request handlers never wait on Discord.
+
+    Embeds queued for the same webhook are coalesced into messages of up to 10 embeds, which is the most Discord
+    accepts per message. A 429 is retried after the `Retry-After` it comes with. When the queue is full, embeds are
+    spilled to `spill_path` as JSON lines and queued again once the backlog clears, or dropped if no path is set.
+
+    Webhooks are stored as the name of the env variable holding them so no webhook secret is ever written to disk.
     """
-    # https://discordapp.com/developers/docs/resources/webhook#execute-webhook
-    url = f"https://discord.com/api/webhooks/{os.environ['DISCORD_URL_INSTRUMENTAL']}?wait=true"
-    title = f"{song} by {artist}."
 
-    json = {
-        "embeds": [{
-            "title": title,
-            "description": f"{'Not ' if not instrumental else ''}Instrumental.",
-            "timestamp": str(dt.now()),
-            "color": 1501879,
-            "fields": [
-                {
-                    "name": "`Instrumentalness`",
-                    "value": str(instrumentalness)
-                },
-                {
-                    "name": "`Speechiness`",
-                    "value": str(speechiness)
-                }
-            ]
-        }]
-    }
+    max_embeds = 10
+    max_attempts = 5
 
-    r = requests.post(url, json=json)
-    if r.status_code == requests.codes.ok:
-        logging.info("sent discord instrumental message")
-    else:
-        logging.error(f"discord instrumental message send failed: {r.status_code}")
+    def __init__(self, maxsize: int = 1000, spill_path: Optional[str] = None, autostart: bool = True) -> None:
+        self.queue: 'queue.Queue[Tuple[str, JSONDict]]' = queue.Queue(maxsize)
+        self.spill_path = spill_path
+        self.autostart = autostart
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        # threads don't survive a fork so track the pid the worker was started in
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='discord-queue', daemon=True).start()
+
+    def put(self, webhook_env: str, embed: JSONDict) -> None:
+        """
+        Queue an embed for the webhook in env variable `webhook_env`, never blocks.
+        """
+        if self.autostart:
+            self.start()
+        try:
+            self.queue.put_nowait((webhook_env, embed))
+        except queue.Full:
+            self._spill([(webhook_env, embed)])
+
+    def _spill(self, items: List[Tuple[str, JSONDict]]) -> None:
+        if not self.spill_path:
+            logging.warning(f"discord queue full, dropped {len(items)} embeds")
+            return
+        with self._lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+            for webhook_env, embed in items:
+                f.write(json_lib.dumps({'webhook': webhook_env, 'embed': embed}) + '\n')
+        logging.warning(f"discord queue full, spilled {len(items)} embeds to {self.spill_path}")
+
+    def _unspill(self) -> None:
+        # queue spilled embeds again, whatever doesn't fit gets spilled back
+        if not self.spill_path:
+            return
+        with self._lock:
+            try:
+                os.replace(self.spill_path, f'{self.spill_path}.sending')
+            except FileNotFoundError:
+                return
+        items = []
+        with open(f'{self.spill_path}.sending', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    item = json_lib.loads(line)
+                    items.append((item['webhook'], item['embed']))
+                except (ValueError, TypeError, KeyError):
+                    if line.strip():
+                        logging.error(f"dropped bad discord spill line: {line[:200]!r}")
+        os.remove(f'{self.spill_path}.sending')
+        for webhook_env, embed in items:
+            self.put(webhook_env, embed)
+
+    def _run(self) -> None:
+        # this is the only sender, it must outlive anything a single message can throw
+        while True:
+            try:
+                try:
+                    batch = [self.queue.get(timeout=30)]
+                except queue.Empty:
+                    self._unspill()
+                    continue
+                self.flush(batch)
+                if self.queue.empty():
+                    self._unspill()
+            except Exception:
+                logging.exception("discord queue failed, carrying on")
+
+    def flush(self, batch: Optional[List[Tuple[str, JSONDict]]] = None) -> None:
+        """
+        Send `batch` along with everything currently queued.
+        """
+        batch = batch or []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        by_webhook: Dict[str, List[JSONDict]] = {}
+        for webhook_env, embed in batch:
+            by_webhook.setdefault(webhook_env, []).append(embed)
+        for webhook_env, embeds in by_webhook.items():
+            for i in range(0, len(embeds), self.max_embeds):
+                self.send(webhook_env, embeds[i:i + self.max_embeds])
+
+    def send(self, webhook_env: str, embeds: List[JSONDict]) -> bool:
+        """
+        Send one message, any error drops it.
+        :return: whether it was sent
+        """
+        if (webhook := os.environ.get(webhook_env)) is None:
+            logging.error(f"discord webhook {webhook_env} is not set, dropped {len(embeds)} embeds")
+            return False
+        url = f"https://discord.com/api/webhooks/{webhook}?wait=true"
+        for _ in range(self.max_attempts):
+            try:
+                r = http_client.post(url, json={"embeds": embeds})
+                if r.status_code != 429:
+                    break
+                retry_after = float(r.headers.get('Retry-After', 1))
+            except Exception as e:
+                logging.error(f"discord message send failed: {e!r}")
+                return False
+            logging.warning(f"discord rate limited, retrying in {retry_after}s")
+            time.sleep(retry_after)
+        if r.status_code == requests.codes.ok:
+            logging.info(f"sent discord message with {len(embeds)} embeds")
+            return True
+        logging.error(f"discord message send failed: {r.status_code}")
+        return False
+
+
+discord_queue = DiscordQueue(int(os.environ.get('DISCORD_QUEUE_SIZE', 1000)), os.environ.get('DISCORD_SPILL_PATH'))
+
+
+def queue_genius_log(song: str, artist: str, g_stripper: Optional[str]) -> None:
+    """
+    queues message to Discord server when stripper resolved using the backend.
+    """
+    discord_queue.put('DISCORD_URL_GENIUS', genius_embed(song, artist, g_stripper))
+
+
+def queue_instrumental_log(song: str, artist: str,
+                           instrumental: bool, instrumentalness: float, speechiness: float) -> None:
+    """
+    queues message to Discord server when instrumentalness checked using the backend.
+    """
+    discord_queue.put('DISCORD_URL_INSTRUMENTAL',
+                      instrumental_embed(song, artist, instrumental, instrumentalness, speechiness))
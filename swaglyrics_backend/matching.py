@@ -0,0 +1,62 @@
+import re
+from difflib import SequenceMatcher
+from typing import FrozenSet, Iterable, List, Tuple
+
+# remove punctuation before comparison
+alg = re.compile(r'[^\sa-zA-Z0-9]+')
+
+
+def tokenize(title: str) -> FrozenSet[str]:
+    return frozenset(alg.sub('', title).lower().split())
+
+
+class TitleMatcher:
+    """
+    Matches a `song by artist` title against the full titles of Genius search hits.
+
+    The title is tokenized once. A hit matches if at most half the words of the title are missing from it, which is
+    not very strict so as to reduce false negatives. Matching hits are ranked by the overlap between the two token
+    sets so the closest title wins, rather than just the first one that's close enough.
+
+    With `token_similarity` below 1, a word also counts as present if a token of the hit is at least that similar to
+    it, eg. 0.8 lets `colour` match `color`.
+    """
+
+    def __init__(self, title: str, token_similarity: float = 1.0) -> None:
+        self.title = alg.sub('', title)
+        self.words = [word.lower() for word in self.title.split()]
+        self.tokens = frozenset(self.words)
+        # allow half length mismatch
+        self.max_err = len(self.words) // 2
+        self.token_similarity = token_similarity
+
+    def _has(self, word: str, tokens: FrozenSet[str]) -> bool:
+        if word in tokens:
+            return True
+        if self.token_similarity >= 1:
+            return False
+        return any(SequenceMatcher(None, word, token).ratio() >= self.token_similarity for token in tokens)
+
+    def mismatches(self, tokens: FrozenSet[str]) -> List[str]:
+        return [word for word in self.words if not self._has(word, tokens)]
+
+    def score(self, tokens: FrozenSet[str]) -> float:
+        """
+        Jaccard similarity of the title and hit tokens.
+        """
+        if not tokens and not self.tokens:
+            return 1.0
+        return len(self.tokens & tokens) / len(self.tokens | tokens)
+
+    def rank(self, full_titles: Iterable[str]) -> List[Tuple[int, float]]:
+        """
+        Scores every title in one pass.
+        :return: (index, score) of the matching titles, best first and in original order when tied
+        """
+        ranked = []
+        for i, full_title in enumerate(full_titles):
+            tokens = tokenize(full_title)
+            if len(self.mismatches(tokens)) <= self.max_err:
+                ranked.append((i, self.score(tokens)))
+        ranked.sort(key=lambda match: -match[1])
+        return ranked
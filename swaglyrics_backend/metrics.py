@@ -0,0 +1,251 @@
+# ------------------- prometheus metrics ------------------- #
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+#
+# every worker process keeps its own counters and histograms in memory, recording is a dict update under a lock.
+# with METRICS_DIR set, each process also dumps a snapshot to METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL
+# seconds and /metrics adds up the snapshots of all processes, so any worker can serve the totals. Snapshots that
+# haven't been rewritten for a few intervals belong to workers that are gone and are deleted.
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# label name, value pairs sorted by name
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DESCRIPTIONS = {
+    'swaglyrics_http_request_duration_seconds': ('histogram', 'Time spent handling requests by route.'),
+    'swaglyrics_upstream_request_duration_seconds': ('histogram', 'Time spent on calls to Genius, Spotify, GitHub '
+                                                                  'and Discord, retries included.'),
+    'swaglyrics_db_query_duration_seconds': ('histogram', 'Time spent on database queries by statement type.'),
+    'swaglyrics_cache_requests_total': ('counter', 'In-process cache lookups by result.'),
+    'swaglyrics_coalesced_calls_total': ('counter', 'Calls that waited on a concurrent call for the same key instead '
+                                                    'of making their own.'),
+}
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+class Metrics:
+    """
+    Counters and histograms rendered in the Prometheus text format.
+
+    Histograms are stored as per bucket counts followed by the sum and the count of observations.
+    """
+
+    def __init__(self, directory: Optional[str] = None, interval: float = 15, buckets: Tuple[float, ...] = BUCKETS,
+                 enabled: bool = True) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.buckets = buckets
+        self.enabled = enabled
+        # intervals a snapshot can go without being rewritten before it's taken for an exited worker's
+        self.stale_after = 4
+        self.counters: Dict[Key, float] = {}
+        self.histograms: Dict[Key, List[float]] = {}
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        # a forked worker starts from zero instead of counting its parent's requests again
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if (hist := self.histograms.get(key)) is None:
+                hist = self.histograms[key] = [0] * (len(self.buckets) + 3)
+            # buckets are counted individually here and made cumulative when rendered
+            hist[bisect_left(self.buckets, value)] += 1
+            hist[-2] += value
+            hist[-1] += 1
+        self.start()
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[Dict[str, str]]:
+        """
+        Observe the time spent in the block. Labels can be added to the yielded dict, eg. once a status is known.
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def dump(self) -> None:
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def start(self) -> None:
+        # threads don't survive a fork so track the pid the dumping thread was started in
+        if not self.directory or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._run, name='metrics', daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.dump()
+            except OSError:
+                logging.exception('metrics dump failed')
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """
+        Returns the snapshots of every live process, the current one being up to date.
+
+        Live processes rewrite their snapshot every interval, older ones are from processes that exited and are
+        deleted. Their age is checked rather than whether the pid is running since pids get reused, and workers in
+        other containers sharing the directory have pids of their own.
+        """
+        if not self.directory:
+            return [self.snapshot()]
+        self.dump()
+        snapshots = []
+        stale_before = time.time() - self.stale_after * self.interval
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                if os.stat(path).st_mtime < stale_before:
+                    os.remove(path)
+                    logging.info(f'removed metrics of exited worker {filename}')
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except FileNotFoundError:
+                # removed by another worker meanwhile
+                continue
+            except (OSError, ValueError):
+                logging.warning(f'skipping unreadable metrics file {filename}')
+        return snapshots
+
+    def render(self) -> str:
+        """
+        Returns the metrics of all processes added up, in the Prometheus text format.
+        """
+        counters: Dict[Key, float] = {}
+        histograms: Dict[Key, List[float]] = {}
+        for snapshot in self.collect():
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                if (total := histograms.get(key)) is None:
+                    histograms[key] = list(values)
+                else:
+                    histograms[key] = [a + b for a, b in zip(total, values)]
+
+        lines: List[str] = []
+        described = set()
+
+        def describe(name: str, kind: str) -> None:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {DESCRIPTIONS.get(name, (kind, name))[1]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, 'counter')
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for (name, labels), values in sorted(histograms.items()):
+            describe(name, 'histogram')
+            cumulative = 0.0
+            for bound, count in zip([*map(str, self.buckets), '+Inf'], values):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels((*labels, ("le", bound)))} {format_value(cumulative)}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(values[-2])}')
+            lines.append(f'{name}_count{format_labels(labels)} {format_value(values[-1])}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(os.environ.get('METRICS_DIR'), float(os.environ.get('METRICS_FLUSH_INTERVAL', 15)),
+                  enabled=bool(int(os.environ.get('METRICS', 1))))
+
+
+def instrument_sqlalchemy() -> None:
+    """
+    Time every query run through SQLAlchemy.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['metrics_start'].pop()
+        metrics.observe('swaglyrics_db_query_duration_seconds', time.perf_counter() - start,
+                        statement=statement.split(None, 1)[0].upper() if statement else '')
+
+
+def instrument_flask(app: Any) -> None:
+    """
+    Time every request by route.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer() -> None:
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def stop_timer(response: Response) -> Response:
+        if (start := g.pop('metrics_start', None)) is not None:
+            # the rule rather than the path so urls with ids don't each get their own series
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.observe('swaglyrics_http_request_duration_seconds', time.perf_counter() - start,
+                            route=route, method=request.method, status=str(response.status_code))
+        return response
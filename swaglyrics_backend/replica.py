@@ -0,0 +1,150 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from swaglyrics_backend.fuzzy import Row
+
+
+class StripperReplica:
+    """
+    A local SQLite copy of all_strippers, so stripper lookups don't have to cross the network to MySQL.
+
+    The copy is refreshed with `load_rows(after_id)`, which returns the rows with an id above `after_id` in id order,
+    so each refresh only fetches the rows added since the last one. Refreshes run in the background once the copy is
+    `max_age` seconds old. The file can be shared by every worker on a node, a worker skips refreshing if another one
+    just did.
+
+    While the copy is less than `max_lag` seconds old it's trusted to have every stripper, misses included, so
+    lookups keep working while MySQL is slow. Once it falls further behind, lookups go back to MySQL until a refresh
+    succeeds.
+    """
+
+    def __init__(self, path: Optional[str], load_rows: Callable[[int], Iterable[Row]], max_age: float = 60,
+                 max_lag: float = 600) -> None:
+        self.path = path or ''
+        self.load_rows = load_rows
+        self.max_age = max_age
+        self.max_lag = max_lag
+        # wall clock time of the last refresh by any worker, read from the file on first use
+        self.synced_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # a read connection per thread, kept open since lookups are on the hot path
+        self._local = threading.local()
+        if self.enabled:
+            self.create_schema()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def create_schema(self) -> None:
+        """
+        Create the tables if the file is new.
+        """
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            # case insensitive like the MySQL collation
+            conn.execute('CREATE TABLE IF NOT EXISTS strippers (id INTEGER PRIMARY KEY, song TEXT NOT NULL '
+                         'COLLATE NOCASE, artist TEXT NOT NULL COLLATE NOCASE, stripper TEXT NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_strippers_song_artist ON strippers (song, artist)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)')
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # autocommit connection for writes, the schema is made by create_schema
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _reader(self) -> sqlite3.Connection:
+        # connections can't be used across a fork, so track the pid each was opened in
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _read_meta(self, conn: sqlite3.Connection, key: str) -> Optional[float]:
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def fresh(self) -> bool:
+        """
+        Whether lookups can be served from the copy, starting a background refresh if it's due.
+        """
+        if not self.enabled:
+            return False
+        if self.synced_at is None:
+            self.synced_at = self._read_meta(self._reader(), 'synced_at') or 0.0
+        age = time.time() - self.synced_at
+        if age > self.max_age:
+            self.refresh_in_background()
+        return age <= self.max_lag
+
+    def refresh(self) -> int:
+        """
+        Copy the rows added since the last refresh.
+        :return: number of rows copied
+        """
+        with self._lock, self._connect() as conn:
+            synced_at = self._read_meta(conn, 'synced_at')
+            if synced_at is not None and time.time() - synced_at < self.max_age:
+                # another worker refreshed meanwhile
+                self.synced_at = synced_at
+                return 0
+            started = time.time()
+            # not MAX(id) of the copy, rows added with add() can be ahead of rows other nodes added meanwhile
+            max_id = int(self._read_meta(conn, 'max_id') or 0)
+            rows = list(self.load_rows(max_id))
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT OR IGNORE INTO strippers (id, song, artist, stripper) VALUES (?, ?, ?, ?)', rows)
+            conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             [('synced_at', started), ('max_id', max([max_id, *(row[0] for row in rows)]))])
+            conn.execute('COMMIT')
+            self.synced_at = started
+        logging.info(f'stripper replica refreshed with {len(rows)} rows')
+        return len(rows)
+
+    def refresh_in_background(self) -> None:
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run() -> None:
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception('stripper replica refresh failed')
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='stripper-replica', daemon=True).start()
+
+    def add(self, row: Row) -> None:
+        """
+        Copy a row added by this worker straight away instead of waiting for the next refresh.
+        """
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO strippers (id, song, artist, stripper) VALUES (?, ?, ?, ?)', row)
+
+    def lookup(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """
+        Look up the strippers for song, artist pairs.
+        :return: dict mapping the pairs present in the copy to their stripper
+        """
+        found = {}
+        conn = self._reader()
+        for song, artist in pairs:
+            # first row wins, same as the database lookup
+            row = conn.execute('SELECT stripper FROM strippers WHERE song = ? AND artist = ? ORDER BY id LIMIT 1',
+                               (song, artist)).fetchone()
+            if row:
+                found[(song, artist)] = row[0]
+        return found
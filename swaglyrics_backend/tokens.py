@@ -0,0 +1,106 @@
+# ------------------- upstream auth tokens ------------------- #
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime as dt
+from typing import Callable, Optional, Tuple
+
+from requests.auth import HTTPBasicAuth
+
+from swaglyrics_backend import http_client
+from swaglyrics_backend.utils import get_jwt, get_installation_access_token
+
+# a token and the unix time it expires at
+Token = Tuple[str, float]
+
+
+class TokenManager:
+    """
+    Keeps an access token fresh for concurrent callers.
+
+    `provider` is called to get a new token. Only one thread refreshes at a time, others wait for it and reuse its
+    token instead of each asking for their own. Once a token is within `refresh_ahead` seconds of expiring it's renewed
+    in a background thread while callers keep using the current one, so requests only wait on a refresh when there's
+    no usable token at all. A token is unusable `margin` seconds before it expires.
+    """
+
+    def __init__(self, name: str, provider: Callable[[], Token], margin: float = 300, refresh_ahead: float = 600,
+                 background: bool = True) -> None:
+        self.name = name
+        self.provider = provider
+        self.margin = margin
+        self.refresh_ahead = refresh_ahead
+        self.background = background
+        self.token = ''
+        self.expiry = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._timer: Optional[threading.Timer] = None
+
+    def get(self) -> str:
+        now = time.time()
+        if self.expiry - self.margin > now:
+            if self.expiry - self.refresh_ahead <= now:
+                self._refresh_in_background()
+            return self.token
+        with self._lock:
+            # another thread may have refreshed while we waited for the lock
+            if self.expiry - self.margin <= time.time():
+                self._refresh()
+            return self.token
+
+    def _refresh(self) -> None:
+        logging.info(f'updating {self.name} token')
+        self.token, self.expiry = self.provider()
+        logging.info(f'{self.name} token updated: {self.token[:22]}')
+        self._schedule()
+
+    def _schedule(self) -> None:
+        # renew ahead of expiry even if no request comes in to notice
+        if not self.background:
+            return
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(self.expiry - self.refresh_ahead - time.time(), 0),
+                                      self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self) -> None:
+        if not self.background or self._refreshing:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._background_refresh, name=f'{self.name}-token', daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            with self._lock:
+                if self.expiry - self.refresh_ahead <= time.time():
+                    self._refresh()
+        except Exception:
+            # the current token is still good, the next request will try again
+            logging.exception(f'{self.name} token background refresh failed')
+        finally:
+            self._refreshing = False
+
+
+def github_app_token() -> Token:
+    """
+    Returns an installation access token for the GitHub App and its expiry.
+    """
+    jwt = get_jwt(os.environ['APP_ID'], os.environ['PRIVATE_PEM'])
+    response = get_installation_access_token(jwt, os.environ['INST_ID']).json()
+    return response["token"], dt.strptime(response["expires_at"], "%Y-%m-%dT%H:%M:%S%z").timestamp()
+
+
+def spotify_client_credentials_token() -> Token:
+    """
+    Returns a Spotify access token from the client credentials flow and its expiry.
+    """
+    r = http_client.post('https://accounts.spotify.com/api/token', data={
+        'grant_type': 'client_credentials'}, auth=HTTPBasicAuth(os.environ['C_ID'], os.environ['SECRET']))
+    data = r.json()
+    # token valid for an hour unless spotify says otherwise
+    return data['access_token'], time.time() + data.get('expires_in', 3600)
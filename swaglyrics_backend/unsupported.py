@@ -0,0 +1,418 @@
+import fcntl
+import logging
+import os
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+# (id, line, count) of an entry in a page of the list
+Entry = Tuple[int, str, int]
+# inode, size and mtime of a file
+Stamp = Tuple[int, int, int]
+
+
+def format_line(song: str, artist: str) -> str:
+    """
+    Returns the line used to record a song, artist pair in unsupported.txt, without the trailing newline.
+    """
+    return f'{song} by {artist}'
+
+
+def file_stamp(path: str) -> Optional[Stamp]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def chunked(pieces: Iterable[str], chunk_size: int) -> Iterator[str]:
+    """
+    Joins consecutive pieces of text into chunks of at least `chunk_size` characters, the last one excepted.
+    """
+    chunk: List[str] = []
+    size = 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+class UnsupportedStore:
+    """
+    In-memory view of unsupported.txt and its change log.
+
+    unsupported.txt holds a snapshot of the list, one `song by artist` line per report. Changes are appended to
+    unsupported.txt.log as `+line` for an add and `-line` for the removal of every instance of a line, so neither
+    costs more than a single append however long the list is. The view is the snapshot with the log folded over it,
+    kept in an insertion ordered dict of line to number of reports. Each access stats both files and only reads what
+    other workers appended to the log since, or everything again if the snapshot was replaced.
+
+    Once the log has `compact_after` entries, a background thread folds it into a new snapshot, written to a temporary
+    file and renamed over unsupported.txt, and empties the log. Appends and reads share a flock on unsupported.txt.lock
+    which compaction takes exclusively, so no worker can append to the log or read half of a compaction.
+
+    Compactions are numbered. The log is first renamed aside to unsupported.txt.log.<number>, and the number of the
+    last compaction folded into the snapshot is saved in unsupported.txt.ids along with the new snapshot's inode. Logs
+    set aside by a compaction that was cut off before its snapshot was in place are folded again on reload, those it
+    finished are skipped, so no entry is lost or applied twice whenever it stops.
+
+    Lines also get an increasing id when first seen, which pages of the list use as a cursor. Log entries are folded
+    in the same order everywhere so every worker hands out the same ids, and compaction saves the ids of the snapshot
+    lines to unsupported.txt.ids so they're kept from then on. Without a matching ids file, as after the snapshot was
+    edited by hand, the snapshot lines are numbered from 1.
+    """
+
+    def __init__(self, path: str = 'unsupported.txt', compact_after: int = 1000, background: bool = True) -> None:
+        self.path = path
+        self.log_path = f'{path}.log'
+        self.ids_path = f'{path}.ids'
+        self.lock_path = f'{path}.lock'
+        self.compact_after = compact_after
+        self.background = background
+        self._lock = threading.RLock()
+        self._index: Dict[str, int] = {}
+        self._ids: Dict[str, int] = {}
+        self._next_id = 1
+        # lines and their ids in order, built when paging and dropped on changes
+        self._order: Optional[Tuple[List[str], List[int]]] = None
+        self._stamp: Optional[Stamp] = None
+        # inode of the log, how far it's been read and how many entries that was
+        self._log_ino: Optional[int] = None
+        self._log_offset = 0
+        self._log_entries = 0
+        # lines the log added to and lines it removed, whose place or count in the view differ from the snapshot
+        self._log_added: Set[str] = set()
+        self._log_removed: Set[str] = set()
+        # snapshot lines whose reports aren't on consecutive lines and whether its last line ends with a newline, both
+        # only happen to snapshots edited by hand
+        self._scattered: Set[str] = set()
+        self._terminated = True
+        # number of the last compaction folded into the snapshot
+        self._compaction = 0
+        self._compacting = False
+
+    @contextmanager
+    def _file_lock(self, operation: int) -> Iterator[None]:
+        # a new open file per lock since threads sharing one would share the lock too
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def _apply(self, op: str, line: str) -> None:
+        if op == '+':
+            if line not in self._index:
+                self._ids[line] = self._next_id
+                self._next_id += 1
+                self._order = None
+            self._index[line] = self._index.get(line, 0) + 1
+        elif op == '-' and self._index.pop(line, None) is not None:
+            self._ids.pop(line)
+            self._order = None
+
+    def _read_log(self) -> None:
+        # apply the entries appended since the last read, a partly written last line is left for next time
+        try:
+            with open(self.log_path, 'rb') as f:
+                self._log_ino = os.fstat(f.fileno()).st_ino
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._log_ino = None
+            return
+        end = data.rfind(b'\n') + 1
+        self._apply_entries(data[:end])
+        self._log_offset += end
+
+    def _apply_entries(self, data: bytes) -> None:
+        for raw in data.splitlines():
+            entry = raw.decode('utf-8')
+            op, line = entry[:1], entry[1:]
+            self._apply(op, line)
+            (self._log_added if op == '+' else self._log_removed).add(line)
+            self._log_entries += 1
+
+    def _aside_logs(self) -> List[Tuple[int, str]]:
+        # logs renamed aside by compactions, with their compaction number, oldest first
+        directory, name = os.path.split(os.path.abspath(self.log_path))
+        aside = []
+        for filename in os.listdir(directory):
+            number = filename[len(name) + 1:]
+            if filename.startswith(f'{name}.') and number.isdigit():
+                aside.append((int(number), os.path.join(directory, filename)))
+        return sorted(aside)
+
+    def _log_changed(self) -> bool:
+        log = file_stamp(self.log_path)
+        return (log and log[0]) != self._log_ino or (log[1] if log else 0) != self._log_offset
+
+    def _refresh(self) -> None:
+        # cheap checks first, the file lock is only taken when there's something to read
+        stamp = file_stamp(self.path)
+        if stamp == self._stamp and not self._log_changed():
+            return
+        with self._file_lock(fcntl.LOCK_SH):
+            stamp = file_stamp(self.path)
+            log = file_stamp(self.log_path)
+            if stamp == self._stamp and log and log[0] == self._log_ino and log[1] >= self._log_offset:
+                self._read_log()
+            else:
+                self._reload()
+
+    def _reload(self) -> None:
+        self._index, self._ids, self._next_id, self._order = {}, {}, 1, None
+        self._log_ino, self._log_offset, self._log_entries = None, 0, 0
+        self._log_added, self._log_removed = set(), set()
+        self._scattered, self._terminated = set(), True
+        self._stamp = file_stamp(self.path)
+        if self._stamp is not None:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                previous = None
+                for raw in f:
+                    line = raw.rstrip('\n')
+                    if line != previous and line in self._index:
+                        self._scattered.add(line)
+                    self._apply('+', line)
+                    previous = line
+                self._terminated = previous is None or raw.endswith('\n')
+        self._compaction = self._load_ids()
+        for number, path in self._aside_logs():
+            if number > self._compaction:
+                # set aside by a compaction that didn't get to replace the snapshot
+                with open(path, 'rb') as f:
+                    self._apply_entries(f.read())
+        self._read_log()
+
+    def _load_ids(self) -> int:
+        # the ids file starts with the number of the last compaction, the inode of the snapshot it wrote and the next
+        # id to hand out, followed by the id of each distinct snapshot line in order. Returns the number of the last
+        # compaction folded into the snapshot.
+        try:
+            with open(self.ids_path, 'r') as f:
+                compaction, snapshot_ino, next_id = [int(n) for n in f.readline().split()]
+                ids = [int(line) for line in f]
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            logging.warning(f'ignoring malformed {self.ids_path}')
+            return 0
+        if self._stamp is None or snapshot_ino != self._stamp[0]:
+            # the compaction was cut off before renaming its snapshot over the previous one
+            logging.warning(f'{self.ids_path} does not match {self.path}, numbering its lines from 1')
+            return compaction - 1
+        if len(ids) != len(self._index):
+            logging.warning(f'{self.ids_path} does not match {self.path}, numbering its lines from 1')
+            return compaction
+        self._ids = dict(zip(self._index, ids))
+        self._next_id = max([next_id, *(i + 1 for i in ids)])
+        return compaction
+
+    @staticmethod
+    def _write_tmp(path: str, text: str) -> Tuple[str, int]:
+        # write to a temporary file to be renamed over `path`, so readers never see a partial file
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+            return tmp, os.fstat(f.fileno()).st_ino
+
+    def _append(self, op: str, line: str) -> None:
+        with self._file_lock(fcntl.LOCK_SH):
+            # a single O_APPEND write doesn't interleave with other workers' entries
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, f'{op}{line}\n'.encode('utf-8'))
+            finally:
+                os.close(fd)
+            self._read_log()
+        if self._log_entries >= self.compact_after:
+            self._compact_in_background()
+
+    def __contains__(self, pair: Tuple[str, str]) -> bool:
+        with self._lock:
+            self._refresh()
+            return format_line(*pair) in self._index
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return sum(self._index.values())
+
+    def add(self, song: str, artist: str) -> None:
+        """
+        Record a song, artist pair as unsupported.
+        """
+        with self._lock:
+            self._refresh()
+            self._append('+', format_line(song, artist))
+
+    def remove(self, song: str, artist: str) -> int:
+        """
+        Remove every instance of a song, artist pair.
+        :return: number of lines removed
+        """
+        line = format_line(song, artist)
+        with self._lock:
+            self._refresh()
+            cnt = self._index.get(line, 0)
+            # logged even if we don't know of the line, another worker may have just added it
+            self._append('-', line)
+            return cnt
+
+    def compact(self) -> None:
+        """
+        Fold the log into a new snapshot and empty it.
+        """
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._reload()
+            if not self._log_entries:
+                return
+            aside = self._aside_logs()
+            number = max([self._compaction, *(n for n, _ in aside)]) + 1
+            if os.path.exists(self.log_path):
+                aside.append((number, f'{self.log_path}.{number}'))
+                os.replace(self.log_path, aside[-1][1])
+            snapshot_tmp, snapshot_ino = self._write_tmp(self.path, self._text())
+            ids_tmp, _ = self._write_tmp(self.ids_path, ''.join(
+                f'{i}\n' for i in [f'{number} {snapshot_ino} {self._next_id}', *map(self._ids.get, self._index)]))
+            # the ids first, a snapshot it doesn't match tells that the compaction was cut off before replacing it
+            os.replace(ids_tmp, self.ids_path)
+            os.replace(snapshot_tmp, self.path)
+            for _, path in aside:
+                os.remove(path)
+            logging.info(f'compacted {self._log_entries} unsupported.txt changes')
+            self._compaction = number
+            self._scattered, self._terminated = set(), True
+            self._stamp = file_stamp(self.path)
+            self._log_ino, self._log_offset, self._log_entries = None, 0, 0
+            self._log_added, self._log_removed = set(), set()
+
+    def _compact_in_background(self) -> None:
+        if not self.background:
+            self.compact()
+            return
+        if self._compacting:
+            return
+        self._compacting = True
+
+        def run() -> None:
+            try:
+                self.compact()
+            except OSError:
+                logging.exception('unsupported.txt compaction failed')
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name='unsupported-compaction', daemon=True).start()
+
+    def _text(self) -> str:
+        return ''.join(f'{line}\n' * cnt for line, cnt in self._index.items())
+
+    def version(self) -> Tuple[str, float]:
+        """
+        Returns a tag that changes whenever the list does, and the unix time it last changed at.
+        """
+        with self._lock:
+            self._refresh()
+            stamps = [stamp for stamp in [self._stamp, file_stamp(self.log_path)] if stamp]
+            if not stamps:
+                return 'empty', 0.0
+            tag = '-'.join(f'{ino:x}-{size:x}-{mtime_ns:x}' for ino, size, mtime_ns in stamps)
+            return tag, max(mtime_ns for _, _, mtime_ns in stamps) / 1e9
+
+    def lines(self) -> List[str]:
+        """
+        Returns all unsupported lines, newline terminated, in the order they were added.
+        """
+        with self._lock:
+            self._refresh()
+            return [f'{line}\n' for line, cnt in self._index.items() for _ in range(cnt)]
+
+    def page(self, after: int = 0, limit: int = 50, query: str = '') -> Tuple[List[Entry], Optional[int]]:
+        """
+        Returns up to `limit` distinct lines with an id above `after`, optionally only those containing `query`
+        ignoring case, and the cursor to pass as `after` for the next page or None if this is the last one.
+        """
+        query = query.casefold()
+        with self._lock:
+            self._refresh()
+            if self._order is None:
+                self._order = list(self._index), [self._ids[line] for line in self._index]
+            lines, ids = self._order
+            entries: List[Entry] = []
+            for i in range(bisect_right(ids, after), len(lines)):
+                if query and query not in lines[i].casefold():
+                    continue
+                if len(entries) == limit:
+                    return entries, entries[-1][0]
+                entries.append((ids[i], lines[i], self._index[lines[i]]))
+            return entries, None
+
+    def iter_text(self, chunk_size: int = 64 * 1024) -> Iterator[str]:
+        """
+        Yields the list in the format of unsupported.txt a chunk at a time.
+
+        The snapshot is streamed from the file, leaving out the lines the log changed, which are written as folded
+        from the log instead. The file is opened under the shared lock and compaction renames a new snapshot over it
+        rather than writing to it, so it's read whole even if compacted meanwhile. The text is the same as `text()`,
+        with every report of a line next to each other and each line ending with a newline.
+        """
+        f: Optional[TextIO]
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._refresh()
+            try:
+                f = open(self.path, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                f = None
+            if f is not None and self._stamp and os.fstat(f.fileno()).st_ino == self._stamp[0]:
+                changed = {line: cnt for line, cnt in self._index.items()
+                           if line in self._log_added or line in self._log_removed or line in self._scattered}
+                removed = set(self._log_removed)
+                terminated = self._terminated
+            else:
+                # no snapshot, or it was replaced by hand since the refresh
+                if f is not None:
+                    f.close()
+                f, changed, removed = None, dict(self._index), set()
+        if f is not None:
+            with f:
+                if not changed and not removed and terminated:
+                    while chunk := f.read(chunk_size):
+                        yield chunk
+                    return
+                yield from chunked(self._snapshot_lines(f, changed, removed), chunk_size)
+        # lines the log added or removed and added back come last, like in the view
+        yield from chunked((f'{line}\n' * cnt for line, cnt in changed.items()), chunk_size)
+
+    @staticmethod
+    def _snapshot_lines(f: TextIO, changed: Dict[str, int], removed: Set[str]) -> Iterator[str]:
+        # the snapshot lines with those the log changed or that are scattered written once at their first place, or
+        # left out if the log removed them. Written lines are taken out of `changed` so only the ones left are written
+        # after the snapshot.
+        written = set()
+        for raw in f:
+            line = raw.rstrip('\n')
+            if line in removed or line in written:
+                continue
+            if line in changed:
+                written.add(line)
+                yield f'{line}\n' * changed.pop(line)
+            else:
+                yield f'{line}\n'
+
+    def text(self) -> str:
+        """
+        Returns the list in the format of unsupported.txt.
+        """
+        with self._lock:
+            self._refresh()
+            return self._text()
@@ -1,38 +1,159 @@
 import hashlib
 import hmac
+import json
 import os
+import threading
 import time
 import jwt
 from functools import wraps
+from io import BytesIO
 from inspect import signature
-from ipaddress import ip_address, ip_network
+from itertools import count
+from ipaddress import ip_address, ip_network, IPv4Address, IPv6Address, IPv4Network, IPv6Network
 from logging import getLogger, _nameToLevel
+from typing import Optional, Tuple, Union
 
 import requests
 from flask import request, abort
 
+from swaglyrics_backend import http_client
+
+logger = getLogger(__name__)
+
+
+class WebhookVerifier:
+    """
+    Checks GitHub webhook signatures, `X-Hub-Signature-256` or the legacy `X-Hub-Signature`.
+
+    The keyed HMACs are set up once and copied for each body, so the secret isn't encoded and hashed again on every
+    delivery. Bodies over `max_body` bytes are turned away before they're read.
+    """
+
+    def __init__(self, secret: str, max_body: int = 5 * 1024 * 1024) -> None:
+        key = secret.encode('latin-1')
+        self.macs = {'sha256': hmac.new(key, digestmod=hashlib.sha256), 'sha1': hmac.new(key, digestmod=hashlib.sha1)}
+        self.max_body = max_body
+
+    def verify(self, signature: Optional[str], body: bytes) -> bool:
+        """
+        :param signature: header value like `sha256=<hex digest>`
+        """
+        algorithm, _, digest = (signature or '').partition('=')
+        if (mac := self.macs.get(algorithm)) is None:
+            return False
+        mac = mac.copy()
+        mac.update(body)
+        return hmac.compare_digest(mac.hexdigest(), digest)
+
+
+# WEBHOOK_MAX_BODY in bytes, GitHub caps payloads at 25MB but ours are a lot smaller
+webhook_verifier = WebhookVerifier(os.environ['WEBHOOK_SECRET'],
+                                   int(os.environ.get('WEBHOOK_MAX_BODY', 5 * 1024 * 1024)))
+
+
+def read_body(req, max_body: int, chunk_size: int = 64 * 1024) -> bytes:
+    """
+    Read the body of a request, aborting with a 413 once it's over `max_body` bytes. Bodies sent chunked, without a
+    Content-Length, are counted as they're read. The body can still be read with get_data() or get_json() after.
+    """
+    if req.content_length is not None:
+        if req.content_length > max_body:
+            abort(413)
+        # the stream stops at the Content-Length, read it once and cache it
+        return req.get_data()
+    chunks = []
+    size = 0
+    while chunk := req.stream.read(min(chunk_size, max_body + 1 - size)):
+        size += len(chunk)
+        if size > max_body:
+            abort(413)
+        chunks.append(chunk)
+    req.stream = BytesIO(b''.join(chunks))
+    return req.get_data()
+
 
 def validate_request(req):
+    """
+    Verify the signature of a webhook delivery and return its JSON payload, parsed from the same read of the body.
+    """
     abort_code = 418
-    x_hub_signature = req.headers.get('X-Hub-Signature')
-    if not is_valid_signature(x_hub_signature, req.data):
-        print(f'Deploy signature failed: {x_hub_signature}')
+    body = read_body(req, webhook_verifier.max_body)
+    # prefer the SHA-256 signature when GitHub sends both
+    signature = req.headers.get('X-Hub-Signature-256') or req.headers.get('X-Hub-Signature')
+    if not webhook_verifier.verify(signature, body):
+        print(f'Deploy signature failed: {signature}')
         abort(abort_code)
 
-    if (payload := request.get_json()) is None:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if payload is None:
         print(f'Payload is empty: {payload}')
         abort(abort_code)
 
     return payload
 
 
-def is_valid_signature(x_hub_signature, data, private_key=os.environ['WEBHOOK_SECRET']):
+def is_valid_signature(x_hub_signature, data, private_key=None):
     """Verify webhook signature"""
-    hash_algorithm, github_signature = x_hub_signature.split('=', 1)
-    algorithm = hashlib.__dict__.get(hash_algorithm)
-    encoded_key = bytes(private_key, 'latin-1')
-    mac = hmac.new(encoded_key, msg=data, digestmod=algorithm)
-    return hmac.compare_digest(mac.hexdigest(), github_signature)
+    verifier = webhook_verifier if private_key is None else WebhookVerifier(private_key)
+    return verifier.verify(x_hub_signature, data)
+
+
+class GitHubHookAllowlist:
+    """
+    The `hooks` CIDR blocks from https://api.github.com/meta, parsed once and kept in memory.
+
+    The list is refreshed in a background thread once it is older than `max_age` seconds, using a conditional request
+    so an unchanged list costs GitHub nothing against our rate limit. If GitHub can't be reached the last known list
+    keeps being used. Only the very first lookup has to wait for the list to be fetched.
+    """
+
+    url = 'https://api.github.com/meta'
+
+    def __init__(self, max_age: float = 3600) -> None:
+        self.max_age = max_age
+        self.networks: Tuple[Union[IPv4Network, IPv6Network], ...] = ()
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self) -> None:
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        try:
+            r = http_client.get(self.url, headers=headers)
+            if r.status_code == 200:
+                self.networks = tuple(ip_network(block) for block in r.json()['hooks'])
+                self.etag = r.headers.get('ETag')
+            elif r.status_code != 304:
+                raise ValueError(f'unexpected status code {r.status_code}')
+            self.fetched_at = time.monotonic()
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logger.warning(f'could not refresh github hook allowlist, using last known list: {e!r}')
+        finally:
+            self._refreshing = False
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name='github-meta-refresh', daemon=True).start()
+
+    def __contains__(self, ip: Union[IPv4Address, IPv6Address]) -> bool:
+        if not self.networks:
+            # nothing to fall back on yet so wait for the list
+            with self._lock:
+                if not self.networks:
+                    self.refresh()
+        elif time.monotonic() - self.fetched_at > self.max_age:
+            self._refresh_in_background()
+        return any(ip in network for network in self.networks)
+
+
+github_hooks = GitHubHookAllowlist(float(os.environ.get('GITHUB_META_MAX_AGE', 3600)))
 
 
 def request_from_github(abort_code=418):
@@ -51,7 +172,7 @@ def request_from_github(abort_code=418):
                     abort(abort_code)
                 if 'X-Github-Delivery' not in request.headers:
                     abort(abort_code)
-                if 'X-Hub-Signature' not in request.headers:
+                if 'X-Hub-Signature-256' not in request.headers and 'X-Hub-Signature' not in request.headers:
                     abort(abort_code)
                 if not request.is_json:
                     abort(abort_code)
@@ -66,14 +187,9 @@ def request_from_github(abort_code=418):
                     ip_header = request.headers['X-Real-IP']
 
                 request_ip = ip_address(u'{0}'.format(ip_header))
-                meta_json = requests.get('https://api.github.com/meta').json()
-                hook_blocks = meta_json['hooks']
 
                 # Check if the POST request is from GitHub
-                for block in hook_blocks:
-                    if ip_address(request_ip) in ip_network(block):
-                        break
-                else:
+                if request_ip not in github_hooks:
                     print(f"Unauthorized attempt to deploy by IP {request_ip}")
                     abort(abort_code)
                 return f(*args, **kwargs)
@@ -83,11 +199,42 @@ def request_from_github(abort_code=418):
     return decorator
 
 
-def log_args(loglevel_name="INFO", max_chars=20):
+class _CallString:
+    """Formats a function call for log_args only when the log record is actually emitted."""
+
+    __slots__ = ('name', 'parameters', 'args', 'kwargs', 'max_chars')
+
+    def __init__(self, name, parameters, args, kwargs, max_chars):
+        self.name = name
+        self.parameters = parameters
+        self.args = args
+        self.kwargs = kwargs
+        self.max_chars = max_chars
+
+    def __str__(self):
+        # map arg- and kwarg-strings to their parameter names
+        parameter_map = (
+                [[param, str(arg)] for arg, param in zip(self.args, self.parameters)] +
+                [[name, str(value)] for name, value in self.kwargs.items()]
+        )
+        # truncate values, if necessary
+        if self.max_chars >= 0:
+            for mapping in parameter_map:
+                if len(mapping[1]) > self.max_chars:
+                    mapping[1] = f"{mapping[1][:self.max_chars]} ..."
+        # build a string representing the call
+        parameter_string = ", ".join(f"{name}={value}" for name, value in parameter_map)
+        return f"    {self.name}({parameter_string})"
+
+
+def log_args(loglevel_name="INFO", max_chars=20, sample_every=1):
     """This decorator logs the arguments passed to a function before calling it.
 
     Default loglevel is INFO and default argument truncation threshold is 20 character. If
-    you want to disable truncation, pass -1 instead.
+    you want to disable truncation, pass -1 instead. Pass sample_every=N to only log one in N calls.
+
+    Nothing is formatted unless the logger is enabled for the level, so the decorator costs next to
+    nothing when the level is filtered out.
     """
     if loglevel_name not in _nameToLevel:
         raise ValueError(
@@ -96,25 +243,13 @@ def log_args(loglevel_name="INFO", max_chars=20):
 
     def outer(func):
         logger = getLogger(func.__module__)
-        parameters = signature(func).parameters
+        parameters = tuple(signature(func).parameters)
+        calls = count()
 
         @wraps(func)
         def inner(*args, **kwargs):
-            # map arg- and kwarg-strings to their parameter names
-            parameter_map = (
-                    [[param[0], str(arg)] for arg, param in zip(args, parameters)] +
-                    [[name, str(value)] for name, value in kwargs.items()]
-            )
-            # truncate values, if necessary. this can probably be handled somewhat nicer.
-            for mapping in parameter_map:
-                if max_chars < 0:
-                    continue
-                if len(mapping[1]) > max_chars:
-                    mapping[1] = f"{mapping[1][:max_chars]} ..."
-            # build a string representing the call ...
-            parameter_string = ", ".join(f"{name}={value}" for name, value in parameter_map)
-            # ... and log it
-            logger.log(loglevel, f"    {func.__name__}({parameter_string})")
+            if logger.isEnabledFor(loglevel) and (sample_every <= 1 or next(calls) % sample_every == 0):
+                logger.log(loglevel, "%s", _CallString(func.__name__, parameters, args, kwargs, max_chars))
             return func(*args, **kwargs)
 
         return inner
@@ -142,7 +277,7 @@ def get_installation_access_token(jwt: str, installation_id):
     access_token_url = f"https://api.github.com/app/installations/{installation_id}/access_tokens"
     headers = {"Authorization": f"Bearer {jwt}",
                "Accept": "application/vnd.github.machine-man-preview+json"}
-    response = requests.post(access_token_url, headers=headers)
+    response = http_client.post(access_token_url, headers=headers)
 
     # example response
     # {
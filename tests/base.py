@@ -12,10 +12,21 @@ def get_spotify_json(filename):
 
 
 def generate_fake_unsupported():
+    for path in os.listdir():
+        # the log, logs set aside by compactions and the ids
+        if path.startswith(('unsupported.txt.log', 'unsupported.txt.ids')):
+            os.remove(path)
     with open('unsupported.txt', 'w') as f:
         f.write('Miracle by Caravan Palace\nSupersonics by Caravan Palace\n')
 
 
+def remove_jobs_db():
+    for name in ['jobs', 'webhooks']:
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(f'{name}.sqlite3{suffix}'):
+                os.remove(f'{name}.sqlite3{suffix}')
+
+
 class TestBase(unittest.TestCase):
     def setUp(self):
         patch.dict(os.environ, {
@@ -33,7 +44,10 @@ class TestBase(unittest.TestCase):
             'PRIVATE_PEM': '',
             'APP_ID': '',
             'INST_ID': '',
-            'SWAG': '69aaa69'
+            'SWAG': '69aaa69',
+            'UNSUPPORTED_WORKERS': '0',  # jobs are run with run_pending
+            'WEBHOOK_WORKERS': '0',
+            'FUZZY_STRIPPERS': '0',  # Lyrics is mocked in most tests
         }).start()
 
         if "/tests" not in os.getcwd():
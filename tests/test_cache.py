@@ -0,0 +1,130 @@
+from unittest.mock import patch
+
+import pytest
+
+from tests.base import TestBase
+
+
+class TestCache(TestBase):
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        from swaglyrics_backend.cache import LRUCache
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1  # a is now most recently used
+        cache.set('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    def test_lru_cache_pop_and_clear(self):
+        from swaglyrics_backend.cache import LRUCache
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.pop('a')
+        cache.pop('not there')
+        assert cache.get('a', 'default') == 'default'
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_lru_cache_disabled_with_zero_size(self):
+        from swaglyrics_backend.cache import LRUCache
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+
+    @patch('swaglyrics_backend.cache.time.monotonic', return_value=1000)
+    def test_ttl_cache_expires_entries(self, fake_time):
+        from swaglyrics_backend.cache import TTLCache
+        cache = TTLCache(2, ttl=60)
+        cache.set('a', 1)
+        assert 'a' in cache
+        fake_time.return_value = 1061
+        assert 'a' not in cache
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_batch_loader_coalesces_concurrent_loads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from swaglyrics_backend.cache import BatchLoader
+        calls = []
+
+        def load_many(keys, suffix):
+            calls.append(sorted(keys))
+            return {key: f'{key}{suffix}' for key in keys}
+
+        loader = BatchLoader(load_many, window=0.1, max_batch=3)
+        with ThreadPoolExecutor(5) as pool:
+            results = list(pool.map(lambda key: loader.load(key, '!'), ['a', 'b', 'c', 'd', 'a']))
+
+        assert results == ['a!', 'b!', 'c!', 'd!', 'a!']
+        assert sorted(key for call in calls for key in call) == ['a', 'b', 'c', 'd']
+        assert max(len(call) for call in calls) <= 3
+
+    def test_batch_loader_stops_waiting_once_every_caller_joined(self):
+        from concurrent.futures import ThreadPoolExecutor
+        import time
+        from swaglyrics_backend.cache import BatchLoader
+        calls = []
+
+        def load_many(keys):
+            calls.append(sorted(keys))
+            return {key: key.upper() for key in keys}
+
+        started = time.monotonic()
+        assert BatchLoader(load_many, window=5, concurrency=1).load('a') == 'A'
+        loader = BatchLoader(load_many, window=5, concurrency=2)
+        with ThreadPoolExecutor(2) as pool:
+            assert list(pool.map(loader.load, ['b', 'c'])) == ['B', 'C']
+        assert time.monotonic() - started < 1
+        assert calls == [['a'], ['b', 'c']]
+
+    def test_batch_loader_raises_for_every_caller(self):
+        from swaglyrics_backend.cache import BatchLoader
+
+        def load_many(keys):
+            raise ValueError('upstream is down')
+
+        with pytest.raises(ValueError):
+            BatchLoader(load_many, window=0).load('a')
+
+    def test_single_flight_shares_one_call(self):
+        from concurrent.futures import ThreadPoolExecutor
+        import threading
+        import time
+        from swaglyrics_backend.cache import SingleFlight
+        flight = SingleFlight('test')
+        calls = []
+        release = threading.Event()
+
+        def lookup(song):
+            calls.append(song)
+            release.wait(5)
+            return f'{song}-lyrics'
+
+        with patch('swaglyrics_backend.cache.metrics') as fake_metrics, ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(flight.do, 'miracle', lookup, 'Miracle') for _ in range(4)]
+            # let the lookup finish once the other three are waiting on it
+            while fake_metrics.inc.call_count < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [f.result() for f in futures]
+
+        assert results == ['Miracle-lyrics'] * 4
+        assert len(calls) == 1
+        # once done the next call runs again
+        assert flight.do('miracle', lookup, 'Miracle') == 'Miracle-lyrics'
+        assert len(calls) == 2
+
+    def test_single_flight_raises_for_every_caller(self):
+        from swaglyrics_backend.cache import SingleFlight
+
+        def lookup():
+            raise ValueError('genius is down')
+
+        with pytest.raises(ValueError):
+            SingleFlight('test').do('miracle', lookup)
@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+from flask import Flask, request
+
+from tests.base import TestBase
+
+
+class TestCapture(TestBase):
+
+    def make_app(self, capture):
+        app = Flask(__name__)
+
+        @app.route('/stripper', methods=['GET', 'POST'])
+        def stripper():
+            return request.form.get('song', '')
+
+        @app.route('/hook', methods=['POST'])
+        def hook():
+            return 'OK'
+
+        capture.instrument(app)
+        return app
+
+    def test_requests_are_captured_with_secrets_redacted(self):
+        from swaglyrics_backend.capture import TrafficCapture, read_capture
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'capture.jsonl')
+            capture = TrafficCapture(path, 'salt')
+            app = self.make_app(capture)
+            with app.test_client() as c:
+                c.post('/stripper', data={'song': 'Miracle', 'artist': 'Caravan Palace', 'auth': 'hunter2'},
+                       environ_base={'REMOTE_ADDR': '1.2.3.4'})
+                c.post('/hook?token=hunter2', json={'action': 'closed'},
+                       headers={'X-GitHub-Event': 'issues', 'Authorization': 'hunter2'})
+            with open(path) as f:
+                raw = f.read()
+            entries = read_capture(path)
+
+        assert 'hunter2' not in raw
+        assert '1.2.3.4' not in raw
+        assert [entry['path'] for entry in entries] == ['/stripper', '/hook']
+        assert entries[0]['form'] == {'song': 'Miracle', 'artist': 'Caravan Palace', 'auth': '[redacted]'}
+        assert entries[0]['client'] == capture.client_id('1.2.3.4')
+        assert entries[0]['status'] == 200
+        assert entries[1]['args'] == {'token': '[redacted]'}
+        assert entries[1]['json'] == {'action': 'closed'}
+        assert entries[1]['github_event'] == 'issues'
+
+    def test_big_json_bodies_are_skipped(self):
+        from swaglyrics_backend.capture import TrafficCapture, read_capture
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'capture.jsonl')
+            app = self.make_app(TrafficCapture(path, 'salt', max_body=10))
+            with app.test_client() as c:
+                c.post('/hook', json={'action': 'closed', 'padding': 'x' * 100})
+            entry, = read_capture(path)
+
+        assert 'json' not in entry
+        assert entry['body_skipped'] > 100
+
+    def test_sampling_and_disabled_capture(self):
+        from swaglyrics_backend.capture import TrafficCapture
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'capture.jsonl')
+            # sampled out, no file, and no salt
+            for capture in [TrafficCapture(path, 'salt', sample=0), TrafficCapture(None, 'salt'),
+                            TrafficCapture(path, '')]:
+                with self.make_app(capture).test_client() as c:
+                    c.post('/stripper', data={'song': 'Miracle'})
+            assert not os.path.exists(path)
+
+    def test_requests_are_served_when_the_capture_cant_be_written(self):
+        from swaglyrics_backend.capture import TrafficCapture
+        with tempfile.TemporaryDirectory() as directory:
+            # the directory the capture goes in is gone
+            capture = TrafficCapture(os.path.join(directory, 'missing', 'capture.jsonl'), 'salt')
+            with self.make_app(capture).test_client() as c:
+                resp = c.post('/stripper', data={'song': 'Miracle'})
+
+        assert resp.status_code == 200
+        assert resp.data == b'Miracle'
+
+    def test_client_ids_depend_on_salt(self):
+        from swaglyrics_backend.capture import TrafficCapture
+        assert TrafficCapture(None, 'a').client_id('1.2.3.4') == TrafficCapture(None, 'a').client_id('1.2.3.4')
+        assert TrafficCapture(None, 'a').client_id('1.2.3.4') != TrafficCapture(None, 'b').client_id('1.2.3.4')
@@ -0,0 +1,223 @@
+import os
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from tests.base import TestBase
+
+rows = [
+    (1, 'Miracle', 'Caravan Palace', 'Caravan-palace-miracle'),
+    (2, 'Hey Jude - Remastered 2015', 'The Beatles', 'The-beatles-hey-jude'),
+    (3, 'Despacito (feat. Daddy Yankee)', 'Luis Fonsi', 'Luis-fonsi-despacito'),
+    (4, 'Miracle', 'Caravan Palace', 'this should not be used'),
+]
+
+
+def load_rows(after_id):
+    return [row for row in rows if row[0] > after_id]
+
+
+@contextmanager
+def sqlite_strippers(norm_key_column):
+    """
+    Point the app at an SQLite all_strippers with the rows above, made like production before or after the norm_key
+    migration.
+    """
+    from swaglyrics_backend import issue_maker
+    from swaglyrics_backend.fuzzy import StripperIndex
+    app, db = issue_maker.app, issue_maker.db
+    config = dict(app.config)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.abspath('strippers.sqlite3')}",
+                      SQLALCHEMY_ENGINE_OPTIONS={})
+    try:
+        with app.app_context():
+            db.drop_all()
+            if norm_key_column:
+                db.create_all()
+            else:
+                db.session.execute('CREATE TABLE all_strippers (id INTEGER PRIMARY KEY, song VARCHAR(4096), '
+                                   'artist VARCHAR(4096), stripper VARCHAR(4096))')
+            with patch.object(issue_maker, 'norm_key_column', norm_key_column):
+                for _, song, artist, stripper in rows:
+                    db.session.add(issue_maker.Lyrics(song, artist, stripper))
+                db.session.commit()
+        issue_maker.stripper_cache.clear()
+        issue_maker.genius_misses.clear()
+        index = StripperIndex(issue_maker.load_stripper_rows)
+        with patch.object(issue_maker, 'fuzzy_strippers', True), \
+                patch.object(issue_maker, 'norm_key_column', norm_key_column), \
+                patch.object(issue_maker, 'stripper_index', index), \
+                patch.object(index, 'refresh_in_background'), \
+                patch.object(issue_maker, 'search_genius_stripper', return_value=None), \
+                patch.object(issue_maker, 'queue_genius_log'):
+            issue_maker.limiter.enabled = False  # disable rate limiting
+            yield index
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.get_engine().dispose()
+        app.config.clear()
+        app.config.update(config)
+        issue_maker.stripper_cache.clear()
+        issue_maker.genius_misses.clear()
+        os.remove('strippers.sqlite3')
+
+
+class TestFuzzy(TestBase):
+
+    def test_normalize_drops_extra_info(self):
+        from swaglyrics_backend.fuzzy import normalize, normalize_pair
+        assert normalize('Hey Jude - Remastered 2015') == 'hey jude'
+        assert normalize('Despacito feat. Daddy Yankee') == 'despacito'
+        assert normalize('Beyoncé  (Live)') == 'beyonce'
+        assert normalize_pair('Miracle', 'Caravan Palace') == 'miracle|caravan palace'
+
+    def test_similarity(self):
+        from swaglyrics_backend.fuzzy import similarity, trigrams
+        assert similarity(trigrams('miracle'), trigrams('miracle')) == 1
+        assert similarity(trigrams('miracle'), trigrams('')) < 0.5
+        assert 0.5 < similarity(trigrams('colour'), trigrams('color')) < 1
+
+    def test_stripper_index_lookup(self):
+        from swaglyrics_backend.fuzzy import StripperIndex
+        index = StripperIndex(load_rows)
+        assert not index.ready
+        assert index.refresh() == 4
+        assert index.ready
+        assert len(index) == 3
+
+        assert index.lookup('MIRACLE', 'caravan palace') == 'Caravan-palace-miracle'
+        assert index.lookup('Hey Jude', 'The Beatles') == 'The-beatles-hey-jude'
+        assert index.lookup('Despacito - Remix', 'Luis Fonsi feat. Justin Bieber') == 'Luis-fonsi-despacito'
+        # close enough song and artist
+        assert index.lookup('Hey Jude', 'The Beatle') == 'The-beatles-hey-jude'
+        assert index.lookup('Miracle', 'Caravan Palac') == 'Caravan-palace-miracle'
+        # too different
+        assert index.lookup('Miracles', 'Caravan Palace') is None
+        assert index.lookup('Miracle', 'Adele') is None
+        assert index.lookup('Lone Digger', 'Caravan Palace') is None
+
+    def test_numbers(self):
+        from swaglyrics_backend.fuzzy import numbers
+        assert numbers('bad habits part 1') == ('1',)
+        assert numbers('nocturne op 9 no two') == ('9', '2')
+        assert numbers('rocky iv') == numbers('rocky 4')
+        assert numbers('i want it that way') == ()
+
+    def test_stripper_index_keeps_numbered_songs_apart(self):
+        from swaglyrics_backend.fuzzy import StripperIndex
+        index = StripperIndex(lambda after_id: [] if after_id else [
+            (1, 'Bad Habits Part 1', 'Artist', 'Artist-bad-habits-part-1'),
+            (2, 'Nocturne Op. 9 No. 1', 'Frederic Chopin', 'Frederic-chopin-nocturne-op-9-no-1'),
+            (3, 'The Search for Everything Wave One', 'John Mayer', 'John-mayer-the-search-for-everything-wave-one'),
+        ])
+        index.refresh()
+        assert index.lookup('Bad Habits Part 2', 'Artist') is None
+        assert index.lookup('Nocturne Op. 9 No. 2', 'Frederic Chopin') is None
+        assert index.lookup('The Search for Everything Wave Two', 'John Mayer') is None
+        # near matches with the same numbers are still found
+        assert index.lookup('Bad Habit Part 1', 'Artist') == 'Artist-bad-habits-part-1'
+
+    def test_stripper_index_threshold(self):
+        from swaglyrics_backend.fuzzy import StripperIndex
+        index = StripperIndex(load_rows, threshold=0.8)
+        index.refresh()
+        assert index.lookup('Miracles', 'Caravan Palace') == 'Caravan-palace-miracle'
+
+    def test_stripper_index_refresh_is_incremental(self):
+        from swaglyrics_backend.fuzzy import StripperIndex
+        index = StripperIndex(load_rows)
+        index.refresh()
+        rows.append((5, 'Lone Digger', 'Caravan Palace', 'Caravan-palace-lone-digger'))
+        try:
+            assert index.refresh() == 1
+        finally:
+            rows.pop()
+        assert index.max_id == 5
+        assert index.lookup('Lone Digger', 'Caravan Palace') == 'Caravan-palace-lone-digger'
+
+    def test_stripper_index_refreshes_in_background_when_stale(self):
+        from swaglyrics_backend.fuzzy import StripperIndex
+        index = StripperIndex(load_rows, max_age=0)
+        index.refresh()
+        with patch.object(index, 'refresh_in_background') as fake_refresh:
+            index.lookup('Miracle', 'Caravan Palace')
+        assert fake_refresh.called
+
+    @patch('swaglyrics_backend.issue_maker.fuzzy_strippers', True)
+    @patch('swaglyrics_backend.issue_maker.stripper_index')
+    @patch('swaglyrics_backend.issue_maker.genius_stripper')
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_get_stripper_serves_near_matches(self, fake_db, fake_stripper, fake_index):
+        from swaglyrics_backend.issue_maker import app, limiter
+        fake_db.query.filter.return_value.filter.return_value.first.return_value = None
+        fake_index.ready = True
+        fake_index.lookup.return_value = 'The-beatles-hey-jude'
+        with app.test_client() as c:
+            limiter.enabled = False  # disable rate limiting
+            resp = c.get('/stripper', data={'song': 'Hey Jude - Remastered 2015', 'artist': 'The Beatles'})
+
+        assert resp.data == b'The-beatles-hey-jude'
+        fake_index.lookup.assert_called_once_with('Hey Jude - Remastered 2015', 'The Beatles')
+        assert not fake_stripper.called
+
+    @patch('swaglyrics_backend.issue_maker.fuzzy_strippers', True)
+    @patch('swaglyrics_backend.issue_maker.norm_key_column', True)
+    @patch('swaglyrics_backend.issue_maker.stripper_index')
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_get_fuzzy_stripper_uses_norm_key_until_index_loads(self, fake_db, fake_index):
+        from swaglyrics_backend.issue_maker import get_fuzzy_stripper
+        fake_index.ready = False
+        fake_db.query.filter.return_value.first.return_value.stripper = 'The-beatles-hey-jude'
+
+        assert get_fuzzy_stripper('Hey Jude - Remastered', 'The Beatles') == 'The-beatles-hey-jude'
+        assert fake_index.refresh_in_background.called
+        assert not fake_index.lookup.called
+
+    def test_that_routes_serve_near_matches(self):
+        from swaglyrics_backend.issue_maker import app
+        with sqlite_strippers(norm_key_column=True) as index, app.test_client() as c:
+            # the index hasn't loaded, the norm_key column is used
+            before_index = c.post('/stripper', data={'song': 'Hey Jude - Remastered', 'artist': 'the beatles'})
+            index.refresh()
+            single = c.post('/stripper', data={'song': 'Miracle', 'artist': 'Caravan Palac'})
+            batch = c.post('/stripper/batch', json={'tracks': [
+                {'song': 'Despacito - Remix', 'artist': 'Luis Fonsi feat. Justin Bieber'},
+                {'song': 'Miracle', 'artist': 'Caravan Palace'},
+                {'song': 'Lone Digger', 'artist': 'Caravan Palace'},
+            ]})
+            miss = c.post('/stripper', data={'song': 'Lone Digger', 'artist': 'Caravan Palace'})
+            # the near match served above doesn't pass for the pair being in the database
+            imported = c.post('/strippers/import', headers={'Authorization': ''}, data=(
+                '{"song": "Miracle", "artist": "Caravan Palac", "stripper": "Caravan-palac-miracle"}'))
+            exact = c.post('/stripper', data={'song': 'Miracle', 'artist': 'Caravan Palac'})
+
+        assert before_index.data == b'The-beatles-hey-jude'
+        assert single.data == b'Caravan-palace-miracle'
+        assert imported.get_json()['added'] == 1
+        assert exact.data == b'Caravan-palac-miracle'
+        assert [track['stripper'] for track in batch.get_json()['results']] == [
+            'Luis-fonsi-despacito', 'Caravan-palace-miracle', None]
+        assert miss.status_code == 404
+
+    def test_that_routes_work_before_the_norm_key_migration(self):
+        from swaglyrics_backend.issue_maker import app
+        with sqlite_strippers(norm_key_column=False) as index, app.test_client() as c:
+            exact = c.post('/stripper', data={'song': 'Miracle', 'artist': 'Caravan Palace'})
+            before_index = c.post('/stripper', data={'song': 'Hey Jude', 'artist': 'The Beatles'})
+            added = c.post('/add_stripper', data={'auth': '', 'song': 'Lone Digger', 'artist': 'Caravan Palace',
+                                                  'stripper': 'Caravan-palace-lone-digger'})
+            imported = c.post('/strippers/import', headers={'Authorization': ''},
+                              data='{"song": "Suzy", "artist": "Caravan Palace", "stripper": "Caravan-palace-suzy"}')
+            index.refresh()
+            batch = c.post('/stripper/batch', json={'tracks': [
+                {'song': 'Hey Jude', 'artist': 'The Beatles'},
+                {'song': 'Lone Digger', 'artist': 'Caravan Palace'},
+                {'song': 'suzy', 'artist': 'caravan palace'},
+            ]})
+
+        assert exact.data == b'Caravan-palace-miracle'
+        assert before_index.status_code == 404
+        assert added.status_code == 200
+        assert imported.get_json()['added'] == 1
+        assert [track['stripper'] for track in batch.get_json()['results']] == [
+            'The-beatles-hey-jude', 'Caravan-palace-lone-digger', 'Caravan-palace-suzy']
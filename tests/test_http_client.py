@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+import pytest
+
+from tests.base import TestBase
+
+
+class TestHttpClient(TestBase):
+
+    def test_that_each_upstream_has_its_own_pool(self):
+        from swaglyrics_backend.http_client import session
+        genius = session.get_adapter('https://api.genius.com/search')
+        spotify = session.get_adapter('https://api.spotify.com/v1/search')
+        assert genius is not spotify
+        assert genius is session.get_adapter('https://api.genius.com/songs/1')
+        assert genius.max_retries.status_forcelist == {500, 502, 503, 504}
+        assert session.get_adapter('https://discord.com/api/webhooks/1').max_retries.status_forcelist == set()
+
+    @patch('requests.Session.request')
+    def test_that_requests_have_default_timeout(self, fake_request):
+        from swaglyrics_backend import http_client
+        http_client.get('https://api.genius.com/search', params={'q': 'Miracle Caravan Palace'})
+        http_client.post('https://discord.com/api/webhooks/1', timeout=1)
+
+        assert fake_request.call_args_list[0].kwargs['timeout'] == http_client.TIMEOUT
+        assert fake_request.call_args_list[1].kwargs['timeout'] == 1
+
+    def test_endpoint_name(self):
+        from swaglyrics_backend.http_client import endpoint_name
+        assert endpoint_name('https://api.genius.com/search') == 'genius_search'
+        assert endpoint_name('https://genius.com/Caravan-palace-miracle-lyrics') == 'genius_page'
+        assert endpoint_name('https://api.spotify.com/v1/audio-features?ids=1,2') == 'spotify_audio_features'
+        assert endpoint_name('https://discord.com/api/webhooks/secret/token?wait=true') == 'discord_webhook'
+        assert endpoint_name('https://example.com/some/path') == 'example.com'
+
+    @patch('requests.Session.request')
+    def test_that_upstream_calls_are_timed(self, fake_request):
+        from swaglyrics_backend import http_client
+        from swaglyrics_backend.metrics import metrics
+        fake_request.return_value.status_code = 200
+        http_client.get('https://api.spotify.com/v1/search', params={'q': 'Miracle Caravan Palace'})
+        fake_request.side_effect = ConnectionError
+        with pytest.raises(ConnectionError):
+            http_client.get('https://api.spotify.com/v1/search', params={'q': 'Miracle Caravan Palace'})
+
+        name = 'swaglyrics_upstream_request_duration_seconds'
+        assert metrics.histograms[(name, (('status', '200'), ('upstream', 'spotify_search')))][-1] >= 1
+        assert metrics.histograms[(name, (('status', 'error'), ('upstream', 'spotify_search')))][-1] >= 1
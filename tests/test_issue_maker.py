@@ -1,9 +1,16 @@
-import time
-from unittest.mock import patch
+import json
+from ipaddress import ip_address
+from unittest.mock import patch, MagicMock
 
 from requests import Response
 
-from tests.base import TestBase, get_spotify_json, generate_fake_unsupported
+from tests.base import TestBase, get_spotify_json, generate_fake_unsupported, remove_jobs_db
+
+
+def ok_response():
+    response = Response()
+    response.status_code = 200
+    return response
 
 
 class TestIssueMaker(TestBase):
@@ -27,61 +34,70 @@ class TestIssueMaker(TestBase):
         }
     }
 
+    def setUp(self):
+        super().setUp()
+        from swaglyrics_backend.issue_maker import stripper_cache, genius_misses, spotify_searches, audio_features
+        stripper_cache.clear()
+        genius_misses.clear()
+        spotify_searches.clear()
+        audio_features.clear()
+        remove_jobs_db()
+        from swaglyrics_backend.issue_maker import unsupported_jobs, webhook_jobs
+        unsupported_jobs.create_schema()
+        webhook_jobs.create_schema()
+
     def test_that_del_line_deletes_line(self):
         from swaglyrics_backend.issue_maker import del_line
         song = "Supersonics"
         artist = "Caravan Palace"
         generate_fake_unsupported()
         del_line(song, artist)
-        with open('unsupported.txt', 'r') as f:
-            lines = f.readlines()
-            assert not (song + " by " + artist in lines)
+        with open('unsupported.txt.log', 'r') as f:
+            assert f.read() == f'-{song} by {artist}\n'
 
     @patch('requests.Response.json', return_value=sample_spotify_json)
-    @patch('requests.post', return_value=Response())
+    @patch('swaglyrics_backend.http_client.post', return_value=Response())
     def test_update_spotify_token(self, requests_mock, json_mock):
-        from swaglyrics_backend.issue_maker import get_spotify_token
-        from swaglyrics_backend import issue_maker
-        get_spotify_token()
-        assert issue_maker.spotify_token != ''
-        assert issue_maker.spotify_token_expiry != 0
+        from swaglyrics_backend.issue_maker import get_spotify_token, spotify_tokens
+        spotify_tokens.expiry = 0
+        token = get_spotify_token()
+        assert token == "NgCXRKNgCXRKNgCXRKNgCXRKNgCXRKNgCXRKMzYjw"
+        assert spotify_tokens.expiry != 0
 
-    @patch('swaglyrics_backend.issue_maker.time.time', return_value=1133742069)
+    @patch('swaglyrics_backend.tokens.time.time', return_value=1133742069)
     def test_not_update_spotify_token_if_not_expired(self, fake_time):
-        from swaglyrics_backend.issue_maker import get_spotify_token
-        from swaglyrics_backend import issue_maker
-        issue_maker.spotify_token = 'this is a real token'
-        issue_maker.spotify_token_expiry = 1133742069 + 500  # so it shouldn't update
+        from swaglyrics_backend.issue_maker import get_spotify_token, spotify_tokens
+        spotify_tokens.token = 'this is a real token'
+        spotify_tokens.expiry = 1133742069 + 1000  # so it shouldn't update
         token = get_spotify_token()
-        assert token == issue_maker.spotify_token
-        assert issue_maker.spotify_token_expiry == 1133742569  # check expiry not updated
+        assert token == 'this is a real token'
+        assert spotify_tokens.expiry == 1133743069  # check expiry not updated
 
-    @patch('swaglyrics_backend.issue_maker.get_installation_access_token')
-    @patch('swaglyrics_backend.issue_maker.get_jwt')
+    @patch('swaglyrics_backend.tokens.get_installation_access_token')
+    @patch('swaglyrics_backend.tokens.get_jwt')
     def test_update_github_token(self, fake_jwt, fake_token):
         fake_token.return_value.json.return_value = {
             "token": "v1.1f699f1069f60xxx",
-            "expires_at": "2020-07-26T22:14:10Z"
+            "expires_at": "2099-07-26T22:14:10Z"
         }
-        from swaglyrics_backend.issue_maker import get_github_token
-        from swaglyrics_backend import issue_maker
+        from swaglyrics_backend.issue_maker import get_github_token, github_tokens
+        github_tokens.expiry = 0
         token = get_github_token()
-        assert issue_maker.gh_token == token
-        assert issue_maker.gh_token_expiry != 0
+        assert token == "v1.1f699f1069f60xxx"
+        assert github_tokens.expiry != 0
 
-    @patch('swaglyrics_backend.issue_maker.time.time', return_value=1133742069)
+    @patch('swaglyrics_backend.tokens.time.time', return_value=1133742069)
     def test_not_update_github_token_if_not_expired(self, fake_time):
-        from swaglyrics_backend.issue_maker import get_github_token
-        from swaglyrics_backend import issue_maker
-        issue_maker.gh_token = 'this is also a real token'
-        issue_maker.gh_token_expiry = 1133742069 + 500  # so it shouldn't update
+        from swaglyrics_backend.issue_maker import get_github_token, github_tokens
+        github_tokens.token = 'this is also a real token'
+        github_tokens.expiry = 1133742069 + 1000  # so it shouldn't update
         token = get_github_token()
-        assert token == issue_maker.gh_token
-        assert issue_maker.gh_token_expiry == 1133742569  # check expiry not updated
+        assert token == 'this is also a real token'
+        assert github_tokens.expiry == 1133743069  # check expiry not updated
 
-    @patch('swaglyrics_backend.issue_maker.discord_instrumental_logger')
+    @patch('swaglyrics_backend.issue_maker.queue_instrumental_log')
     @patch('requests.Response.json', return_value=get_spotify_json('spotify_instrumental.json'))  # Für Elise
-    @patch('requests.get', return_value=Response())
+    @patch('swaglyrics_backend.http_client.get', return_value=ok_response())
     def test_check_song_instrumental_returns_true(self, fake_post, fake_json, fake_discord):
         from swaglyrics_backend.issue_maker import check_song_instrumental
         # we reuse the Miracle by Caravan Palace json for other tests but the return value will be Für Elise
@@ -89,9 +105,9 @@ class TestIssueMaker(TestBase):
         instrumental = check_song_instrumental(track, {"Authorization": ""})
         assert instrumental is True
 
-    @patch('swaglyrics_backend.issue_maker.discord_instrumental_logger')
+    @patch('swaglyrics_backend.issue_maker.queue_instrumental_log')
     @patch('requests.Response.json', return_value=get_spotify_json('spotify_not_instrumental.json'))  # Miracle
-    @patch('requests.get', return_value=Response())
+    @patch('swaglyrics_backend.http_client.get', return_value=ok_response())
     def test_check_song_instrumental_returns_false(self, fake_post, fake_json, fake_discord):
         from swaglyrics_backend.issue_maker import check_song_instrumental
         track = get_spotify_json('correct_spotify_data.json')['tracks']['items'][0]  # Miracle by Caravan Palace
@@ -100,16 +116,14 @@ class TestIssueMaker(TestBase):
 
     @patch('swaglyrics_backend.issue_maker.get_spotify_token', return_value={"access_token": ""})
     @patch('requests.Response.json', return_value={'error': 'yes'})
-    @patch('requests.get', return_value=Response())
+    @patch('swaglyrics_backend.http_client.get', return_value=Response())
     def test_check_song_returns_false_on_bad_response(self, requests_mock, response_mock, spotify_mock):
         from swaglyrics_backend.issue_maker import check_song
-        from swaglyrics_backend import issue_maker
-        issue_maker.t_expiry = time.time() + 3600
         assert not check_song("Miracle", "Caravan Palace")
 
     @patch('swaglyrics_backend.issue_maker.get_spotify_token', return_value={"access_token": ""})
     @patch('requests.Response.json', return_value={'error', 'yes'})
-    @patch('requests.get', return_value=Response())
+    @patch('swaglyrics_backend.http_client.get', return_value=Response())
     @patch('swaglyrics_backend.issue_maker.check_song_instrumental', return_value=False)
     def test_that_check_song_returns_true(self, check_instrumental, mock_get, mock_response, spotify_token):
         from swaglyrics_backend.issue_maker import check_song
@@ -117,7 +131,7 @@ class TestIssueMaker(TestBase):
         assert check_song("Miracle", "Caravan Palace")
 
     @patch('swaglyrics_backend.issue_maker.get_spotify_token', return_value={"access_token": ""})
-    @patch('requests.get')
+    @patch('swaglyrics_backend.http_client.get')
     @patch('swaglyrics_backend.issue_maker.check_song_instrumental', return_value=True)
     def test_that_check_song_returns_false_when_instrumental(self, check_instrumental, mock_get, spotify_token):
         from swaglyrics_backend.issue_maker import check_song
@@ -130,7 +144,7 @@ class TestIssueMaker(TestBase):
         assert "Miracle by Caravan Palace seems to be instrumental" in logs.output[2]
 
     @patch('swaglyrics_backend.issue_maker.get_spotify_token', return_value={"access_token": ""})
-    @patch('requests.get')
+    @patch('swaglyrics_backend.http_client.get')
     def test_that_check_song_returns_false_when_mismatch(self, mock_get, spotify_token):
         from swaglyrics_backend.issue_maker import check_song
         wrong_json = get_spotify_json('correct_spotify_data.json')
@@ -141,18 +155,73 @@ class TestIssueMaker(TestBase):
 
     @patch('swaglyrics_backend.issue_maker.get_spotify_token', return_value={"access_token": ""})
     @patch('requests.Response.json', return_value=unknown_song_json)
-    @patch('requests.get', return_value=Response())
+    @patch('swaglyrics_backend.http_client.get', return_value=Response())
     def test_that_check_song_returns_false_on_non_legit_song(self, mock_get, mock_response, spotify_token):
         from swaglyrics_backend.issue_maker import check_song
         assert not check_song("Miracle", "Caravan Palace")
 
+    @patch('swaglyrics_backend.issue_maker.get_spotify_token', return_value="")
+    @patch('swaglyrics_backend.http_client.get')
+    @patch('swaglyrics_backend.issue_maker.check_song_instrumental', return_value=False)
+    def test_that_check_song_caches_search(self, check_instrumental, mock_get, spotify_token):
+        from swaglyrics_backend.issue_maker import check_song
+        mock_get.return_value.json.return_value = get_spotify_json('correct_spotify_data.json')
+
+        assert check_song("Miracle", "Caravan Palace")
+        assert check_song("Miracle", "Caravan Palace")
+        assert mock_get.call_count == 1
+
+    @patch('swaglyrics_backend.http_client.get')
+    def test_that_audio_features_are_batched(self, mock_get):
+        from concurrent.futures import ThreadPoolExecutor
+        from swaglyrics_backend.issue_maker import get_audio_features, audio_features_loader
+        features = get_spotify_json('spotify_not_instrumental.json')
+
+        def fake_get(url, headers, params):
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.json.return_value = {'audio_features': [
+                dict(features, id=track_id) for track_id in params['ids'].split(',')
+            ]}
+            return mock_get.return_value
+
+        mock_get.side_effect = fake_get
+        with ThreadPoolExecutor(3) as pool, patch.object(audio_features_loader, 'concurrency', 3):
+            results = list(pool.map(lambda track_id: get_audio_features(track_id, {}), ['1', '2', '3']))
+
+        assert [result['id'] for result in results] == ['1', '2', '3']
+        assert mock_get.call_count == 1
+        assert mock_get.call_args.args[0] == 'https://api.spotify.com/v1/audio-features'
+        assert sorted(mock_get.call_args.kwargs['params']['ids'].split(',')) == ['1', '2', '3']
+        get_audio_features('2', {})  # cached now
+        assert mock_get.call_count == 1
+
+    @patch('swaglyrics_backend.http_client.get')
+    def test_that_audio_feature_errors_are_not_cached(self, mock_get):
+        import pytest
+        from requests import HTTPError
+        from swaglyrics_backend.issue_maker import get_audio_features, audio_features
+        features = get_spotify_json('spotify_not_instrumental.json')
+        mock_get.return_value.status_code = 429
+        mock_get.return_value.json.return_value = {'error': {'status': 429, 'message': 'API rate limit exceeded'}}
+        with pytest.raises(HTTPError):
+            get_audio_features('1', {})
+        mock_get.return_value.status_code = 404
+        assert get_audio_features('1', {}) is None
+        assert audio_features.get('1') is None
+
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = features
+        assert get_audio_features('1', {}) == features
+        assert get_audio_features('1', {}) == features
+        assert mock_get.call_count == 3
+
     @patch('requests.Response.json', return_value=None)
-    @patch('requests.get', return_value=Response())
+    @patch('swaglyrics_backend.http_client.get', return_value=Response())
     def test_that_genius_stripper_returns_none(self, mock_get, mock_response):
         from swaglyrics_backend.issue_maker import genius_stripper
         assert genius_stripper("Miracle", "Caravan Palace") is None
 
-    @patch('requests.get')
+    @patch('swaglyrics_backend.http_client.get')
     def test_that_genius_stripper_returns_none_on_error(self, mock_get):
         from swaglyrics_backend.issue_maker import genius_stripper
         fake_json = get_spotify_json('sample_genius_data.json')
@@ -161,8 +230,18 @@ class TestIssueMaker(TestBase):
         mock_get.return_value.json.return_value = fake_json
         assert genius_stripper("Miracle", "Caravan Palace") is None
 
+    @patch('swaglyrics_backend.http_client.get')
+    def test_that_genius_bodies_without_hits_are_errors(self, mock_get):
+        import pytest
+        from swaglyrics_backend.issue_maker import GeniusUnavailable, genius_stripper, search_genius_stripper
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'meta': {'status': 200}, 'response': {}}
+        with pytest.raises(GeniusUnavailable):
+            search_genius_stripper("Miracle", "Caravan Palace")
+        assert genius_stripper("Miracle", "Caravan Palace") is None
+
     @patch('requests.Response.json', return_value=get_spotify_json('sample_genius_data.json'))
-    @patch('requests.get')
+    @patch('swaglyrics_backend.http_client.get')
     def test_that_genius_stripper_returns_stripper(self, mock_get, fake_response):
         from swaglyrics_backend.issue_maker import genius_stripper
         response = Response()
@@ -170,7 +249,7 @@ class TestIssueMaker(TestBase):
         mock_get.return_value = response
         assert genius_stripper("Miracle", "Caravan Palace") == "Caravan-palace-miracle"
 
-    @patch('requests.get')
+    @patch('swaglyrics_backend.http_client.get')
     def test_that_genius_stripper_returns_none_when_stripper_not_found(self, mock_get):
         from swaglyrics_backend.issue_maker import genius_stripper
         fake_json = get_spotify_json('sample_genius_data.json')  # json is for Miracle by Caravan Palace
@@ -178,7 +257,7 @@ class TestIssueMaker(TestBase):
         mock_get.return_value.json.return_value = fake_json
         assert genius_stripper("Fake Song Name lol", "Fake Artist") is None
 
-    @patch('requests.get')
+    @patch('swaglyrics_backend.http_client.get')
     def test_that_genius_stripper_checks_for_stripper_format(self, mock_get):
         from swaglyrics_backend.issue_maker import genius_stripper
         fake_json = get_spotify_json('sample_genius_data.json')
@@ -194,14 +273,38 @@ class TestIssueMaker(TestBase):
             stripper = genius_stripper("Miracle", "Caravan Palace")
 
         assert stripper is None
-        assert "Path did not end in lyrics: /Caravan-palace-miracle-annotated" in logs.output[7]
+        assert "WARNING:root:Path did not end in lyrics: /Caravan-palace-miracle-annotated" in logs.output
 
-    @patch('swaglyrics_backend.issue_maker.requests.get')
+    @patch('swaglyrics_backend.http_client.get')
     def test_that_check_stripper_checks_stripper(self, fake_get):
         from swaglyrics_backend.issue_maker import check_stripper
         fake_get.return_value.status_code = 200
         assert check_stripper("Hello", "Adele") is True
 
+    @patch('swaglyrics_backend.http_client.get')
+    def test_that_genius_stripper_picks_best_match(self, mock_get):
+        from swaglyrics_backend.issue_maker import genius_stripper
+        fake_json = get_spotify_json('sample_genius_data.json')
+        hits = fake_json['response']['hits']
+        hits[0], hits[1] = hits[1], hits[0]  # translation comes first but is a worse match
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = fake_json
+        assert genius_stripper("Miracle", "Caravan Palace") == "Caravan-palace-miracle"
+
+    def test_title_matcher_ranks_titles(self):
+        from swaglyrics_backend.matching import TitleMatcher
+        matcher = TitleMatcher("Bohemian Rhapsody by Queen")
+        ranked = matcher.rank(["Bohemian Rhapsody (Live Aid) by Queen", "Miracle by Caravan Palace",
+                               "Bohemian Rhapsody by Queen", "Bohemian Rhapsody by Queen"])
+        assert [i for i, _ in ranked] == [2, 3, 0]
+        assert ranked[0][1] == 1.0
+
+    def test_title_matcher_token_similarity(self):
+        from swaglyrics_backend.matching import TitleMatcher, tokenize
+        assert len(TitleMatcher("Colour of Night by Bruce Willis").mismatches(tokenize("Color of Nite"))) == 5
+        fuzzy = TitleMatcher("Colour of Night by Bruce Willis", token_similarity=0.8)
+        assert fuzzy.mismatches(tokenize("Color of Nite")) == ['night', 'by', 'bruce', 'willis']
+
     def test_that_title_mismatches(self):
         from swaglyrics_backend.issue_maker import is_title_mismatched
         assert is_title_mismatched(["Bohemian", "Rhapsody", "by", "Queen"], "Miracle by Caravan Palace", 2)
@@ -215,7 +318,7 @@ class TestIssueMaker(TestBase):
         assert not is_title_mismatched(["BoHemIaN", "RhaPsoDy", "2011", "bY", "queen"], "bohemian RHAPSODY By QUEEN", 2)
 
     @patch('swaglyrics_backend.issue_maker.get_github_token', return_value='fake token')
-    @patch('swaglyrics_backend.issue_maker.requests.post')
+    @patch('swaglyrics_backend.http_client.post')
     def test_create_issue(self, fake_post, fake_token):
         fake_post.return_value.json.return_value = {
             "html_url": "https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues/1337"
@@ -248,8 +351,28 @@ class TestIssueMaker(TestBase):
 
         assert resp.data == b"XXXTENTACION-bad-vibes-forever"
 
-    @patch('swaglyrics_backend.issue_maker.discord_genius_logger')
-    @patch('swaglyrics_backend.issue_maker.genius_stripper')
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_stripper_from_db_is_cached(self, fake_db):
+        from swaglyrics_backend.issue_maker import get_stripper_from_db
+        fake_first = fake_db.query.filter.return_value.filter.return_value.first
+        fake_first.return_value.stripper = "Caravan-palace-miracle"
+
+        assert get_stripper_from_db('Miracle', 'Caravan Palace') == "Caravan-palace-miracle"
+        assert get_stripper_from_db('Miracle', 'Caravan Palace') == "Caravan-palace-miracle"
+        assert fake_first.call_count == 1
+
+    @patch('swaglyrics_backend.issue_maker.db')
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_add_stripper_to_db_invalidates_cache(self, fake_lyrics, fake_db):
+        from swaglyrics_backend.issue_maker import add_stripper_to_db, stripper_cache
+        stripper_cache.set(('Miracle', 'Caravan Palace'), "Caravan-palace-miracle-old")
+        add_stripper_to_db('Miracle', 'Caravan Palace', "Caravan-palace-miracle")
+
+        assert stripper_cache.get(('Miracle', 'Caravan Palace')) is None
+        assert fake_db.session.commit.called
+
+    @patch('swaglyrics_backend.issue_maker.queue_genius_log')
+    @patch('swaglyrics_backend.issue_maker.search_genius_stripper')
     @patch('swaglyrics_backend.issue_maker.Lyrics')
     def test_that_get_stripper_gets_genius_stripper(self, fake_db, fake_stripper, fake_logger):
         from swaglyrics_backend.issue_maker import app, limiter
@@ -261,8 +384,8 @@ class TestIssueMaker(TestBase):
 
         assert resp.data == b"XXXTENTACION-bad-vibes-forever"
 
-    @patch('swaglyrics_backend.issue_maker.discord_genius_logger')
-    @patch('swaglyrics_backend.issue_maker.genius_stripper')
+    @patch('swaglyrics_backend.issue_maker.queue_genius_log')
+    @patch('swaglyrics_backend.issue_maker.search_genius_stripper')
     @patch('swaglyrics_backend.issue_maker.Lyrics')
     def test_that_get_stripper_returns_not_found_when_no_stripper_found(self, fake_db, fake_stripper, fake_logger):
         from swaglyrics_backend.issue_maker import app, limiter
@@ -275,6 +398,143 @@ class TestIssueMaker(TestBase):
         assert resp.data == b""
         assert resp.status_code == 404
 
+    @patch('swaglyrics_backend.issue_maker.queue_genius_log')
+    @patch('swaglyrics_backend.issue_maker.search_genius_stripper', return_value=None)
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_get_stripper_caches_genius_misses(self, fake_db, fake_stripper, fake_logger):
+        from swaglyrics_backend.issue_maker import app, limiter
+        fake_db.query.filter.return_value.filter.return_value.first.return_value = None
+        with app.test_client() as c:
+            limiter.enabled = False  # disable rate limiting
+            resp = c.get('/stripper', data={'song': 'Bad Vibes  Forever', 'artist': 'XXXTENTACION'})
+            resp_again = c.get('/stripper', data={'song': 'bad vibes forever', 'artist': 'xxxtentacion'})
+
+        assert resp.status_code == resp_again.status_code == 404
+        assert fake_stripper.call_count == 1
+        assert fake_logger.call_count == 1
+
+    @patch('swaglyrics_backend.issue_maker.queue_genius_log')
+    @patch('swaglyrics_backend.http_client.get')
+    def test_that_genius_errors_are_not_cached_as_misses(self, mock_get, fake_logger):
+        from requests import ConnectionError
+        from swaglyrics_backend.issue_maker import resolve_genius_stripper, genius_misses, normalize_key
+        fake_json = get_spotify_json('sample_genius_data.json')
+        mock_get.return_value.status_code = 429
+        assert resolve_genius_stripper('Miracle', 'Caravan Palace') is None
+        mock_get.side_effect = ConnectionError()
+        assert resolve_genius_stripper('Miracle', 'Caravan Palace') is None
+        assert normalize_key('Miracle', 'Caravan Palace') not in genius_misses
+        assert not fake_logger.called
+
+        mock_get.side_effect = None
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = fake_json
+        assert resolve_genius_stripper('Miracle', 'Caravan Palace') == 'Caravan-palace-miracle'
+        # a search without a matching hit is cached
+        assert resolve_genius_stripper('Fake Song Name lol', 'Fake Artist') is None
+        assert normalize_key('Fake Song Name lol', 'Fake Artist') in genius_misses
+        assert mock_get.call_count == 4
+
+    @patch('swaglyrics_backend.issue_maker.queue_genius_log')
+    @patch('swaglyrics_backend.issue_maker.search_genius_stripper', return_value='Caravan-palace-miracle')
+    def test_that_concurrent_genius_lookups_are_shared(self, fake_stripper, fake_logger):
+        from swaglyrics_backend.issue_maker import resolve_genius_stripper, genius_lookups, normalize_key
+        # a lookup of the same song is already in flight
+        with patch.object(genius_lookups, '_calls', {normalize_key('Miracle', 'Caravan Palace'): MagicMock()}) as calls:
+            calls[normalize_key('Miracle', 'Caravan Palace')].result.return_value = 'Caravan-palace-miracle'
+            assert resolve_genius_stripper('miracle', 'caravan palace') == 'Caravan-palace-miracle'
+        assert not fake_stripper.called
+        assert not fake_logger.called
+
+    @patch('swaglyrics_backend.issue_maker.resolve_genius_stripper')
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_stripper_batch_resolves_tracks(self, fake_db, fake_resolve):
+        class FakeLyrics:
+            def __init__(self, song=None, artist=None, stripper=None):
+                self.song = song
+                self.artist = artist
+                self.stripper = stripper
+
+        from swaglyrics_backend.issue_maker import app, limiter
+        fake_db.query.filter.return_value.filter.return_value = [
+            FakeLyrics('Miracle', 'Caravan Palace', 'Caravan-palace-miracle'),
+            FakeLyrics('Miracle', 'Adele', 'this should not match'),
+        ]
+        fake_resolve.side_effect = lambda song, artist: 'Adele-hello' if song == 'Hello' else None
+        with app.test_client() as c:
+            limiter.enabled = False  # disable rate limiting
+            resp = c.post('/stripper/batch', json={'tracks': [
+                {'song': 'Miracle', 'artist': 'Caravan Palace'},
+                {'song': 'Hello', 'artist': 'Adele'},
+                {'song': 'bruh', 'artist': 'heck'},
+                {'song': 'Hello', 'artist': 'Adele'},
+            ]})
+
+        assert [track['stripper'] for track in resp.get_json()['results']] == [
+            'Caravan-palace-miracle', 'Adele-hello', None, 'Adele-hello']
+        assert fake_resolve.call_count == 2  # duplicates and db hits aren't looked up
+
+    def test_that_stripper_batch_rejects_bad_requests(self):
+        from swaglyrics_backend.issue_maker import app, limiter
+        with app.test_client() as c:
+            limiter.enabled = False  # disable rate limiting
+            no_tracks = c.post('/stripper/batch', json={'tracks': []})
+            no_artist = c.post('/stripper/batch', json={'tracks': [{'song': 'Hello'}]})
+            too_many = c.post('/stripper/batch', json={'tracks': [{'song': 'Hello', 'artist': 'Adele'}] * 51})
+
+        assert no_tracks.status_code == no_artist.status_code == too_many.status_code == 400
+
+    @patch('swaglyrics_backend.issue_maker.get_ipaddr', return_value='4.3.2.1')
+    @patch('swaglyrics_backend.issue_maker.get_strippers_from_db')
+    def test_that_stripper_batch_counts_tracks_against_limit(self, fake_db, fake_ip):
+        from swaglyrics_backend.issue_maker import app, limiter, hit_weighted, batch_limits, stripper_scope
+        fake_db.side_effect = lambda pairs: {pair: 'a-stripper' for pair in pairs}
+        tracks = [{'song': f'song {i}', 'artist': 'artist'} for i in range(40)]
+        with app.test_client() as c:
+            limiter.enabled = True  # enable rate limiting
+            limiter.reset()
+            resp = c.post('/stripper/batch', json={'tracks': tracks})
+            with app.test_request_context():
+                # 40 of the 60 per hour are used up
+                assert not hit_weighted(batch_limits, stripper_scope, 21)
+                assert hit_weighted(batch_limits, stripper_scope, 20)
+            limiter.enabled = False
+
+        assert resp.status_code == 200
+
+    @patch('swaglyrics_backend.issue_maker.batch_max_tracks', 60)
+    @patch('swaglyrics_backend.issue_maker.get_stripper_from_db', return_value='a-stripper')
+    @patch('swaglyrics_backend.issue_maker.get_strippers_from_db')
+    def test_that_stripper_and_batch_share_limits(self, fake_batch_db, fake_db):
+        from swaglyrics_backend.issue_maker import app, limiter, hit_weighted, batch_limits, stripper_scope
+        fake_batch_db.side_effect = lambda pairs: {pair: 'a-stripper' for pair in pairs}
+
+        def tracks(n):
+            return {'tracks': [{'song': f'song {i}', 'artist': 'artist'} for i in range(n)]}
+
+        with app.test_client() as c:
+            limiter.enabled = True  # enable rate limiting
+            limiter.reset()
+            single = c.post('/stripper', data={'song': 'Miracle', 'artist': 'Caravan Palace'})
+            # the lookup above leaves 59 of the 60 per hour
+            full = c.post('/stripper/batch', json=tracks(59))
+            with app.test_request_context():
+                assert not hit_weighted(batch_limits, stripper_scope, 1)
+            limiter.reset()
+            batch = c.post('/stripper/batch', json=tracks(60))
+            after_batch = c.post('/stripper', data={'song': 'Miracle', 'artist': 'Caravan Palace'})
+            limiter.enabled = False
+
+        assert single.status_code == full.status_code == batch.status_code == 200
+        assert after_batch.status_code == 429
+
+    @patch('swaglyrics_backend.issue_maker.db')
+    def test_that_add_stripper_clears_genius_miss(self, fake_db):
+        from swaglyrics_backend.issue_maker import add_stripper_to_db, genius_misses, normalize_key
+        genius_misses.set(normalize_key('Miracle', 'Caravan Palace'), True)
+        add_stripper_to_db('Miracle', 'Caravan Palace', 'Caravan-palace-miracle')
+        assert normalize_key('Miracle', 'Caravan Palace') not in genius_misses
+
     @patch('swaglyrics_backend.issue_maker.db')
     def test_that_add_stripper_adds_stripper(self, app_mock):
         """
@@ -348,6 +608,74 @@ class TestIssueMaker(TestBase):
         assert b'Heroku' not in resp.data
         assert b'Miracle by Caravan Palace' in resp.data
 
+    def test_landing_page_is_cached_and_conditional(self):
+        import gzip
+        from swaglyrics_backend.issue_maker import app, unsupported
+        generate_fake_unsupported()
+        with app.test_client() as c:
+            resp = c.get('/')
+            etag = resp.headers['ETag']
+            not_modified = c.get('/', headers={'If-None-Match': etag})
+            gzipped = c.get('/', headers={'Accept-Encoding': 'gzip'})
+            unsupported.add('Lone Digger', 'Caravan Palace')
+            changed = c.get('/', headers={'If-None-Match': etag})
+
+        assert resp.status_code == 200
+        assert 'public, max-age=' in resp.headers['Cache-Control']
+        assert resp.headers['Last-Modified']
+        assert not_modified.status_code == 304
+        assert not_modified.data == b''
+        assert gzipped.headers['Content-Encoding'] == 'gzip'
+        assert gzipped.headers['ETag'] != etag
+        assert gzip.decompress(gzipped.data) == resp.data
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+        assert b'Lone Digger by Caravan Palace' in changed.data
+
+    def test_landing_page_search_and_pages(self):
+        from swaglyrics_backend.issue_maker import app
+        generate_fake_unsupported()
+        with patch('swaglyrics_backend.issue_maker.home_page_size', 1), app.test_client() as c:
+            first = c.get('/')
+            second = c.get('/?after=1')
+            search = c.get('/?q=supersonics')
+            bad = c.get('/?after=bruh')
+
+        assert b'Miracle by Caravan Palace' in first.data
+        assert b'Supersonics' not in first.data
+        assert b'href="/?after=1"' in first.data
+        assert b'Supersonics by Caravan Palace' in second.data
+        assert b'Next page' not in second.data
+        assert b'Supersonics by Caravan Palace' in search.data
+        assert b'Miracle by' not in search.data
+        assert bad.status_code == 400
+
+    def test_unsupported_list_and_dump(self):
+        from swaglyrics_backend.issue_maker import app
+        generate_fake_unsupported()
+        with app.test_client() as c:
+            page = c.get('/unsupported/list?limit=1').get_json()
+            next_page = c.get(f"/unsupported/list?limit=1&after={page['next']}").get_json()
+            search = c.get('/unsupported/list?q=SUPERSONICS').get_json()
+            too_big = c.get('/unsupported/list?limit=100000')
+            dump = c.get('/unsupported/dump')
+
+        assert page == {'items': [{'id': 1, 'line': 'Miracle by Caravan Palace', 'count': 1}], 'next': 1}
+        assert next_page == {'items': [{'id': 2, 'line': 'Supersonics by Caravan Palace', 'count': 1}], 'next': None}
+        assert [item['line'] for item in search['items']] == ['Supersonics by Caravan Palace']
+        assert too_big.status_code == 400
+        assert dump.data == b'Miracle by Caravan Palace\nSupersonics by Caravan Palace\n'
+
+    def test_master_unsupported_is_conditional(self):
+        from swaglyrics_backend.issue_maker import app
+        generate_fake_unsupported()
+        with app.test_client() as c:
+            resp = c.get('/master_unsupported')
+            not_modified = c.get('/master_unsupported', headers={'If-Modified-Since': resp.headers['Last-Modified']})
+
+        assert resp.data == b'Miracle by Caravan Palace\nSupersonics by Caravan Palace\n'
+        assert not_modified.status_code == 304
+
     @patch('swaglyrics_backend.issue_maker.get_ipaddr', return_value='1.2.3.4')
     def test_that_slow_is_rate_limited(self, fake_ip):
         from swaglyrics_backend.issue_maker import app, limiter
@@ -423,7 +751,7 @@ class TestIssueMaker(TestBase):
     @patch('swaglyrics_backend.issue_maker.check_stripper', return_value=False)
     @patch('swaglyrics_backend.issue_maker.create_issue')
     def test_unsupported_not_trivial_case_does_make_issue(self, fake_issue, fake_check, another_fake_check):
-        from swaglyrics_backend.issue_maker import app, limiter
+        from swaglyrics_backend.issue_maker import app, limiter, unsupported, unsupported_jobs
         fake_issue.return_value = {
             "status_code": 201,
             "link": "https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues/2443"  # fake issue creation
@@ -435,20 +763,26 @@ class TestIssueMaker(TestBase):
             resp = c.post('/unsupported', data={'version': '1.2.0',
                                                 'song': "Avatar's Love (braces not trivial)",
                                                 'artist': 'Rachel Clinton'})
+            assert resp.data == b"Checking Avatar's Love (braces not trivial) by Rachel Clinton, the result will be " \
+                                b"at http://localhost/unsupported/1"
+            assert not fake_issue.called  # issue is made in the background
+
+            unsupported_jobs.run_pending()
+            status = c.get('/unsupported/1').get_json()
 
-        with open('unsupported.txt') as f:
-            data = f.readlines()
+        data = unsupported.lines()
 
         assert "Avatar's Love (braces not trivial) by Rachel Clinton\n" in data
-        assert resp.data == b"Lyrics for that song may not exist on Genius. Created issue on the GitHub repo for " \
-                            b"Avatar's Love (braces not trivial) by Rachel Clinton to investigate further. " \
-                            b"\nhttps://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues/2443"
+        assert status['status'] == 'done'
+        assert status['result'] == "Lyrics for that song may not exist on Genius. Created issue on the GitHub repo " \
+                                   "for Avatar's Love (braces not trivial) by Rachel Clinton to investigate further. " \
+                                   "\nhttps://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues/2443"
 
     @patch('swaglyrics_backend.issue_maker.check_song', return_value=True)
     @patch('swaglyrics_backend.issue_maker.check_stripper', return_value=False)
     @patch('swaglyrics_backend.issue_maker.create_issue')
     def test_unsupported_issue_making_error(self, fake_issue, fake_check, another_fake_check):
-        from swaglyrics_backend.issue_maker import app, limiter
+        from swaglyrics_backend.issue_maker import app, limiter, unsupported, unsupported_jobs
         fake_issue.return_value = {
             "status_code": 500,  # error
             "link": ""
@@ -457,26 +791,167 @@ class TestIssueMaker(TestBase):
             app.config['TESTING'] = True
             limiter.enabled = False  # disable rate limiting
             generate_fake_unsupported()
-            resp = c.post('/unsupported', data={'version': '1.2.0',
-                                                'song': "purple.laces [string%@*]",
-                                                'artist': 'lost spaces'})
-        with open('unsupported.txt') as f:
-            data = f.readlines()
+            c.post('/unsupported', data={'version': '1.2.0',
+                                         'song': "purple.laces [string%@*]",
+                                         'artist': 'lost spaces'})
+            unsupported_jobs.run_pending()
+            status = c.get('/unsupported/1').get_json()
+        data = unsupported.lines()
 
         assert "purple.laces [string%@*] by lost spaces\n" in data
-        assert resp.data == b"Logged purple.laces [string%@*] by lost spaces in the server."
+        assert status['result'] == "Logged purple.laces [string%@*] by lost spaces in the server."
 
     @patch('swaglyrics_backend.issue_maker.check_song', return_value=False)  # cuz fishy
     @patch('swaglyrics_backend.issue_maker.check_stripper', return_value=False)
     def test_unsupported_fishy_requests_handling(self, fake_check, another_fake_check):
-        from swaglyrics_backend.issue_maker import app, limiter
+        from swaglyrics_backend.issue_maker import app, limiter, unsupported_jobs
         with app.test_client() as c:
             app.config['TESTING'] = True
             limiter.enabled = False  # disable rate limiting
-            resp = c.post('/unsupported', data={'version': '1.2.0',
-                                                'song': "evbiurevbiuprvb",  # fake issue spam
-                                                'artist': 'bla$bla%bla'})  # special characters to trip the trivial case
+            c.post('/unsupported', data={'version': '1.2.0',
+                                         'song': "evbiurevbiuprvb",  # fake issue spam
+                                         'artist': 'bla$bla%bla'})  # special characters to trip the trivial case
+            unsupported_jobs.run_pending()
+            status = c.get('/unsupported/1').get_json()
+
+        assert status['result'] == "That song doesn't seem to exist on Spotify or is instrumental. " \
+                                   "\nIf you feel there's an error, open a ticket at " \
+                                   "https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues"
+
+    @patch('swaglyrics_backend.issue_maker.check_song', return_value=True)
+    @patch('swaglyrics_backend.issue_maker.check_stripper', return_value=False)
+    @patch('swaglyrics_backend.issue_maker.create_issue')
+    @patch('swaglyrics_backend.http_client.get')
+    def test_rerun_unsupported_job_does_not_make_another_issue(self, fake_get, fake_issue, fake_check,
+                                                               another_fake_check):
+        from swaglyrics_backend.issue_maker import process_unsupported, unsupported, github_tokens
+        github_tokens.token, github_tokens.expiry = 'token', float('inf')
+        link = "https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues/2443"
+        fake_get.return_value.status_code = 200
+        fake_get.return_value.json.return_value = {'items': [
+            {'title': 'Navajo by Masego unsupported. (old)', 'html_url': 'wrong'},
+            {'title': 'Navajo by Masego unsupported.', 'html_url': link},
+        ]}
+        generate_fake_unsupported()
+        job = {'song': 'Navajo', 'artist': 'Masego', 'version': '1.2.0', 'stripper': 'Masego-navajo'}
+        # an earlier run logged the song before it was cut off
+        unsupported.add('Navajo', 'Masego')
+        result = process_unsupported(job)
+
+        assert not fake_issue.called
+        assert result.endswith(link)
+        assert unsupported.lines().count('Navajo by Masego\n') == 1
+        github_tokens.expiry = 0
+
+    @patch('swaglyrics_backend.issue_maker.check_song', side_effect=ValueError('spotify is down'))
+    def test_unsupported_dedupes_queued_jobs(self, fake_check):
+        from swaglyrics_backend.issue_maker import app, limiter, unsupported_jobs
+        with app.test_client() as c:
+            app.config['TESTING'] = True
+            limiter.enabled = False  # disable rate limiting
+            data = {'version': '1.2.0', 'song': "evbiurevbiuprvb", 'artist': 'bla$bla%bla'}
+            resp = c.post('/unsupported', data=data)
+            resp_again = c.post('/unsupported', data=data)
+            assert resp.data == resp_again.data
+            assert unsupported_jobs.run_pending() == 1
+            status = c.get('/unsupported/1').get_json()
+            missing = c.get('/unsupported/2')
+
+        assert fake_check.call_count == 1
+        assert status['status'] == 'failed'
+        assert status['result'] == "ValueError('spotify is down')"
+        assert missing.status_code == 404
 
-        assert resp.data == b"That song doesn't seem to exist on Spotify or is instrumental. " \
-                            b"\nIf you feel there's an error, open a ticket at " \
-                            b"https://github.com/SwagLyrics/SwagLyrics-For-Spotify/issues"
+    @patch('swaglyrics_backend.issue_maker.db')
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_strippers_export_streams_ndjson(self, fake_lyrics, fake_db):
+        from collections import namedtuple
+        from swaglyrics_backend.issue_maker import app
+        Row = namedtuple('Row', 'id song artist stripper')
+        fake_lyrics.id.__gt__ = MagicMock()
+        fake_all = fake_lyrics.query.with_entities.return_value.filter.return_value.order_by.return_value \
+            .limit.return_value.all
+        fake_all.side_effect = [
+            [Row(1, 'Miracle', 'Caravan Palace', 'Caravan-palace-miracle'), Row(2, 'Hello', 'Adele', 'Adele-hello')],
+            [Row(5, 'bad vibes forever', 'XXXTENTACION', 'XXXTENTACION-bad-vibes-forever')],
+            [],
+        ]
+        with app.test_client() as c:
+            forbidden = c.get('/strippers/export', headers={'Authorization': 'wrong'})
+            resp = c.get('/strippers/export', headers={'Authorization': ''})
+            lines = resp.data.decode().splitlines()
+
+        assert forbidden.status_code == 403
+        assert resp.mimetype == 'application/x-ndjson'
+        assert [json.loads(line)['stripper'] for line in lines] == [
+            'Caravan-palace-miracle', 'Adele-hello', 'XXXTENTACION-bad-vibes-forever']
+        # fetched by id after the last row of each chunk
+        assert fake_lyrics.id.__gt__.call_args_list[-1].args == (5,)
+
+    @patch('swaglyrics_backend.issue_maker.norm_key_column', True)
+    @patch('swaglyrics_backend.issue_maker.get_strippers_from_db')
+    @patch('swaglyrics_backend.issue_maker.db')
+    @patch('swaglyrics_backend.issue_maker.Lyrics')
+    def test_that_strippers_import_bulk_inserts_new_rows(self, fake_lyrics, fake_db, fake_get_strippers):
+        from swaglyrics_backend.issue_maker import app, genius_misses, normalize_key
+        fake_get_strippers.side_effect = lambda pairs: {
+            pair: 'Caravan-palace-miracle' for pair in pairs if pair == ('Miracle', 'Caravan Palace')}
+        genius_misses.set(normalize_key('Hello', 'Adele'), True)
+        body = '\n'.join([
+            json.dumps({'song': 'Miracle', 'artist': 'Caravan Palace', 'stripper': 'Caravan-palace-miracle'}),
+            json.dumps({'song': 'Hello', 'artist': 'Adele', 'stripper': 'Adele-hello'}),
+            json.dumps({'song': 'Hello', 'artist': 'Adele', 'stripper': 'duplicate'}),
+            '',
+            'not json',
+            json.dumps({'song': 'no stripper'}),
+            json.dumps({'song': 'Lone Digger', 'artist': 'Caravan Palace', 'stripper': 'Caravan-palace-lone-digger'}),
+        ])
+        with app.test_client() as c:
+            forbidden = c.post('/strippers/import', data=body, headers={'Authorization': 'wrong'})
+            resp = c.post('/strippers/import', data=body, headers={'Authorization': ''})
+
+        assert forbidden.status_code == 403
+        assert resp.get_json() == {'added': 2, 'skipped': 2, 'invalid': 2}
+        mappings = fake_db.session.bulk_insert_mappings.call_args.args[1]
+        assert [(row['song'], row['stripper'], row['norm_key']) for row in mappings] == [
+            ('Hello', 'Adele-hello', 'hello|adele'),
+            ('Lone Digger', 'Caravan-palace-lone-digger', 'lone digger|caravan palace')]
+        assert fake_db.session.commit.call_count == 1
+        assert normalize_key('Hello', 'Adele') not in genius_misses
+
+    @patch('swaglyrics_backend.issue_maker._import_chunk', side_effect=lambda chunk: len(chunk))
+    def test_that_import_strippers_commits_in_chunks(self, fake_import_chunk):
+        from swaglyrics_backend.issue_maker import import_strippers
+        lines = [json.dumps({'song': str(i), 'artist': 'a', 'stripper': str(i)}) for i in range(5)]
+
+        assert import_strippers(lines, chunk_size=2) == {'added': 5, 'skipped': 0, 'invalid': 0}
+        assert fake_import_chunk.call_count == 3
+
+    @patch('swaglyrics_backend.utils.github_hooks', [ip_address('192.30.252.1')])
+    @patch('swaglyrics_backend.issue_maker.validate_request')
+    def test_issue_closed_webhook_is_queued_once(self, fake_validate):
+        from swaglyrics_backend.issue_maker import app, unsupported, webhook_jobs
+        fake_validate.return_value = {
+            'action': 'closed',
+            'issue': {'title': 'Miracle by Caravan Palace unsupported.', 'labels': [{'name': 'unsupported song'}]},
+            'repository': {'name': 'SwagLyrics-For-Spotify'},
+        }
+        headers = {'X-GitHub-Event': 'issues', 'X-GitHub-Delivery': '72d3162e', 'X-Hub-Signature': 'sha1=fake',
+                   'User-Agent': 'GitHub-Hookshot/044aadd', 'X-Real-IP': '192.30.252.1'}
+        generate_fake_unsupported()
+        with app.test_client() as c:
+            resp = c.post('/issue_closed', json={}, headers=headers)
+            assert resp.status_code == 202
+            assert ('Miracle', 'Caravan Palace') in unsupported  # not handled yet
+            assert webhook_jobs.run_pending() == 1
+            assert ('Miracle', 'Caravan Palace') not in unsupported
+            assert webhook_jobs.status(resp.get_json()['job'])['result'] == 'Deleted 1 instances from unsupported.txt'
+
+            # GitHub redelivering it costs nothing
+            again = c.post('/issue_closed', json={}, headers=headers)
+            assert again.status_code == 202
+            assert again.get_json() == {'msg': 'Already queued', 'job': resp.get_json()['job']}
+            assert webhook_jobs.run_pending() == 0
+
+            ping = c.post('/issue_closed', json={}, headers={**headers, 'X-GitHub-Event': 'ping'})
+            assert json.loads(ping.data) == {'msg': 'pong'}
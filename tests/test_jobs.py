@@ -0,0 +1,122 @@
+from unittest.mock import patch
+
+from tests.base import TestBase, remove_jobs_db
+
+
+class TestJobs(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        remove_jobs_db()
+
+    def test_that_jobs_run_in_order(self):
+        from swaglyrics_backend.jobs import JobQueue
+        ran = []
+        jobs = JobQueue('jobs.sqlite3', lambda job: ran.append(job['n']) or f"ran {job['n']}", workers=0)
+        first, _ = jobs.submit('first', {'n': 1})
+        second, _ = jobs.submit('second', {'n': 2})
+
+        assert jobs.status(first)['status'] == 'queued'
+        assert jobs.run_pending(limit=1) == 1
+        assert jobs.run_pending() == 1
+        assert ran == [1, 2]
+        assert jobs.status(second)['result'] == 'ran 2'
+
+    def test_that_key_can_be_queued_again_once_done(self):
+        from swaglyrics_backend.jobs import JobQueue
+        jobs = JobQueue('jobs.sqlite3', lambda job: 'done', workers=0)
+        first, created = jobs.submit('Miracle by Caravan Palace', {})
+        assert (first, False) == jobs.submit('Miracle by Caravan Palace', {})
+        jobs.run_pending()
+        second, created = jobs.submit('Miracle by Caravan Palace', {})
+        assert created and second != first
+
+    def test_that_once_skips_keys_already_done(self):
+        from swaglyrics_backend.jobs import JobQueue
+        ran = []
+        jobs = JobQueue('jobs.sqlite3', lambda job: ran.append(job) or 'done', workers=0)
+        first, created = jobs.submit('delivery-1', {}, once=True)
+        jobs.run_pending()
+        assert jobs.submit('delivery-1', {}, once=True) == (first, False)
+        assert jobs.run_pending() == 0
+        assert len(ran) == 1
+        # without once it's queued again
+        assert jobs.submit('delivery-1', {})[1]
+
+    def test_that_expired_leases_are_picked_up_again(self):
+        from swaglyrics_backend.jobs import JobQueue
+        jobs = JobQueue('jobs.sqlite3', lambda job: 'done', workers=0, lease=60)
+        job_id, _ = jobs.submit('Miracle by Caravan Palace', {})
+        jobs._claim()  # a worker claims the job and dies
+        assert jobs.run_pending() == 0
+
+        with patch('swaglyrics_backend.jobs.time.time', return_value=jobs.status(job_id)['updated'] + 61):
+            assert jobs.run_pending() == 1
+        assert jobs.status(job_id)['status'] == 'done'
+
+    def test_that_purge_deletes_old_finished_jobs(self):
+        from swaglyrics_backend.jobs import JobQueue
+        jobs = JobQueue('jobs.sqlite3', lambda job: 'done', workers=0, retention=0)
+        done, _ = jobs.submit('done', {})
+        jobs.run_pending()
+        queued, _ = jobs.submit('queued', {})
+
+        assert jobs.purge() == 1
+        assert jobs.status(done) is None
+        assert jobs.status(queued)['status'] == 'queued'
+
+    def test_that_running_jobs_keep_their_lease(self):
+        import time
+        from swaglyrics_backend.jobs import JobQueue
+        claimed = []
+
+        def slow(job):
+            time.sleep(0.5)
+            # the lease ran out a while ago if it wasn't renewed
+            claimed.append(jobs._claim())
+            return 'done'
+
+        jobs = JobQueue('jobs.sqlite3', slow, workers=0, lease=0.3)
+        job_id, _ = jobs.submit('Miracle by Caravan Palace', {})
+        assert jobs.run_pending() == 1
+        assert claimed == [None]
+        assert jobs.status(job_id)['attempts'] == 1
+
+    def test_that_jobs_are_given_up_after_max_attempts(self):
+        from swaglyrics_backend.jobs import JobQueue
+        jobs = JobQueue('jobs.sqlite3', lambda job: 'done', workers=0, lease=60, max_attempts=2)
+        job_id, _ = jobs.submit('Miracle by Caravan Palace', {})
+        now = jobs.status(job_id)['updated']
+        for attempt in range(2):
+            # a worker claims the job and dies
+            with patch('swaglyrics_backend.jobs.time.time', return_value=now + attempt * 61):
+                assert jobs._claim()['id'] == job_id
+
+        with patch('swaglyrics_backend.jobs.time.time', return_value=now + 2 * 61):
+            assert jobs.run_pending() == 0
+        job = jobs.status(job_id)
+        assert (job['status'], job['result'], job['attempts']) == ('failed', 'gave up after 2 attempts', 2)
+        # the key can be queued again
+        assert jobs.submit('Miracle by Caravan Palace', {})[1]
+
+    def test_that_workers_are_started_for_jobs_queued_before_a_restart(self):
+        from swaglyrics_backend.jobs import JobQueue
+        job_id, _ = JobQueue('jobs.sqlite3', lambda job: 'done', workers=0).submit('Miracle by Caravan Palace', {})
+        # the process restarts, a redelivery of the same job starts the workers
+        jobs = JobQueue('jobs.sqlite3', lambda job: 'done', workers=1)
+        with patch('swaglyrics_backend.jobs.threading.Thread') as fake_thread:
+            assert jobs.submit('Miracle by Caravan Palace', {}) == (job_id, False)
+            jobs.start()
+
+        assert fake_thread.call_count == 1
+        assert fake_thread.return_value.start.called
+
+    @patch('swaglyrics_backend.issue_maker.webhook_jobs')
+    @patch('swaglyrics_backend.issue_maker.unsupported_jobs')
+    def test_that_requests_start_the_workers(self, fake_unsupported_jobs, fake_webhook_jobs):
+        from swaglyrics_backend.issue_maker import app
+        with app.test_client() as c:
+            c.get('/version')
+
+        assert fake_unsupported_jobs.start.called
+        assert fake_webhook_jobs.start.called
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+from unittest.mock import patch
+
+from tests.base import TestBase
+
+
+def remove_limits_file():
+    if os.path.exists('limits.shm'):
+        os.remove('limits.shm')
+
+
+def hit_many(n):
+    from limits import parse
+    from limits.strategies import FixedWindowRateLimiter
+    from swaglyrics_backend.limits_storage import SharedMemoryStorage
+    limiter = FixedWindowRateLimiter(SharedMemoryStorage('shm://limits.shm'))
+    for _ in range(n):
+        limiter.hit(parse('1000/hour'), 'stripper', '127.0.0.1')
+
+
+class TestLimitsStorage(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        remove_limits_file()
+
+    def tearDown(self):
+        remove_limits_file()
+
+    def test_fixed_window(self):
+        from limits import parse
+        from limits.strategies import FixedWindowRateLimiter
+        from limits.storage import storage_from_string
+        from swaglyrics_backend.limits_storage import SharedMemoryStorage
+        storage = storage_from_string('shm://limits.shm?slots=64&windows=4&capacity=8')
+        assert isinstance(storage, SharedMemoryStorage)
+        assert (storage.slots, storage.windows, storage.capacity) == (64, 4, 8)
+        limiter = FixedWindowRateLimiter(storage)
+        item = parse('2/minute')
+        assert limiter.hit(item, 'stripper', '127.0.0.1')
+        assert limiter.hit(item, 'stripper', '127.0.0.1')
+        assert not limiter.hit(item, 'stripper', '127.0.0.1')
+        assert limiter.hit(item, 'stripper', '127.0.0.2')
+        reset, remaining = limiter.get_window_stats(item, 'stripper', '127.0.0.1')
+        assert remaining == 0 and reset > 0
+
+        with patch('swaglyrics_backend.limits_storage.time.time', return_value=reset + 1):
+            assert limiter.hit(item, 'stripper', '127.0.0.1')
+        storage.clear(item.key_for('stripper', '127.0.0.2'))
+        assert limiter.get_window_stats(item, 'stripper', '127.0.0.2')[1] == 2
+
+    def test_moving_window(self):
+        from limits import parse
+        from limits.strategies import MovingWindowRateLimiter
+        from swaglyrics_backend.limits_storage import SharedMemoryStorage
+        storage = SharedMemoryStorage('shm://limits.shm', windows=4, capacity=8)
+        limiter = MovingWindowRateLimiter(storage)
+        item = parse('3/minute')
+        with patch('swaglyrics_backend.limits_storage.time.time') as now:
+            for second in [0, 20, 40]:
+                now.return_value = 1000 + second
+                assert limiter.hit(item, 'unsupported', '127.0.0.1')
+            assert not limiter.hit(item, 'unsupported', '127.0.0.1')
+            assert limiter.get_window_stats(item, 'unsupported', '127.0.0.1') == (1060, 0)
+            # the first hit leaves the window
+            now.return_value = 1061
+            assert limiter.get_window_stats(item, 'unsupported', '127.0.0.1') == (1080, 1)
+            assert limiter.hit(item, 'unsupported', '127.0.0.1')
+            assert not limiter.test(item, 'unsupported', '127.0.0.1')
+
+    def test_that_other_processes_share_counters(self):
+        from limits import parse
+        from limits.strategies import FixedWindowRateLimiter
+        from swaglyrics_backend.limits_storage import SharedMemoryStorage
+        storage = SharedMemoryStorage('shm://limits.shm')
+        workers = [multiprocessing.get_context('fork').Process(target=hit_many, args=(50,)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        limiter = FixedWindowRateLimiter(storage)
+        assert limiter.get_window_stats(parse('1000/hour'), 'stripper', '127.0.0.1')[1] == 800
+
+    def test_that_a_full_table_evicts(self):
+        from swaglyrics_backend.limits_storage import SharedMemoryStorage
+        storage = SharedMemoryStorage('shm://limits.shm', slots=4)
+        for i in range(5):
+            storage.incr(f'key {i}', 60)
+        assert sum(storage.get(f'key {i}') for i in range(5)) == 4
+        assert storage.get('key 4') == 1
+        storage.reset()
+        assert storage.get('key 4') == 0
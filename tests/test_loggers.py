@@ -65,11 +65,11 @@ class TestIssueMaker(TestBase):
         }
     }
 
-    @patch('swaglyrics_backend.issue_maker.requests.post')
+    @patch('swaglyrics_backend.http_client.post')
     def test_discord_deploy_logger_works(self, fake_post):
         # also tests embed creation
         fake_post.return_value.status_code = 200
-        from swaglyrics_backend.issue_maker import discord_deploy_logger
+        from swaglyrics_backend.loggers import discord_deploy_logger
         with self.assertLogs() as logs:
             discord_deploy_logger(self.github_payload_json)
         embed = fake_post.call_args.kwargs['json']['embeds'][0]
@@ -79,47 +79,105 @@ class TestIssueMaker(TestBase):
         assert embed['author']['url'] == "https://github.com/aadibajpai"
         assert embed['title'] == "fix test"
 
-    @patch('swaglyrics_backend.issue_maker.requests.post')
+    @patch('swaglyrics_backend.http_client.post')
     def test_discord_deploy_logger_handles_error(self, fake_post):
         # also tests embed creation
         fake_post.return_value.status_code = 500
-        from swaglyrics_backend.issue_maker import discord_deploy_logger
+        from swaglyrics_backend.loggers import discord_deploy_logger
         with self.assertLogs() as logs:
             discord_deploy_logger(self.github_payload_json)
 
         assert "discord message send failed: 500" in logs.output[0]
 
-    @patch('swaglyrics_backend.issue_maker.requests.post')
-    def test_discord_genius_logger_works_when_stripper_found(self, fake_post):
+    @patch('swaglyrics_backend.http_client.post')
+    def test_discord_queue_coalesces_embeds(self, fake_post):
         fake_post.return_value.status_code = 200
-        from swaglyrics_backend.issue_maker import discord_genius_logger
+        from swaglyrics_backend.loggers import DiscordQueue, genius_embed
+        discord_queue = DiscordQueue(autostart=False)
+        for i in range(12):
+            discord_queue.put('DISCORD_URL_GENIUS', genius_embed(f'song {i}', 'artist', None))
+        discord_queue.put('DISCORD_URL_INSTRUMENTAL', genius_embed('song', 'artist', None))
+        discord_queue.flush()
+
+        sizes = [len(call.kwargs['json']['embeds']) for call in fake_post.call_args_list]
+        assert sizes == [10, 2, 1]
+        assert discord_queue.queue.empty()
+
+    @patch('swaglyrics_backend.loggers.time.sleep')
+    @patch('swaglyrics_backend.http_client.post')
+    def test_discord_queue_honours_retry_after(self, fake_post, fake_sleep):
+        limited = Response()
+        limited.status_code = 429
+        limited.headers['Retry-After'] = '2.5'
+        ok = Response()
+        ok.status_code = 200
+        fake_post.side_effect = [limited, ok]
+        from swaglyrics_backend.loggers import DiscordQueue, genius_embed
         with self.assertLogs() as logs:
-            discord_genius_logger('Hello', 'Adele', 'Adele-hello')
-        assert "sent discord genius message" in logs.output[0]
+            sent = DiscordQueue(autostart=False).send('DISCORD_URL_GENIUS', [genius_embed('Hello', 'Adele', None)])
 
-    @patch('swaglyrics_backend.issue_maker.requests.post')
-    def test_discord_genius_logger_handles_error(self, fake_post):
-        fake_post.return_value.status_code = 500
-        from swaglyrics_backend.issue_maker import discord_genius_logger
-        with self.assertLogs() as logs:
-            discord_genius_logger('bruh', 'heck', None)
-        assert "discord genius message send failed: 500" in logs.output[0]
-
-    @patch('swaglyrics_backend.issue_maker.requests.post')
-    def test_discord_instrumental_logger_works(self, fake_post):
-        # figure out a way to also test embed creation
-        response = Response()
-        response.status_code = 200
-        fake_post.return_value = response
-        from swaglyrics_backend.issue_maker import discord_instrumental_logger
-        with self.assertLogs() as logs:
-            discord_instrumental_logger('changes', 'XXXTENTACION', False, 0.69, 0.42)
-        assert "sent discord instrumental message" in logs.output[0]
+        assert sent
+        fake_sleep.assert_called_once_with(2.5)
+        assert "sent discord message with 1 embeds" in logs.output[1]
 
-    @patch('swaglyrics_backend.issue_maker.requests.post')
-    def test_discord_instrumental_logger_handles_error(self, fake_post):
-        fake_post.return_value.status_code = 529
-        from swaglyrics_backend.issue_maker import discord_instrumental_logger
+    @patch('swaglyrics_backend.http_client.post')
+    def test_discord_queue_spills_when_full(self, fake_post):
+        import os
+        fake_post.return_value.status_code = 200
+        from swaglyrics_backend.loggers import DiscordQueue, genius_embed
+        if os.path.exists('discord_spill.jsonl'):
+            os.remove('discord_spill.jsonl')
+        discord_queue = DiscordQueue(maxsize=1, spill_path='discord_spill.jsonl', autostart=False)
+        with self.assertLogs() as logs:
+            discord_queue.put('DISCORD_URL_GENIUS', genius_embed('Hello', 'Adele', None))
+            discord_queue.put('DISCORD_URL_GENIUS', genius_embed('Skyfall', 'Adele', None))
+        assert "spilled 1 embeds to discord_spill.jsonl" in logs.output[0]
+
+        discord_queue.flush()
+        discord_queue._unspill()
+        discord_queue.flush()
+        titles = [call.kwargs['json']['embeds'][0]['title'] for call in fake_post.call_args_list]
+        assert titles == ["Genius Stripper for Hello by Adele.", "Genius Stripper for Skyfall by Adele."]
+        assert not os.path.exists('discord_spill.jsonl')
+
+    @patch('swaglyrics_backend.http_client.post')
+    def test_discord_queue_survives_bad_messages(self, fake_post):
+        import os
+        fake_post.return_value.status_code = 200
+        from swaglyrics_backend.loggers import DiscordQueue, genius_embed
+        with open('discord_spill.jsonl', 'w') as f:
+            f.write('{"webhook": "DISCORD_URL_GENIUS", "embed": {"title": "spilled"}}\n{"webhook": "DISCORD_\n')
+        discord_queue = DiscordQueue(spill_path='discord_spill.jsonl', autostart=False)
         with self.assertLogs() as logs:
-            discord_instrumental_logger('Up There', 'Frontliner & Geck-o', True, 0.31, 0.12)
-        assert "discord instrumental message send failed: 529" in logs.output[0]
+            discord_queue.put('DISCORD_URL_MISSING', genius_embed('Hello', 'Adele', None))
+            discord_queue.put('DISCORD_URL_GENIUS', genius_embed('Skyfall', 'Adele', None))
+            discord_queue.flush()
+            discord_queue._unspill()
+            discord_queue.flush()
+
+        assert any("discord webhook DISCORD_URL_MISSING is not set" in line for line in logs.output)
+        assert any("dropped bad discord spill line" in line for line in logs.output)
+        titles = [call.kwargs['json']['embeds'][0]['title'] for call in fake_post.call_args_list]
+        assert titles == ["Genius Stripper for Skyfall by Adele.", "spilled"]
+        assert not os.path.exists('discord_spill.jsonl')
+
+    def test_discord_queue_thread_keeps_running(self):
+        import threading
+        import time
+        from swaglyrics_backend.loggers import DiscordQueue, genius_embed
+        discord_queue = DiscordQueue(autostart=False)
+        with patch.object(discord_queue, 'send', side_effect=[KeyError('boom'), True]) as fake_send:
+            threading.Thread(target=discord_queue._run, daemon=True).start()
+            discord_queue.put('DISCORD_URL_GENIUS', genius_embed('Hello', 'Adele', None))
+            for _ in range(200):
+                if discord_queue.queue.empty() and fake_send.call_count:
+                    break
+                time.sleep(0.01)
+            discord_queue.put('DISCORD_URL_GENIUS', genius_embed('Skyfall', 'Adele', None))
+            for _ in range(200):
+                if fake_send.call_count == 2:
+                    break
+                time.sleep(0.01)
+
+        assert fake_send.call_count == 2
+        assert fake_send.call_args.args[1][0]['title'] == "Genius Stripper for Skyfall by Adele."
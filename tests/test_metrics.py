@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+
+from tests.base import TestBase
+
+
+class TestMetrics(TestBase):
+
+    def test_render_counters_and_histograms(self):
+        from swaglyrics_backend.metrics import Metrics
+        metrics = Metrics(buckets=(0.1, 1))
+        metrics.inc('swaglyrics_cache_requests_total', cache='stripper', result='hit')
+        metrics.inc('swaglyrics_cache_requests_total', 2, cache='stripper', result='hit')
+        metrics.observe('swaglyrics_http_request_duration_seconds', 0.05, route='/stripper')
+        metrics.observe('swaglyrics_http_request_duration_seconds', 0.5, route='/stripper')
+        metrics.observe('swaglyrics_http_request_duration_seconds', 5, route='/stripper')
+        metrics.inc('odd_total', label='say "hi"\n')
+        lines = metrics.render().splitlines()
+
+        assert '# TYPE swaglyrics_cache_requests_total counter' in lines
+        assert 'swaglyrics_cache_requests_total{cache="stripper",result="hit"} 3' in lines
+        assert '# TYPE swaglyrics_http_request_duration_seconds histogram' in lines
+        assert lines[-5:] == [
+            'swaglyrics_http_request_duration_seconds_bucket{route="/stripper",le="0.1"} 1',
+            'swaglyrics_http_request_duration_seconds_bucket{route="/stripper",le="1"} 2',
+            'swaglyrics_http_request_duration_seconds_bucket{route="/stripper",le="+Inf"} 3',
+            'swaglyrics_http_request_duration_seconds_sum{route="/stripper"} 5.55',
+            'swaglyrics_http_request_duration_seconds_count{route="/stripper"} 3',
+        ]
+        assert r'odd_total{label="say \"hi\"\n"} 1' in lines
+
+    def test_disabled_metrics_record_nothing(self):
+        from swaglyrics_backend.metrics import Metrics
+        metrics = Metrics(enabled=False)
+        metrics.inc('swaglyrics_cache_requests_total')
+        with metrics.timer('swaglyrics_http_request_duration_seconds'):
+            pass
+        assert metrics.render() == '\n'
+
+    def test_timer_labels(self):
+        from swaglyrics_backend.metrics import Metrics
+        metrics = Metrics()
+        with metrics.timer('swaglyrics_upstream_request_duration_seconds', upstream='genius_search') as labels:
+            labels['status'] = '200'
+        assert metrics.histograms[('swaglyrics_upstream_request_duration_seconds',
+                                   (('status', '200'), ('upstream', 'genius_search')))][-1] == 1
+
+    def test_processes_are_added_up(self):
+        from swaglyrics_backend.metrics import Metrics
+        with tempfile.TemporaryDirectory() as directory:
+            worker, other_worker = Metrics(directory), Metrics()
+            worker.inc('swaglyrics_cache_requests_total', cache='stripper', result='hit')
+            other_worker.inc('swaglyrics_cache_requests_total', 2, cache='stripper', result='hit')
+            # what another worker process would have dumped
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump(other_worker.snapshot(), f)
+            lines = worker.render().splitlines()
+            dumped = os.path.exists(os.path.join(directory, f'{os.getpid()}.json'))
+
+        assert 'swaglyrics_cache_requests_total{cache="stripper",result="hit"} 3' in lines
+        assert dumped
+
+    def test_snapshots_of_exited_workers_are_removed(self):
+        from swaglyrics_backend.metrics import Metrics
+        with tempfile.TemporaryDirectory() as directory:
+            worker, exited_worker = Metrics(directory, interval=10), Metrics()
+            exited_worker.inc('swaglyrics_cache_requests_total', cache='stripper', result='hit')
+            stale = os.path.join(directory, '2.json')
+            with open(stale, 'w') as f:
+                json.dump(exited_worker.snapshot(), f)
+            # last rewritten a minute ago, longer than a running worker goes between dumps
+            os.utime(stale, (os.path.getmtime(stale) - 60,) * 2)
+            lines = worker.render().splitlines()
+            removed = not os.path.exists(stale)
+
+        assert 'swaglyrics_cache_requests_total{cache="stripper",result="hit"} 1' not in lines
+        assert removed
+
+    def test_named_caches_count_lookups(self):
+        from swaglyrics_backend.cache import TTLCache
+        from swaglyrics_backend.metrics import metrics
+        cache = TTLCache(2, name='test')
+        cache.set('a', None)
+        cache.get('a')
+        assert 'a' in cache
+        assert 'b' not in cache
+
+        assert metrics.counters[('swaglyrics_cache_requests_total', (('cache', 'test'), ('result', 'hit')))] == 2
+        assert metrics.counters[('swaglyrics_cache_requests_total', (('cache', 'test'), ('result', 'miss')))] == 1
+
+    def test_metrics_endpoint(self):
+        from swaglyrics_backend.issue_maker import app
+        with app.test_client() as c:
+            c.get('/version')
+            anonymous = c.get('/metrics')
+            resp = c.get('/metrics', headers={'Authorization': 'Bearer '})
+
+        assert anonymous.status_code == 403
+        assert resp.mimetype == 'text/plain'
+        assert 'swaglyrics_http_request_duration_seconds_count{method="GET",route="/version",status="200"}' \
+            in resp.data.decode()
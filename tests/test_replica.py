@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
+from tests.base import TestBase
+
+rows = [
+    (1, 'Miracle', 'Caravan Palace', 'Caravan-palace-miracle'),
+    (2, 'Hey Jude', 'The Beatles', 'The-beatles-hey-jude'),
+    (3, 'Miracle', 'Caravan Palace', 'this should not be used'),
+]
+
+
+def remove_replica():
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(f'replica.sqlite3{suffix}'):
+            os.remove(f'replica.sqlite3{suffix}')
+
+
+class TestReplica(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        remove_replica()
+
+    def tearDown(self):
+        remove_replica()
+
+    def test_that_replica_copies_new_rows_only(self):
+        from swaglyrics_backend.replica import StripperReplica
+        loaded = []
+
+        def load_rows(after_id):
+            loaded.append(after_id)
+            return [row for row in rows if row[0] > after_id]
+
+        replica = StripperReplica('replica.sqlite3', load_rows, max_age=0)
+        assert replica.refresh() == 3
+        assert replica.lookup([('Miracle', 'Caravan Palace'), ('hey jude', 'the beatles'), ('Navajo', 'Masego')]) == {
+            ('Miracle', 'Caravan Palace'): 'Caravan-palace-miracle',
+            ('hey jude', 'the beatles'): 'The-beatles-hey-jude',
+        }
+        assert replica.refresh() == 0
+        assert loaded == [0, 3]
+
+    def test_that_lookups_reuse_a_connection(self):
+        import sqlite3
+        from swaglyrics_backend.replica import StripperReplica
+        replica = StripperReplica('replica.sqlite3', lambda after_id: [row for row in rows if row[0] > after_id])
+        replica.refresh()
+        with patch('swaglyrics_backend.replica.sqlite3.connect', wraps=sqlite3.connect) as connect:
+            for _ in range(3):
+                assert replica.lookup([('Miracle', 'Caravan Palace')]) == {
+                    ('Miracle', 'Caravan Palace'): 'Caravan-palace-miracle'}
+        assert connect.call_count == 1
+
+    def test_that_added_rows_dont_skip_rows_from_other_nodes(self):
+        from swaglyrics_backend.replica import StripperReplica
+        replica = StripperReplica('replica.sqlite3', lambda after_id: [row for row in rows[:1] if row[0] > after_id],
+                                  max_age=0)
+        replica.refresh()
+        # this worker adds row 3 while row 2 was added elsewhere
+        replica.add(rows[2])
+        replica.load_rows = lambda after_id: [row for row in rows if row[0] > after_id]
+        assert replica.refresh() == 2
+        assert replica.lookup([('Hey Jude', 'The Beatles')]) == {('Hey Jude', 'The Beatles'): 'The-beatles-hey-jude'}
+
+    def test_that_replica_is_trusted_until_it_lags(self):
+        from swaglyrics_backend.replica import StripperReplica
+        replica = StripperReplica('replica.sqlite3', lambda after_id: [], max_age=60, max_lag=600)
+        with patch.object(replica, 'refresh_in_background') as refresh:
+            assert not replica.fresh
+            assert refresh.called
+        replica.refresh()
+        # a new worker picks up when the file was last refreshed
+        other = StripperReplica('replica.sqlite3', lambda after_id: [], max_age=60, max_lag=600)
+        with patch.object(other, 'refresh_in_background') as refresh:
+            assert other.fresh
+            assert not refresh.called
+            other.synced_at = time.time() - 120
+            assert other.fresh
+            assert refresh.called
+            other.synced_at = time.time() - 1200
+            assert not other.fresh
+        assert not StripperReplica(None, lambda after_id: []).fresh
+
+    def test_that_stripper_lookups_use_the_replica(self):
+        from swaglyrics_backend.issue_maker import get_stripper_from_db, get_strippers_from_db, stripper_replica, \
+            stripper_cache
+        stripper_cache.clear()
+        with patch.object(stripper_replica, 'path', 'replica.sqlite3'), \
+                patch.object(stripper_replica, 'load_rows', lambda after_id: rows), \
+                patch.object(stripper_replica, '_local', threading.local()), \
+                patch('swaglyrics_backend.issue_maker.Lyrics') as fake_lyrics:
+            stripper_replica.create_schema()
+            stripper_replica.refresh()
+            assert get_stripper_from_db('Miracle', 'Caravan Palace') == 'Caravan-palace-miracle'
+            assert get_stripper_from_db('Navajo', 'Masego') is None
+            assert get_strippers_from_db([('Hey Jude', 'The Beatles')]) == {
+                ('Hey Jude', 'The Beatles'): 'The-beatles-hey-jude'}
+            assert not fake_lyrics.query.called
+        stripper_replica.synced_at = None
+        stripper_cache.clear()
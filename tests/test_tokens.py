@@ -0,0 +1,67 @@
+import threading
+import time
+from unittest.mock import patch
+
+from tests.base import TestBase
+
+
+class TestTokens(TestBase):
+
+    def test_that_concurrent_callers_share_one_refresh(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from swaglyrics_backend.tokens import TokenManager
+        calls = []
+
+        def provider():
+            calls.append(1)
+            time.sleep(0.1)  # slow token endpoint
+            return f'token {len(calls)}', time.time() + 3600
+
+        tokens = TokenManager('test', provider, background=False)
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: tokens.get(), range(8)))
+
+        assert results == ['token 1'] * 8
+        assert len(calls) == 1
+
+    def test_that_token_is_renewed_in_background_before_expiry(self):
+        from swaglyrics_backend.tokens import TokenManager
+        release = threading.Event()
+
+        def provider():
+            release.wait(5)  # slow token endpoint
+            return 'new token', time.time() + 3600
+
+        tokens = TokenManager('test', provider, margin=60, refresh_ahead=600)
+        tokens.token, tokens.expiry = 'old token', time.time() + 300  # still usable but due for renewal
+
+        assert tokens.get() == 'old token'  # doesn't wait for the refresh
+        release.set()
+        for _ in range(100):
+            if tokens.token == 'new token':
+                break
+            time.sleep(0.01)
+        assert tokens.get() == 'new token'
+        tokens._timer.cancel()
+
+    def test_that_failed_background_refresh_keeps_token(self):
+        from swaglyrics_backend.tokens import TokenManager
+
+        def provider():
+            raise ConnectionError('spotify is down')
+
+        tokens = TokenManager('test', provider, margin=60, refresh_ahead=600)
+        tokens.token, tokens.expiry = 'old token', time.time() + 300
+        with self.assertLogs() as logs:
+            tokens._background_refresh()
+
+        assert "test token background refresh failed" in logs.output[-1]
+        assert tokens.token == 'old token'
+
+    @patch('swaglyrics_backend.http_client.post')
+    def test_spotify_client_credentials_token(self, fake_post):
+        from swaglyrics_backend.tokens import spotify_client_credentials_token
+        fake_post.return_value.json.return_value = {'access_token': 'NgCXRKMzYjw', 'expires_in': 1800}
+        token, expiry = spotify_client_credentials_token()
+        assert token == 'NgCXRKMzYjw'
+        assert 1790 < expiry - time.time() <= 1800
@@ -0,0 +1,218 @@
+import os
+
+from tests.base import TestBase, generate_fake_unsupported
+
+
+class TestUnsupported(TestBase):
+
+    def test_that_store_reads_file(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        assert ('Miracle', 'Caravan Palace') in store
+        assert ('Miracle', 'Caravan') not in store
+        assert len(store) == 2
+
+    def test_that_store_adds_and_persists(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        store.add('Lone Digger', 'Caravan Palace')
+        assert ('Lone Digger', 'Caravan Palace') in store
+        with open('unsupported.txt.log') as f:
+            assert f.read() == '+Lone Digger by Caravan Palace\n'
+        assert UnsupportedStore('unsupported.txt').lines()[-1] == 'Lone Digger by Caravan Palace\n'
+
+    def test_that_store_removes_all_instances(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        store.add('Miracle', 'Caravan Palace')
+        assert store.remove('Miracle', 'Caravan Palace') == 2
+        assert store.remove('Miracle', 'Caravan Palace') == 0
+        assert store.text() == 'Supersonics by Caravan Palace\n'
+        store.compact()
+        with open('unsupported.txt') as f:
+            assert f.read() == 'Supersonics by Caravan Palace\n'
+
+    def test_that_store_picks_up_external_changes(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        assert ('Miracle', 'Caravan Palace') in store
+        with open('unsupported.txt', 'w') as f:
+            f.write('Rock It for Me by Caravan Palace\n')
+        assert ('Miracle', 'Caravan Palace') not in store
+        assert store.lines() == ['Rock It for Me by Caravan Palace\n']
+
+    def test_that_store_folds_other_workers_changes(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        other = UnsupportedStore('unsupported.txt')
+        assert len(store) == len(other) == 2
+        other.add('Lone Digger', 'Caravan Palace')
+        other.remove('Miracle', 'Caravan Palace')
+        assert store.lines() == ['Supersonics by Caravan Palace\n', 'Lone Digger by Caravan Palace\n']
+        # a half written entry is left until the rest of it is appended
+        with open('unsupported.txt.log', 'a') as f:
+            f.write('+Hello by')
+        assert ('Hello', 'Adele') not in store
+        with open('unsupported.txt.log', 'a') as f:
+            f.write(' Adele\n')
+        assert ('Hello', 'Adele') in store
+
+    def test_that_store_compacts_the_log(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt', compact_after=3, background=False)
+        other = UnsupportedStore('unsupported.txt')
+        store.add('Lone Digger', 'Caravan Palace')
+        store.remove('Supersonics', 'Caravan Palace')
+        assert other.text() == 'Miracle by Caravan Palace\nLone Digger by Caravan Palace\n'
+        store.add('Hello', 'Adele')
+        assert not os.path.exists('unsupported.txt.log')
+        with open('unsupported.txt') as f:
+            assert f.read() == 'Miracle by Caravan Palace\nLone Digger by Caravan Palace\nHello by Adele\n'
+        # the other worker reloads the new snapshot
+        assert other.text() == store.text()
+        other.add('Miracle', 'Caravan Palace')
+        # lines keep the ids they had before compaction
+        assert store.page() == ([(1, 'Miracle by Caravan Palace', 2), (3, 'Lone Digger by Caravan Palace', 1),
+                                 (4, 'Hello by Adele', 1)], None)
+
+    def test_that_cut_off_compactions_lose_and_repeat_nothing(self):
+        from unittest.mock import patch
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        real_replace = os.replace
+
+        def crash(*args):
+            raise SystemExit
+
+        def replace(src, dst):
+            if dst == 'unsupported.txt':
+                crash()
+            real_replace(src, dst)
+
+        # the process dies before the new snapshot is in place, or before the folded log is deleted
+        for cut_off in [patch('os.replace', replace), patch('os.remove', crash)]:
+            generate_fake_unsupported()
+            store = UnsupportedStore('unsupported.txt')
+            store.add('Miracle', 'Caravan Palace')
+            store.add('Lone Digger', 'Caravan Palace')
+            with cut_off, self.assertRaises(SystemExit):
+                store.compact()
+
+            restarted = UnsupportedStore('unsupported.txt', background=False)
+            assert restarted.text() == ('Miracle by Caravan Palace\n' * 2 + 'Supersonics by Caravan Palace\n'
+                                        'Lone Digger by Caravan Palace\n')
+            restarted.add('Hello', 'Adele')
+            restarted.compact()
+            assert UnsupportedStore('unsupported.txt').text() == restarted.text()
+            assert len(restarted) == 5
+            assert not [name for name in os.listdir() if name.startswith('unsupported.txt.log')]
+
+    def test_that_store_version_changes_with_the_list(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        version, modified = store.version()
+        assert store.version() == (version, modified)
+        assert modified > 0
+        store.add('Lone Digger', 'Caravan Palace')
+        assert store.version()[0] != version
+        version = store.version()[0]
+        store.remove('Lone Digger', 'Caravan Palace')
+        assert store.version()[0] != version
+
+    def test_that_store_pages_through_lines(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        store.add('Miracle', 'Caravan Palace')
+        store.add('Lone Digger', 'Caravan Palace')
+        store.add('Hello', 'Adele')
+
+        entries, cursor = store.page(limit=2)
+        assert entries == [(1, 'Miracle by Caravan Palace', 2), (2, 'Supersonics by Caravan Palace', 1)]
+        assert cursor == 2
+        store.remove('Supersonics', 'Caravan Palace')
+        entries, cursor = store.page(cursor, limit=2)
+        assert entries == [(3, 'Lone Digger by Caravan Palace', 1), (4, 'Hello by Adele', 1)]
+        assert cursor is None
+
+        entries, cursor = store.page(query='caravan')
+        assert [line for _, line, _ in entries] == ['Miracle by Caravan Palace', 'Lone Digger by Caravan Palace']
+        assert store.page(query='caravan', limit=1) == ([(1, 'Miracle by Caravan Palace', 2)], 1)
+        assert store.page(1, query='caravan', limit=1) == ([(3, 'Lone Digger by Caravan Palace', 1)], None)
+
+    def test_that_cursors_work_across_workers_and_compactions(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt', compact_after=2, background=False)
+        store.add('Lone Digger', 'Caravan Palace')
+        entries, cursor = store.page(limit=2)
+        assert cursor == 2
+        # the log is compacted and the next page is asked of a worker that just started
+        store.remove('Miracle', 'Caravan Palace')
+        assert not os.path.exists('unsupported.txt.log')
+        other = UnsupportedStore('unsupported.txt')
+        other.add('Hello', 'Adele')
+        assert other.page(cursor) == store.page(cursor) == ([(3, 'Lone Digger by Caravan Palace', 1),
+                                                             (4, 'Hello by Adele', 1)], None)
+        # ids of removed lines aren't handed out again
+        other.remove('Hello', 'Adele')
+        store.compact()
+        store.add('Rock It for Me', 'Caravan Palace')
+        assert UnsupportedStore('unsupported.txt').page(3) == ([(5, 'Rock It for Me by Caravan Palace', 1)], None)
+
+    def test_that_hand_edited_snapshots_are_numbered_from_1(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt', compact_after=1, background=False)
+        store.add('Lone Digger', 'Caravan Palace')
+        with open('unsupported.txt', 'w') as f:
+            f.write('Rock It for Me by Caravan Palace\n')
+        assert store.page() == ([(1, 'Rock It for Me by Caravan Palace', 1)], None)
+
+    def test_that_streamed_text_matches_hand_edited_snapshots(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        # no newline at the end and reports of a song apart
+        with open('unsupported.txt', 'w') as f:
+            f.write('A by B\nC by D\nA by B')
+        store = UnsupportedStore('unsupported.txt')
+        assert ''.join(store.iter_text()) == store.text() == 'A by B\nA by B\nC by D\n'
+        store.add('E', 'F')
+        assert ''.join(store.iter_text(chunk_size=1)) == store.text() == 'A by B\nA by B\nC by D\nE by F\n'
+        generate_fake_unsupported()
+        with open('unsupported.txt', 'w') as f:
+            f.write('A by B\nC by D')
+        store.add('E', 'F')
+        assert ''.join(store.iter_text()) == store.text() == 'A by B\nC by D\nE by F\n'
+
+    def test_that_store_streams_text(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        store = UnsupportedStore('unsupported.txt')
+        assert list(store.iter_text(chunk_size=10))[0] == 'Miracle by'
+        assert ''.join(store.iter_text(chunk_size=10)) == store.text()
+        assert list(UnsupportedStore('missing.txt').iter_text()) == []
+        os.remove('missing.txt.lock')
+
+    def test_that_streamed_text_folds_the_log(self):
+        from swaglyrics_backend.unsupported import UnsupportedStore
+        generate_fake_unsupported()
+        with open('unsupported.txt', 'a') as f:
+            f.write('Miracle by Caravan Palace\nLone Digger by Caravan Palace\n')
+        store = UnsupportedStore('unsupported.txt')
+        store.add('Hello', 'Adele')
+        store.add('Supersonics', 'Caravan Palace')
+        store.remove('Lone Digger', 'Caravan Palace')
+        store.remove('Miracle', 'Caravan Palace')
+        store.add('Miracle', 'Caravan Palace')
+        store.add('Rock It for Me', 'Caravan Palace')
+
+        assert ''.join(store.iter_text(chunk_size=10)) == store.text() == (
+            'Supersonics by Caravan Palace\n' * 2 + 'Hello by Adele\nMiracle by Caravan Palace\n'
+            'Rock It for Me by Caravan Palace\n')
@@ -1,3 +1,6 @@
+import hashlib
+import hmac
+import logging
 from unittest.mock import patch
 
 import pytest
@@ -36,33 +39,77 @@ class TestUtils(TestBase):
         }
     }"""
 
-    @patch('swaglyrics_backend.utils.is_valid_signature', return_value=True)
-    def test_that_request_is_valid(self, signature_mock):
+    def sign(self, body, algorithm='sha1'):
+        # WEBHOOK_SECRET is empty in tests
+        return f'{algorithm}={hmac.new(b"", body, getattr(hashlib, algorithm)).hexdigest()}'
+
+    def test_that_request_is_valid(self):
+        from flask import request
         from swaglyrics_backend.issue_maker import app
-        with app.test_client() as c:
-            req = c.post(json=self.github_json)
-            req.status_code = 200
-            req.headers = self.github_headers
-            from swaglyrics_backend.utils import validate_request
-            assert validate_request(req) is not None
-
-    @patch('swaglyrics_backend.utils.is_valid_signature', return_value=True)
-    def test_that_empty_request_is_not_valid(self, signature_mock):
+        from swaglyrics_backend.utils import validate_request
+        body = b'{"action": "opened", "issue": {"number": 1347}}'
+        for header, algorithm in [('X-Hub-Signature', 'sha1'), ('X-Hub-Signature-256', 'sha256')]:
+            with app.test_request_context(method='POST', data=body, content_type='application/json',
+                                          headers={header: self.sign(body, algorithm)}):
+                assert validate_request(request) == {'action': 'opened', 'issue': {'number': 1347}}
+
+    def test_that_empty_request_is_not_valid(self):
+        from flask import request
         from swaglyrics_backend.issue_maker import app
         from swaglyrics_backend.utils import validate_request
-        with app.test_client() as c:
-            req = c.post()
+        with app.test_request_context(method='POST', headers={'X-Hub-Signature': self.sign(b'')}):
             with pytest.raises(ImATeapot):
-                validate_request(req)
+                validate_request(request)
 
     def test_that_not_valid_signature_aborts_code(self):
+        from flask import request
         from swaglyrics_backend.issue_maker import app
         from swaglyrics_backend.utils import validate_request
-        with app.test_client() as c:
-            req = c.post()
-            req.headers = self.github_headers
+        with app.test_request_context(method='POST', data=self.github_json, headers=self.github_headers):
             with pytest.raises(ImATeapot):
-                validate_request(req)
+                validate_request(request)
+
+    @patch('swaglyrics_backend.utils.webhook_verifier.max_body', 16)
+    def test_that_big_request_is_turned_away(self):
+        from flask import request
+        from werkzeug.exceptions import RequestEntityTooLarge
+        from swaglyrics_backend.issue_maker import app
+        from swaglyrics_backend.utils import validate_request
+        body = self.github_json.encode()
+        with app.test_request_context(method='POST', data=body, headers={'X-Hub-Signature': self.sign(body)}):
+            with pytest.raises(RequestEntityTooLarge):
+                validate_request(request)
+
+    @patch('swaglyrics_backend.utils.webhook_verifier.max_body', 64)
+    def test_that_big_chunked_request_is_turned_away(self):
+        from flask import request
+        from werkzeug.exceptions import RequestEntityTooLarge
+        from werkzeug.test import EnvironBuilder
+        from swaglyrics_backend.issue_maker import app
+        from swaglyrics_backend.utils import validate_request
+        small, big = b'{"action": "opened", "issue": {"number": 1347}}', self.github_json.encode()
+        for body in [small, big]:
+            environ = EnvironBuilder(method='POST', data=body, content_type='application/json',
+                                     headers={'X-Hub-Signature': self.sign(body)}).get_environ()
+            # a chunked body comes without a Content-Length, as a stream the server ends
+            del environ['CONTENT_LENGTH']
+            environ['wsgi.input_terminated'] = True
+            with app.request_context(environ):
+                assert request.content_length is None
+                if body is big:
+                    with pytest.raises(RequestEntityTooLarge):
+                        validate_request(request)
+                else:
+                    assert validate_request(request) == {'action': 'opened', 'issue': {'number': 1347}}
+                    # still readable after
+                    assert request.get_json() == {'action': 'opened', 'issue': {'number': 1347}}
+
+    def test_is_valid_signature(self):
+        from swaglyrics_backend.utils import is_valid_signature
+        assert is_valid_signature(self.sign(b'bruh', 'sha256'), b'bruh')
+        assert is_valid_signature(f'sha1={hmac.new(b"key", b"bruh", hashlib.sha1).hexdigest()}', b'bruh', 'key')
+        assert not is_valid_signature(self.sign(b'bruh'), b'bruh!')
+        assert not is_valid_signature('md5=bruh', b'bruh')
 
     @patch('swaglyrics_backend.utils.jwt.encode', return_value=b'a string of bytes')
     def test_get_jwt(self, fake_jwt_encode):
@@ -70,7 +117,7 @@ class TestUtils(TestBase):
         resp = get_jwt(69, 'use a fake private key')
         assert resp == "a string of bytes"
 
-    @patch('swaglyrics_backend.utils.requests.post')
+    @patch('swaglyrics_backend.http_client.post')
     def test_get_installation_token(self, fake_post):
         fake_post.return_value.json.return_value = {
             "token": "v1.1f699f1069f60xxx",
@@ -105,3 +152,77 @@ class TestUtils(TestBase):
         assert 'this will  ...' in logs.output[0]
         assert 'gangnam st ...' in logs.output[0]
         assert resp == "this will get truncated"
+
+    @patch('swaglyrics_backend.http_client.get')
+    def test_github_hook_allowlist_parses_blocks_once(self, fake_get):
+        from ipaddress import ip_address
+        from swaglyrics_backend.utils import GitHubHookAllowlist
+        fake_get.return_value.status_code = 200
+        fake_get.return_value.headers = {'ETag': 'W/"bruh"'}
+        fake_get.return_value.json.return_value = {'hooks': ['192.30.252.0/22', '2a0a:a440::/29']}
+        allowlist = GitHubHookAllowlist()
+
+        assert ip_address('192.30.252.13') in allowlist
+        assert ip_address('2a0a:a440::1') in allowlist
+        assert ip_address('1.2.3.4') not in allowlist
+        assert fake_get.call_count == 1
+        assert allowlist.etag == 'W/"bruh"'
+
+    @patch('swaglyrics_backend.http_client.get')
+    def test_github_hook_allowlist_sends_conditional_request(self, fake_get):
+        from ipaddress import ip_network
+        from swaglyrics_backend.utils import GitHubHookAllowlist
+        fake_get.return_value.status_code = 304
+        allowlist = GitHubHookAllowlist()
+        allowlist.networks = (ip_network('192.30.252.0/22'),)
+        allowlist.etag = 'W/"bruh"'
+        allowlist.refresh()
+
+        assert fake_get.call_args.kwargs['headers'] == {'If-None-Match': 'W/"bruh"'}
+        assert allowlist.networks == (ip_network('192.30.252.0/22'),)
+        assert allowlist.fetched_at != 0
+
+    @patch('swaglyrics_backend.http_client.get')
+    def test_github_hook_allowlist_keeps_last_known_list_on_error(self, fake_get):
+        import requests
+        from ipaddress import ip_address, ip_network
+        from swaglyrics_backend.utils import GitHubHookAllowlist
+        fake_get.side_effect = requests.ConnectionError('github is down')
+        allowlist = GitHubHookAllowlist(max_age=float('inf'))
+        allowlist.networks = (ip_network('192.30.252.0/22'),)
+        with self.assertLogs() as logs:
+            allowlist.refresh()
+
+        assert ip_address('192.30.252.13') in allowlist
+        assert "could not refresh github hook allowlist" in logs.output[0]
+
+    def test_log_decorator_does_nothing_when_level_disabled(self):
+        from swaglyrics_backend.utils import log_args
+
+        class Unprintable:
+            def __str__(self):
+                raise AssertionError("argument was formatted")
+
+        @log_args(loglevel_name="DEBUG")
+        def yet_another_fake_function_to_test_log_decorator(stuff):
+            return "called"
+
+        with self.assertLogs(level="INFO") as logs:
+            logging.getLogger().info("something else")
+            resp = yet_another_fake_function_to_test_log_decorator(Unprintable())
+        assert resp == "called"
+        assert len(logs.output) == 1
+
+    def test_log_decorator_samples_calls(self):
+        from swaglyrics_backend.utils import log_args
+
+        @log_args(sample_every=3)
+        def sampled_fake_function_to_test_log_decorator(n):
+            return n
+
+        with self.assertLogs() as logs:
+            for n in range(7):
+                sampled_fake_function_to_test_log_decorator(n)
+        assert logs.output == ['INFO:tests.test_utils:    sampled_fake_function_to_test_log_decorator(n=0)',
+                               'INFO:tests.test_utils:    sampled_fake_function_to_test_log_decorator(n=3)',
+                               'INFO:tests.test_utils:    sampled_fake_function_to_test_log_decorator(n=6)']